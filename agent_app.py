@@ -1,27 +1,42 @@
 # agent_streamlit.py
 import os
+import asyncio
+import time
 import streamlit as st
 from dotenv import load_dotenv
 from langchain_google_genai import ChatGoogleGenerativeAI
 from langchain.prompts import ChatPromptTemplate
 from langchain.agents import create_tool_calling_agent, AgentExecutor
-from langchain_core.messages import HumanMessage, AIMessage
+from langchain_core.callbacks import AsyncCallbackHandler
+from google_auth import get_service_pool
+from credential_store import use_user
+from streamlit_auth import require_google_user
+from chat_memory import ChatMemory, message_text
 from agent_tools import all_tools
+from request_router import get_request_router
 
 # Initialize environment and session state
 load_dotenv()
 
 
-def initialize_agent():
-    """Initialize the AI agent and executor (cached for performance)"""
-    llm = ChatGoogleGenerativeAI(
+@st.cache_resource(show_spinner=False)
+def get_llm():
+    """Chat model shared by every session of this server process."""
+    return ChatGoogleGenerativeAI(
         model="models/gemini-2.5-flash",
         temperature=0.2,
     )
 
+
+@st.cache_resource(show_spinner="Initializing agent...")
+def initialize_agent():
+    """Initialize the AI agent and executor once per process; it holds no per-session state."""
+    llm = get_llm()
+
     prompt = ChatPromptTemplate.from_messages([
         ("system",
          "You are a helpful assistant with calendar management tools. "
+         "Request independent tool calls together in one step so they run in parallel. "
          "**Important Rule: If event duration isn't specified, assume 1 hour.**"),
         ("placeholder", "{chat_history}"),
         ("human", "{input}"),
@@ -29,7 +44,71 @@ def initialize_agent():
     ])
 
     agent = create_tool_calling_agent(llm, all_tools, prompt)
-    return AgentExecutor(agent=agent, tools=all_tools, verbose=True)
+    # The intermediate steps go into the chat memory (with large tool outputs elided).
+    return AgentExecutor(agent=agent, tools=all_tools, verbose=True, return_intermediate_steps=True)
+
+
+@st.cache_resource(show_spinner="Connecting to Google...")
+def warm_up_google_services(user_id: str = None):
+    """
+    Builds the Google clients (of user_id, or the process-wide ones in single-user mode)
+    before the first tool call needs them. Cached per user, so it runs once for each.
+    Raises when authentication fails, so that the failure is not cached and the next rerun tries again.
+    """
+    with use_user(user_id):
+        get_service_pool().get_services()
+    return True
+
+
+class StreamlitAgentCallback(AsyncCallbackHandler):
+    """
+    Renders an agent run while it happens: tool calls appear in a status box as they
+    start and finish, and the answer is written token by token as the model streams it.
+    """
+
+    def __init__(self, container):
+        self.status = container.status("Thinking...", expanded=False)
+        self.answer = container.empty()
+        self.text = ""
+        self.started = time.perf_counter()
+        self.first_token_seconds = None
+        self._tool_started = {}
+
+    async def on_llm_new_token(self, token, **kwargs):
+        token = message_text(token)
+        if not token:
+            return
+        if self.first_token_seconds is None:
+            self.first_token_seconds = time.perf_counter() - self.started
+        self.text += token
+        self.answer.markdown(self.text + "▌")
+
+    async def on_tool_start(self, serialized, input_str, *, run_id, **kwargs):
+        name = (serialized or {}).get("name", "tool")
+        self._tool_started[run_id] = (name, time.perf_counter())
+        self.status.update(label=f"Running {name}...", state="running")
+        self.status.write(f"🔧 `{name}` started")
+
+    async def on_tool_end(self, output, *, run_id, **kwargs):
+        name, started = self._tool_started.pop(run_id, ("tool", time.perf_counter()))
+        self.status.write(f"✅ `{name}` finished in {time.perf_counter() - started:.1f}s")
+        if not self._tool_started:
+            self.status.update(label="Writing the answer...")
+
+    async def on_tool_error(self, error, *, run_id, **kwargs):
+        name, _ = self._tool_started.pop(run_id, ("tool", None))
+        self.status.write(f"❌ `{name}` failed: {error}")
+
+    async def on_agent_action(self, action, **kwargs):
+        # Text the model wrote before deciding to call a tool is not part of the answer.
+        self.text = ""
+        self.answer.empty()
+
+    def finish(self, response: str, failed: bool = False):
+        self.answer.markdown(response)
+        seconds = time.perf_counter() - self.started
+        label = f"Done in {seconds:.1f}s" if not failed else "Failed"
+        self.status.update(label=label, state="error" if failed else "complete")
 
 
 def main():
@@ -37,17 +116,29 @@ def main():
     st.title("🤖 AI Calendar Agent")
     st.caption("I can help manage your calendar. Example: 'Check doc ID 123xyz and schedule events'")
 
+    # Signs the session in when the server is shared by several users (see streamlit_auth).
+    user_id = require_google_user()
+
     # Initialize session state
     if "messages" not in st.session_state:
         st.session_state.messages = [{
             "role": "assistant",
             "content": "How can I help with your calendar today?"
         }]
+    if "memory" not in st.session_state:
+        # What the agent sees of the conversation; the messages above are only for display.
+        st.session_state.memory = ChatMemory(llm=get_llm())
 
-    # Initialize agent (cached)
-    if "agent_executor" not in st.session_state:
-        with st.spinner("Initializing agent..."):
-            st.session_state.agent_executor = initialize_agent()
+    # Shared by all sessions: built by the first one, reused by every later session and rerun.
+    agent_executor = initialize_agent()
+    try:
+        warm_up_google_services(user_id)
+    except Exception as e:
+        st.warning(f"Could not connect to Google services yet: {e}")
+
+    router = get_request_router()
+    with st.sidebar:
+        st.caption(router.summary().capitalize())
 
     # Display chat messages
     for msg in st.session_state.messages:
@@ -64,29 +155,38 @@ def main():
         with st.chat_message("user"):
             st.write(user_input)
 
-        # Prepare chat history for agent
-        chat_history = []
-        for msg in st.session_state.messages[:-1]:  # Exclude current input
-            if msg["role"] == "user":
-                chat_history.append(HumanMessage(content=msg["content"]))
-            else:
-                chat_history.append(AIMessage(content=msg["content"]))
+        memory = st.session_state.memory
 
-        # Get agent response
-        with st.chat_message("assistant"):
-            with st.spinner("Thinking..."):
-                try:
-                    result = st.session_state.agent_executor.invoke({
-                        "input": user_input,
-                        "chat_history": chat_history
-                    })
-                    response = result["output"]
-                except Exception as e:
-                    response = f"⚠️ Error: {str(e)}"
-
-            st.write(response)
+        # Requests with a fixed workflow (read a doc, extract, add to the calendar) skip the agent.
+        with st.spinner("Working..."):
+            response = router.handle(user_input)
+        if response is not None:
+            memory.add_turn(user_input, [], response)
+            with st.chat_message("assistant"):
+                st.markdown(response)
             st.session_state.messages.append({"role": "assistant", "content": response})
+            return
 
+        # Get agent response, rendering tool progress and answer tokens as they arrive
+        with st.chat_message("assistant"):
+            renderer = StreamlitAgentCallback(st.container())
+            failed = False
+            try:
+                # The async API runs the tool calls of one agent step concurrently.
+                # The tasks it starts inherit the current user set by require_google_user.
+                result = asyncio.run(agent_executor.ainvoke(
+                    {"input": user_input, "chat_history": memory.messages()},
+                    config={"callbacks": [renderer]},
+                ))
+                router.record_agent_run(time.perf_counter() - renderer.started)
+                response = message_text(result["output"])
+                memory.add_turn(user_input, result["intermediate_steps"], response)
+            except Exception as e:
+                response = f"⚠️ Error: {str(e)}"
+                failed = True
+
+            renderer.finish(response, failed)
+            st.session_state.messages.append({"role": "assistant", "content": response})
 
 if __name__ == "__main__":
     main()
\ No newline at end of file
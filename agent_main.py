@@ -1,23 +1,30 @@
 # agent_main.py
 
 import os
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
 from dotenv import load_dotenv
-from langchain_google_genai import ChatGoogleGenerativeAI
-# --- MODIFICATION: Import the correct prompt template class ---
-from langchain.prompts import ChatPromptTemplate
-# --- MODIFICATION: Import the correct agent creator ---
-from langchain.agents import create_tool_calling_agent, AgentExecutor
-from agent_tools import all_tools
 
-def main():
-    """Initializes and runs the AI Calendar Agent."""
-    load_dotenv()
-    print("🚀 Starting AI Calendar Agent...")
-    print("Tell me what to do. For example: 'Check the doc with ID 123xyz and schedule the events.'")
-    print("Type 'exit' to quit.")
+
+def build_agent():
+    """
+    Builds the agent executor and its chat memory.
+    LangChain, the Gemini SDK and the Google clients are imported here rather than at
+    the top of the module: loading them takes a couple of seconds, which main() lets
+    overlap with the user typing the first request.
+    """
+    from langchain_google_genai import ChatGoogleGenerativeAI
+    # --- MODIFICATION: Import the correct prompt template class ---
+    from langchain.prompts import ChatPromptTemplate
+    # --- MODIFICATION: Import the correct agent creator ---
+    from langchain.agents import create_tool_calling_agent, AgentExecutor
+    from agent_tools import all_tools
+    from chat_memory import ChatMemory
 
     llm = ChatGoogleGenerativeAI(
-        model="models/gemini-2.5-flash", 
+        model="models/gemini-2.5-flash",
         temperature=0.2,
     )
 
@@ -27,6 +34,8 @@ def main():
                 "system",
                 "You are a helpful assistant. You have access to a set of tools. "
                 "Use them to answer the user's question. "
+                "When several tool calls don't depend on each other (for example reading several sheet tabs), "
+                "request them together in one step so they run in parallel. "
                 "**Important Rule: If a duration for an event is not specified, assume it is one hour long.**"
             ),
             ("placeholder", "{chat_history}"),
@@ -37,22 +46,80 @@ def main():
 
     agent = create_tool_calling_agent(llm, all_tools, prompt)
 
-    agent_executor = AgentExecutor(agent=agent, tools=all_tools, verbose=True)
+    agent_executor = AgentExecutor(agent=agent, tools=all_tools, verbose=True, return_intermediate_steps=True)
+    return agent_executor, ChatMemory(llm=llm)
+
+
+def warm_up():
+    """Builds the Google clients and the extraction model before the first tool call needs them."""
+    from google_auth import get_service_pool
+    from ai_event_extractor import get_model
+    try:
+        get_service_pool().get_services()
+    except Exception as e:
+        print(f"⚠️ Could not connect to Google services yet: {e}")
+    get_model()
+
+
+def main():
+    """Initializes and runs the AI Calendar Agent."""
+    load_dotenv()
+    print("🚀 Starting AI Calendar Agent...")
+    print("Tell me what to do. For example: 'Check the doc with ID 123xyz and schedule the events.'")
+    print("Type 'exit' to quit.")
 
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="agent-startup") as startup:
+        agent_future = startup.submit(build_agent)
+        threading.Thread(target=warm_up, name="agent-warm-up", daemon=True).start()
+        asyncio.run(chat_loop(agent_future))
+
+
+async def chat_loop(agent_future):
+    """
+    Reads user requests and runs the agent through its async API, so parallel tool calls overlap.
+    Requests the fast-path router recognizes (see request_router.py) skip the agent, and
+    don't wait for it to finish loading.
+    """
+    from request_router import get_request_router
+    router = get_request_router()
+    agent_executor = memory = None
+    # Routed turns from before the agent was ready, added to its memory once it is.
+    pending_turns = []
     while True:
-        user_input = input(">> ")
+        user_input = await asyncio.to_thread(input, ">> ")
         if user_input.lower() == 'exit':
+            print(f"📊 {router.summary()}")
             print("🤖 Agent shutting down. Goodbye!")
             break
-        
-        result = agent_executor.invoke({
-            "input": user_input,
-            "chat_history": [] 
-        })
-        
+
+        answer = await asyncio.to_thread(router.handle, user_input)
+        if answer is not None:
+            if memory is not None:
+                memory.add_turn(user_input, [], answer)
+            else:
+                pending_turns.append((user_input, answer))
+        else:
+            if agent_executor is None:
+                # Usually ready by now; otherwise the first request waits for the rest of the startup.
+                agent_executor, memory = await asyncio.wrap_future(agent_future)
+                # Loaded by build_agent already; deferred like its other imports.
+                from chat_memory import message_text
+                for routed_input, routed_answer in pending_turns:
+                    memory.add_turn(routed_input, [], routed_answer)
+                pending_turns.clear()
+
+            started = time.perf_counter()
+            result = await agent_executor.ainvoke({
+                "input": user_input,
+                "chat_history": memory.messages()
+            })
+            router.record_agent_run(time.perf_counter() - started)
+            answer = message_text(result["output"])
+            memory.add_turn(user_input, result["intermediate_steps"], answer)
+
         print("\n✅ Agent's Final Answer:")
-        print(result["output"])
+        print(answer)
         print("-" * 30)
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -1,35 +1,66 @@
+import asyncio
+import contextvars
+import functools
+import json
+from concurrent.futures import ThreadPoolExecutor
 from langchain.tools import tool
 from pydantic import BaseModel, Field
 from google_auth import get_google_services
-from google_services import get_google_doc_content, get_google_sheet_content, create_calendar_event, get_google_sheet_page_names
-from ai_event_extractor import extract_events_from_text
+from google_services import get_google_sheet_page_names
+from calendar_index import upsert_calendar_event, upsert_calendar_events
+from recurrence import collapse_recurring_events
+from document_cache import read_google_doc_cached, read_google_sheet_cached, read_google_sheet_rows_cached
+from ai_event_extractor import ExtractionError, extract_events_from_text, extract_events_from_rows
+from content_store import UnknownHandleError, describe_content, get_content_store, resolve_content
 from tzlocal import get_localzone_name
+from tracing import span
+
+# Bounded pool the async tool variants run on. Parallel tool calls from one agent step
+# overlap on it; the Google clients give every thread its own HTTP transport.
+MAX_TOOL_WORKERS = 8
+_tool_executor = ThreadPoolExecutor(max_workers=MAX_TOOL_WORKERS, thread_name_prefix="agent-tool")
 
 class ExtractEventsInput(BaseModel):
-    text_content: str = Field(description="The large block of text read from a document or sheet.")
+    text_content: str = Field(description="The content handle returned by read_google_doc or read_google_sheet (e.g. 'doc:1a2b3c4d5e6f'). Plain text is accepted too, but pass the handle whenever you have one.")
     user_query: str = Field(description="The user's original request or question, used to focus the search for specific events.")
 
+class ContentExcerptInput(BaseModel):
+    content_handle: str = Field(description="The content handle returned by read_google_doc or read_google_sheet.")
+    start: int = Field(default=0, description="Character offset to start reading at.")
+    length: int = Field(default=4000, description="Number of characters to read (at most 20000).")
+
+class AddEventsInput(BaseModel):
+    events_json: str = Field(description="A JSON array of event objects with summary, start_datetime, end_datetime and description, exactly as returned by extract_events_from_document_text.")
+    calendar_id: str = Field(default="primary", description="The ID of the calendar to add the events to.")
+
 @tool(args_schema=ExtractEventsInput)
 def extract_events_from_document_text(text_content: str, user_query: str) -> str:
     """
-    Analyzes a large block of text from a document to find events that match a user's query.
-    Use this tool first to get structured event data (summary, start/end times, description) from unstructured text.
+    Analyzes the content of a document to find events that match a user's query.
+    Pass the content handle returned by read_google_doc or read_google_sheet; the text is looked up locally.
+    Use this tool to get structured event data (summary, start/end times, description) from unstructured text.
     The output of this tool is a JSON string that can be used by other tools.
     """
     print(f"🤖 Agent is using extract_events_from_document_text tool...")
     
-    events = extract_events_from_text(text_content, user_query) 
+    try:
+        text_content = resolve_content(text_content)
+    except UnknownHandleError:
+        return f"Error: unknown content handle '{text_content}'. Read the document again to get a new handle."
+    try:
+        events = extract_events_from_text(text_content, user_query)
+    except ExtractionError as e:
+        return f"Error: the events could not be extracted, the AI service failed ({e}). Do not assume there are no events."
     if not events:
         return "No matching events were found in the text."
-    
-    import json
+
     return json.dumps(events)
 
 @tool
 def add_event_to_calendar(summary: str, start_datetime: str, end_datetime: str, description: str, calendar_id: str = "primary") -> str:
     """
     Adds a single, specific event to a Google Calendar.
-    Use this tool for each individual event you need to schedule.
+    Use this tool when you need to schedule one event. To schedule several events, use add_events_to_calendar instead.
     Requires precise event details: summary, start_datetime, end_datetime (in ISO 8601 format), and an optional calendar_id.
     """
     print(f"🤖 Agent is using add_event_to_calendar tool for calendar: '{calendar_id}'")
@@ -45,23 +76,111 @@ def add_event_to_calendar(summary: str, start_datetime: str, end_datetime: str,
         "description": description
     }
     
+    result = upsert_calendar_event(services["calendar"], calendar_id, event_data, user_timezone)
+    if not result["ok"]:
+        return f"Error creating event '{summary}': {result['error']}"
+    if result["action"] == "unchanged":
+        return f"Event '{summary}' is already in calendar '{calendar_id}'; nothing to do."
+    return f"Successfully {result['action']} event '{summary}' in calendar '{calendar_id}'."
+
+@tool
+def extract_events_from_google_sheet(spreadsheet_id: str, user_query: str, sheet_name: str = None) -> str:
+    """
+    Finds events in a Google Sheet directly, without reading it first.
+    Use this instead of read_google_sheet + extract_events_from_document_text when the user wants events from a sheet.
+    When user_query asks for all events, schedule tables (date, time, title columns) are parsed instantly without
+    filtering; when it asks for specific events (e.g. only exams), and for other content, the AI picks the matching ones.
+    The output is a JSON string of events that can be passed to add_events_to_calendar.
+    """
+    print(f"🤖 Agent is using extract_events_from_google_sheet tool for sheet ID: {spreadsheet_id}")
+    services = get_google_services()
+    if not services:
+        return "Error: Could not connect to Google services."
+
+    rows = read_google_sheet_rows_cached(services, spreadsheet_id, sheet_name)
+    if rows is None:
+        return "❌ Error reading sheet content."
     try:
-        create_calendar_event(services["calendar"], calendar_id, event_data, user_timezone)
-        return f"Successfully created event '{summary}' in calendar '{calendar_id}'."
-    except Exception as e:
-        return f"Error creating event '{summary}': {e}"
+        events = extract_events_from_rows(rows, user_query)
+    except ExtractionError as e:
+        return f"Error: the events could not be extracted, the AI service failed ({e}). Do not assume there are no events."
+    if not events:
+        return "No matching events were found in the sheet."
+    return json.dumps(events)
+
+@tool(args_schema=AddEventsInput)
+def add_events_to_calendar(events_json: str, calendar_id: str = "primary") -> str:
+    """
+    Adds many events to a Google Calendar in one go.
+    Use this tool to schedule all events found by extract_events_from_document_text: pass its JSON output unchanged.
+    Returns a summary with the result for every event.
+    """
+    print(f"🤖 Agent is using add_events_to_calendar tool for calendar: '{calendar_id}'")
+    try:
+        events = json.loads(events_json)
+    except json.JSONDecodeError as e:
+        return f"Error: events_json is not valid JSON: {e}"
+    if isinstance(events, dict):
+        events = [events]
+    if not isinstance(events, list) or not all(isinstance(event, dict) for event in events):
+        return "Error: events_json must be a JSON array of event objects."
+    if not events:
+        return "No events to add."
+
+    services = get_google_services()
+    if not services:
+        return "Error: Could not connect to Google services."
+    user_timezone = get_localzone_name()
+
+    # Repeated occurrences (a weekly class) are written as one recurring event.
+    events = collapse_recurring_events(events, user_timezone)
+    results = upsert_calendar_events(services["calendar"], calendar_id, events, user_timezone)
+    counts = {action: sum(1 for r in results if r["ok"] and r["action"] == action)
+              for action in ("created", "updated", "unchanged")}
+    lines = [f"Created {counts['created']}, updated {counts['updated']} and skipped {counts['unchanged']} "
+             f"already existing of {len(results)} events in calendar '{calendar_id}'."]
+    for event, result in zip(events, results):
+        if result["ok"]:
+            repeats = " (recurring)" if event.get("recurrence") else ""
+            lines.append(f"- {result['action'].capitalize()} '{result['summary']}'{repeats}")
+        else:
+            lines.append(f"- Failed '{result['summary']}': {result['error']}")
+    return "\n".join(lines)
 
 @tool
 def read_google_doc(document_id: str) -> str:
     """
-    Reads the text content from a Google Doc given its ID. 
-    Use this to get the raw text from a document before analyzing it.
+    Reads a Google Doc given its ID and returns a content handle with a short preview.
+    Pass the handle to extract_events_from_document_text to find events, or to
+    read_content_excerpt to read a part of the text.
     """
     print(f"🤖 Agent is using read_google_doc tool for doc ID: {document_id}")
     services = get_google_services()
     if not services:
         return "Error: Could not connect to Google services."
-    return get_google_doc_content(services["docs"], document_id)
+    content = read_google_doc_cached(services, document_id)
+    if content is None:
+        return "❌ Error reading document content."
+    handle = get_content_store().put("doc", content)
+    return describe_content(handle, content, f"📄 Google Doc {document_id}")
+
+@tool(args_schema=ContentExcerptInput)
+def read_content_excerpt(content_handle: str, start: int = 0, length: int = 4000) -> str:
+    """
+    Returns part of the text behind a content handle from read_google_doc or read_google_sheet.
+    Use this when you need to read or quote the document itself; to find events, use
+    extract_events_from_document_text with the handle instead.
+    """
+    try:
+        content = resolve_content(content_handle)
+    except UnknownHandleError:
+        return f"Error: unknown content handle '{content_handle}'. Read the document again to get a new handle."
+    start = max(0, start)
+    end = start + max(0, min(length, 20000))
+    excerpt = content[start:end]
+    if not excerpt:
+        return f"No text at offset {start}; the content has {len(content)} characters."
+    return f"Characters {start}-{start + len(excerpt)} of {len(content)}:\n{excerpt}"
 
 @tool
 def list_google_sheet_names_tool(spreadsheet_id: str) -> str:
@@ -74,43 +193,44 @@ def list_google_sheet_names_tool(spreadsheet_id: str) -> str:
     Returns:
         str: Comma-separated sheet names or error message.
     """
-    try:
-        service = get_google_services()["sheets"]
-        spreadsheet = service.spreadsheets().get(spreadsheetId=spreadsheet_id).execute()
-        sheet_names = [sheet['properties']['title'] for sheet in spreadsheet.get('sheets', [])]
-        return "✅ Sheet names: " + ", ".join(sheet_names)
-    except Exception as e:
-        return f"❌ Error listing sheet names: {e}"
+    services = get_google_services()
+    if not services:
+        return "Error: Could not connect to Google services."
+    sheet_names = get_google_sheet_page_names(services["sheets"], spreadsheet_id)
+    if not sheet_names:
+        return "❌ Error listing sheet names."
+    return "✅ Sheet names: " + ", ".join(sheet_names)
 
 
 @tool
 def read_google_sheet(spreadsheet_id: str, sheet_name: str = None,
-                                  sheet_range: str = "A1:Z100") -> str:
+                                  sheet_range: str = None) -> str:
     """
-    Tool: Reads content from a specified sheet and range in a Google Sheets document.
+    Tool: Reads content from a specified sheet and range in a Google Sheets document and
+    returns a content handle with a short preview. Pass the handle to
+    extract_events_from_document_text or read_content_excerpt.
 
     Args:
         service: An authorized Sheets API service instance.
         spreadsheet_id (str): The ID of the Google Sheets document.
         sheet_name (str, optional): The name of the sheet/tab to read from.
-        sheet_range (str, optional): The A1 notation range to read. Defaults to "A1:Z100".
+        sheet_range (str, optional): The A1 notation range to read. Defaults to the whole sheet.
 
     Returns:
-        str: Text representation of the sheet content or an error message.
+        str: Content handle, size and preview of the sheet content, or an error message.
     """
-    try:
-        service = get_google_services()["sheets"]
-        full_range = f"{sheet_name}!{sheet_range}" if sheet_name else sheet_range
-        result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id, range=full_range
-        ).execute()
-        values = result.get('values', [])
-        if not values:
-            return "⚠️ No data found in the specified range."
-
-        return "📄 Sheet Content:\n" + "\n".join([" ".join(row) for row in values])
-    except Exception as e:
-        return f"❌ Error reading sheet content: {e}"
+    services = get_google_services()
+    if not services:
+        return "Error: Could not connect to Google services."
+
+    content = read_google_sheet_cached(services, spreadsheet_id, sheet_name, sheet_range)
+    if content is None:
+        return "❌ Error reading sheet content."
+    if not content.strip():
+        return "⚠️ No data found in the specified range."
+
+    handle = get_content_store().put("sheet", content)
+    return describe_content(handle, content, f"📄 Sheet content of {spreadsheet_id}")
 
 
 @tool
@@ -132,7 +252,7 @@ def create_new_google_calendar(calendar_name: str) -> str:
     }
     
     try:
-        created_calendar = services["calendar"].calendars().insert(body=calendar_body).execute()
+        created_calendar = services["calendar"].calendars().insert(body=calendar_body, fields="id").execute()
         calendar_id = created_calendar['id']
         return f"Successfully created new calendar '{calendar_name}' with ID: {calendar_id}"
     except Exception as e:
@@ -142,7 +262,40 @@ all_tools = [
     read_google_doc,
     read_google_sheet,
     list_google_sheet_names_tool,
+    read_content_excerpt,
     extract_events_from_document_text,
+    extract_events_from_google_sheet,
     add_event_to_calendar,
+    add_events_to_calendar,
     create_new_google_calendar,
-]
\ No newline at end of file
+]
+
+
+def _traced_tool(name: str, func):
+    """Wraps a tool function so that each call is recorded as a tracing span with its payload sizes."""
+    @functools.wraps(func)
+    def run(*args, **kwargs):
+        with span(f"tool.{name}") as current:
+            result = func(*args, **kwargs)
+            if current.recording:
+                current.set(input_chars=sum(len(str(value)) for value in (*args, *kwargs.values())),
+                            output_chars=len(str(result)))
+            return result
+    return run
+
+
+def _make_async(func):
+    """Wraps a blocking tool function into a coroutine that runs it on the tool pool."""
+    @functools.wraps(func)
+    async def run(*args, **kwargs):
+        loop = asyncio.get_running_loop()
+        # Carry the context (e.g. the signed-in user, see credential_store) over to the pool thread.
+        context = contextvars.copy_context()
+        return await loop.run_in_executor(_tool_executor, functools.partial(context.run, func, *args, **kwargs))
+    return run
+
+# Give every tool a native ainvoke path, so AgentExecutor.ainvoke runs the tool calls
+# of one step concurrently instead of one after another.
+for agent_tool in all_tools:
+    agent_tool.func = _traced_tool(agent_tool.name, agent_tool.func)
+    agent_tool.coroutine = _make_async(agent_tool.func)
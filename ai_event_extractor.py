@@ -1,30 +1,116 @@
 import os
-import json
-import google.generativeai as genai
+import queue
+import re
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import chain
 from dotenv import load_dotenv
 from datetime import date
+from extraction_cache import ExtractionCache, make_cache_key
+from date_prefilter import GAP_MARKER, prefilter_text, has_date_or_time
+from doc_flattener import format_table_rows
+from sheet_schedule_parser import ScheduleTableParser
+from json_stream import JsonArrayStreamParser
+from tracing import span, count
+from rate_limiter import MAX_RETRIES, backoff_after_error, get_rate_limiter
 
 load_dotenv()
 
-try:
-    genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
-    model = genai.GenerativeModel('models/gemini-2.5-flash')
-    print("✅ Gemini model initialized successfully.")
-except Exception as e:
-    print(f"❌ Error configuring Gemini API: {e}")
-    model = None
+MODEL_NAME = 'models/gemini-2.5-flash'
+# Bump whenever _build_prompt changes so that cached results of the old prompt are not reused.
+PROMPT_VERSION = "1"
 
+# Texts longer than CHUNK_MAX_CHARS are split on paragraph/row boundaries into chunks
+# that are analyzed concurrently. Consecutive chunks share up to CHUNK_OVERLAP_CHARS
+# of text so that events sitting on a boundary are seen whole by at least one chunk.
+CHUNK_MAX_CHARS = 12000
+CHUNK_OVERLAP_CHARS = 1000
+MAX_EXTRACTION_WORKERS = 4
 
-def extract_events_from_text(text: str, user_query: str) -> list:
+# Before prompting, drop the lines that contain no date or time expression, keeping
+# PREFILTER_CONTEXT_LINES lines of context around the ones that do.
+PREFILTER_ENABLED = True
+PREFILTER_CONTEXT_LINES = 2
+
+DEFAULT_USER_QUERY = "all events"
+
+# Words of a request that don't narrow down which events it wants ("add all events from
+# sheet <id> to my calendar"). A query with any other word is treated as a filter.
+_UNFILTERED_QUERY_WORDS = frozenset("""
+    a add all an and any at calendar calendars copy create data date dates doc docs document documents each
+    entries event events every extract find for from get google i id ids import in info information into it link
+    list me my of on our please put read row rows save schedule sheet sheets show spreadsheet spreadsheets sync
+    tab table tabs take the them these this to url want with you your
+""".split())
+_QUERY_NOISE_RE = re.compile(r"https?://\S+|[A-Za-z0-9_-]{20,}")
+
+# Gemini's JSON mode constrained to this schema always answers with a bare array of
+# event objects (no markdown fences, no prose), which lets the response be parsed
+# incrementally while it streams.
+EVENT_LIST_SCHEMA = {
+    "type": "array",
+    "items": {
+        "type": "object",
+        "properties": {
+            "summary": {"type": "string"},
+            "start_datetime": {"type": "string"},
+            "end_datetime": {"type": "string"},
+            "description": {"type": "string"},
+        },
+        "required": ["summary", "start_datetime", "end_datetime"],
+    },
+}
+GENERATION_CONFIG = {"response_mime_type": "application/json", "response_schema": EVENT_LIST_SCHEMA}
+
+_model = None
+_model_lock = threading.Lock()
+
+_extraction_cache = None
+_extraction_cache_lock = threading.Lock()
+
+
+class ExtractionError(Exception):
+    """Raised when events could not be extracted because Gemini failed, e.g. its quota stayed exhausted."""
+
+
+def get_model():
     """
-    Uses Google's Gemini model to extract event details from a block of text.
+    Returns the Gemini model, or None when it can't be configured.
+    The SDK takes a good part of a second to import, so it is only imported (and the
+    model built) when the first extraction needs it, not when this module is imported.
     """
-    if not model:
-        print("❌ Gemini model is not available. Cannot extract events.")
-        return []
+    global _model
+    with _model_lock:
+        if _model is None:
+            try:
+                import google.generativeai as genai
+                genai.configure(api_key=os.getenv("GOOGLE_API_KEY"))
+                _model = genai.GenerativeModel(MODEL_NAME)
+                print("✅ Gemini model initialized successfully.")
+            except Exception as e:
+                print(f"❌ Error configuring Gemini API: {e}")
+        return _model
 
-    today_str = date.today().isoformat()
-    prompt = f"""
+
+def set_model(new_model):
+    """Replaces the Gemini model used for extraction (anything with a generate_content method)."""
+    global _model
+    with _model_lock:
+        _model = new_model
+
+
+def get_extraction_cache() -> ExtractionCache:
+    """Returns the on-disk cache of extraction results, creating it on first use."""
+    global _extraction_cache
+    with _extraction_cache_lock:
+        if _extraction_cache is None:
+            _extraction_cache = ExtractionCache()
+        return _extraction_cache
+
+
+def _build_prompt(text: str, user_query: str, today_str: str) -> str:
+    return f"""
     For context, the current date is {today_str}.
     Analyze the following text to find events that match the user's request: "{user_query}".
 
@@ -45,24 +131,407 @@ def extract_events_from_text(text: str, user_query: str) -> list:
     ---
     """
 
+
+def _record_usage(current, response, response_chars: int):
+    """Adds the token counts from the response's usage metadata to the span and the counters."""
+    usage = getattr(response, "usage_metadata", None)
+    tokens = {
+        "prompt": getattr(usage, "prompt_token_count", 0) or 0,
+        "output": getattr(usage, "candidates_token_count", 0) or 0,
+        "total": getattr(usage, "total_token_count", 0) or 0,
+    }
+    current.set(response_chars=response_chars, **{f"{kind}_tokens": n for kind, n in tokens.items()})
+    count("gemini_calls", model=MODEL_NAME)
+    for kind, n in tokens.items():
+        count("gemini_tokens", n, model=MODEL_NAME, kind=kind)
+
+
+def _chunk_text(chunk) -> str:
+    # A chunk without text (e.g. the final one carrying only the finish reason) raises on .text.
     try:
-        response = model.generate_content(prompt)
-        response_content = response.text
+        return chunk.text
+    except ValueError:
+        return ""
+
+
+def _stream_events(text: str, user_query: str, today_str: str):
+    """
+    Sends a single block of text to Gemini and yields each event as soon as the streamed
+    response contains it. Runs within the shared Gemini rate limit and retries throttling
+    and server errors; events already yielded before a retry are not yielded again.
+    Returns (as the generator's return value) whether the response was a complete, valid
+    array. Raises ExtractionError when the API call keeps failing.
+    """
+    prompt = _build_prompt(text, user_query, today_str)
+    limiter = get_rate_limiter("gemini")
+    seen = set()
+
+    for attempt in range(MAX_RETRIES + 1):
+        parser = JsonArrayStreamParser()
+        try:
+            with span("gemini.generate_content", model=MODEL_NAME, prompt_chars=len(prompt), stream=True) as current:
+                limiter.acquire()
+                started = time.perf_counter()
+                response = get_model().generate_content(prompt, generation_config=GENERATION_CONFIG, stream=True)
+                for chunk in response:
+                    for event in parser.feed(_chunk_text(chunk)):
+                        if current.recording and parser.parsed == 1:
+                            current.set(first_event_seconds=time.perf_counter() - started)
+                        key = _event_key(event)
+                        if key not in seen:
+                            seen.add(key)
+                            yield event
+                limiter.on_success()
+                if current.recording:
+                    _record_usage(current, response, parser.chars)
+        except ExtractionError:
+            raise
+        except Exception as e:
+            try:
+                delay = backoff_after_error("gemini", e, attempt)
+            except Exception:
+                print(f"❌ An error occurred with the Gemini API: {e}")
+                raise ExtractionError(f"Gemini API error: {e}") from e
+            time.sleep(delay)
+            continue
+
         print("✅ Gemini analysis complete.")
+        if not parser.complete:
+            print(f"⚠️ Gemini returned incomplete or invalid JSON; kept the {parser.parsed} valid event(s) "
+                  f"and skipped {parser.skipped}.")
+        return parser.complete
+    return False
+
+
+def _iter_chunk_events(text: str, user_query: str, force_refresh: bool = False):
+    """Yields the events in a single block of text, answering from the cache when possible."""
+    today_str = date.today().isoformat()
+    cache = get_extraction_cache()
+    key = make_cache_key(text, user_query, MODEL_NAME, PROMPT_VERSION, today_str)
+
+    if not force_refresh:
+        cached_events = cache.get(key)
+        if cached_events is not None:
+            print("⚡ Using cached Gemini analysis.")
+            yield from cached_events
+            return
+
+    events = []
+    stream = _stream_events(text, user_query, today_str)
+    while True:
+        try:
+            event = next(stream)
+        except StopIteration as stop:
+            complete = stop.value
+            break
+        events.append(event)
+        yield event
+    # A partial answer is still used, but only a complete one is worth reusing.
+    if complete:
+        cache.put(key, events)
+
+
+def _extract_chunk(text: str, user_query: str, force_refresh: bool = False) -> list:
+    """Returns the events in a single block of text, answering from the cache when possible."""
+    return list(_iter_chunk_events(text, user_query, force_refresh))
+
+
+def split_text_into_chunks(text: str, max_chars: int = CHUNK_MAX_CHARS,
+                           overlap_chars: int = CHUNK_OVERLAP_CHARS) -> list:
+    """
+    Splits text into chunks of at most max_chars characters.
+    Chunks end on line boundaries (paragraphs of a doc, rows of a sheet); a line longer
+    than max_chars is cut into pieces. Each chunk starts with the trailing lines of the
+    previous chunk, up to overlap_chars characters.
+    """
+    units = []
+    for line in text.splitlines(keepends=True):
+        for start in range(0, len(line), max_chars):
+            units.append(line[start:start + max_chars])
+
+    chunks = []
+    current = []
+    size = 0
+    for unit in units:
+        if current and size + len(unit) > max_chars:
+            chunks.append("".join(current))
+
+            overlap = []
+            overlap_size = 0
+            for previous in reversed(current):
+                if overlap_size + len(previous) > overlap_chars:
+                    break
+                overlap.insert(0, previous)
+                overlap_size += len(previous)
+            while overlap and overlap_size + len(unit) > max_chars:
+                overlap_size -= len(overlap.pop(0))
+            current, size = overlap, overlap_size
+
+        current.append(unit)
+        size += len(unit)
+
+    if current:
+        chunks.append("".join(current))
+    return chunks
+
+
+def _event_key(event: dict) -> tuple:
+    summary = " ".join(str(event.get('summary') or '').split()).casefold()
+    start = str(event.get('start_datetime') or '').strip()
+    return summary, start
+
 
-        if "```json" in response_content:
-            cleaned_response = response_content.split("```json")[1].split("```")[0].strip()
-        elif "```" in response_content:
-            cleaned_response = response_content.split("```")[1].strip()
+def merge_event_lists(event_lists: list) -> list:
+    """Concatenates per-chunk results, dropping events already seen in an earlier chunk."""
+    merged = []
+    seen = set()
+    for events in event_lists:
+        for event in events or []:
+            if not isinstance(event, dict):
+                continue
+            key = _event_key(event)
+            if key in seen:
+                continue
+            seen.add(key)
+            merged.append(event)
+    return merged
+
+
+def extract_events_chunked(text: str, user_query: str, max_chars: int = CHUNK_MAX_CHARS,
+                           overlap_chars: int = CHUNK_OVERLAP_CHARS,
+                           max_workers: int = MAX_EXTRACTION_WORKERS, force_refresh: bool = False) -> list:
+    """
+    Extracts events from text of any length.
+    Long texts are split with split_text_into_chunks, the chunks are sent to Gemini on a
+    bounded thread pool and the results are merged without the duplicates produced by
+    the overlapping parts.
+    """
+    chunks = split_text_into_chunks(text, max_chars, overlap_chars)
+    if len(chunks) <= 1:
+        return _extract_chunk(text, user_query, force_refresh)
+
+    print(f"✂️ Split text into {len(chunks)} chunks for concurrent analysis.")
+    with ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks)))) as executor:
+        results = list(executor.map(lambda chunk: _extract_chunk(chunk, user_query, force_refresh), chunks))
+    return merge_event_lists(results)
+
+
+def extract_events_from_stream(text_parts, user_query: str = DEFAULT_USER_QUERY,
+                               max_chars: int = CHUNK_MAX_CHARS, overlap_chars: int = CHUNK_OVERLAP_CHARS,
+                               max_workers: int = MAX_EXTRACTION_WORKERS, force_refresh: bool = False,
+                               prefilter: bool = PREFILTER_ENABLED) -> list:
+    """
+    Extracts events from text that arrives in newline-terminated parts, such as the row
+    windows yielded by google_services.iter_google_sheet_text.
+    Each chunk is sent to Gemini as soon as it is complete, so analysis of the beginning
+    runs while later parts are still downloading. Only the unfinished chunk is buffered.
+    With prefilter, each part is passed through date_prefilter.prefilter_text first, and
+    parts without any date or time are left out. Only when the whole input has none is
+    it sent in full; until the first date shows up, the parts before it are held back.
+    """
+    if get_model() is None:
+        raise ExtractionError("Gemini model is not available. Check GOOGLE_API_KEY.")
+
+    futures = []
+    buffer = ""
+    original_chars = kept_chars = 0
+    # Parts read before the first date or time, and whether one was seen yet.
+    held = []
+    found_candidates = False
+    with ThreadPoolExecutor(max_workers=max(1, max_workers)) as executor:
+
+        def add(text):
+            nonlocal buffer, kept_chars
+            if text == GAP_MARKER and buffer.endswith(GAP_MARKER):
+                return
+            kept_chars += len(text)
+            buffer += text
+            if len(buffer) <= max_chars:
+                return
+            chunks = split_text_into_chunks(buffer, max_chars, overlap_chars)
+            for chunk in chunks[:-1]:
+                futures.append(executor.submit(_extract_chunk, chunk, user_query, force_refresh))
+            buffer = chunks[-1]
+
+        for part in text_parts:
+            if not prefilter:
+                add(part)
+                continue
+            first = not original_chars
+            original_chars += len(part)
+            # Only the first part carries the title or table header line.
+            result = prefilter_text(part, PREFILTER_CONTEXT_LINES, head_lines=1 if first else 0)
+            if result.used_fallback:
+                # No date or time in this part: drop it, unless none turns up anywhere.
+                if found_candidates:
+                    add(GAP_MARKER)
+                else:
+                    held.append(part)
+                continue
+            if not found_candidates:
+                found_candidates = True
+                if held:
+                    add(held[0].splitlines(keepends=True)[0] if held[0].strip() else "")
+                    add(GAP_MARKER)
+                held = []
+            add(result.text)
+        for part in held:
+            # The whole input is free of dates and times: fall back to sending all of it.
+            add(part)
+        if buffer.strip():
+            futures.append(executor.submit(_extract_chunk, buffer, user_query, force_refresh))
+
+        if prefilter and original_chars:
+            print(f"🔎 Date pre-filter kept {kept_chars}/{original_chars} chars ({1 - kept_chars / original_chars:.0%} smaller).")
+        if len(futures) > 1:
+            print(f"✂️ Streamed text into {len(futures)} chunks for concurrent analysis.")
+        results = [future.result() for future in futures]
+    return merge_event_lists(results)
+
+
+def extract_events_from_text(text: str, user_query: str = DEFAULT_USER_QUERY, force_refresh: bool = False,
+                             prefilter: bool = PREFILTER_ENABLED) -> list:
+    """
+    Uses Google's Gemini model to extract event details from a block of text.
+    With prefilter, only the lines mentioning dates or times (plus some context) are sent.
+    Long texts are analyzed in concurrent chunks (see extract_events_chunked).
+    Results are cached on disk; pass force_refresh=True to bypass the cache.
+    Raises ExtractionError when Gemini can't be used, so a failure is never mistaken for "no events".
+    """
+    if get_model() is None:
+        raise ExtractionError("Gemini model is not available. Check GOOGLE_API_KEY.")
+
+    if prefilter:
+        text = _prefilter(text)
+    return extract_events_chunked(text, user_query, force_refresh=force_refresh)
+
+
+def _prefilter(text: str) -> str:
+    result = prefilter_text(text, PREFILTER_CONTEXT_LINES)
+    if result.used_fallback:
+        print("🔎 Date pre-filter found no dates or times; sending the full text.")
+    else:
+        print(f"🔎 Date pre-filter kept {result.kept_chars}/{result.original_chars} chars "
+              f"({result.reduction:.0%} smaller).")
+    return result.text
+
+
+def iter_events_from_text(text: str, user_query: str = DEFAULT_USER_QUERY, force_refresh: bool = False,
+                          prefilter: bool = PREFILTER_ENABLED, max_workers: int = MAX_EXTRACTION_WORKERS):
+    """
+    Like extract_events_from_text, but yields each event as soon as Gemini has written it,
+    so callers can show or store the first events while the rest are still generated.
+    The chunks of a long text are analyzed concurrently and their events are yielded in
+    the order they arrive, without the duplicates of the overlapping parts.
+    Raises ExtractionError when Gemini can't be used.
+    """
+    if get_model() is None:
+        raise ExtractionError("Gemini model is not available. Check GOOGLE_API_KEY.")
+
+    if prefilter:
+        text = _prefilter(text)
+    chunks = split_text_into_chunks(text)
+    seen = set()
+    if len(chunks) <= 1:
+        for event in _iter_chunk_events(text, user_query, force_refresh):
+            key = _event_key(event)
+            if key not in seen:
+                seen.add(key)
+                yield event
+        return
+
+    print(f"✂️ Split text into {len(chunks)} chunks for concurrent analysis.")
+    results = queue.Queue()
+    stopped = threading.Event()
+
+    def produce(chunk: str):
+        try:
+            for event in _iter_chunk_events(chunk, user_query, force_refresh):
+                if stopped.is_set():
+                    break
+                results.put(("event", event))
+        except Exception as e:
+            results.put(("error", e))
         else:
-            cleaned_response = response_content.strip()
-        
-        parsed_events = json.loads(cleaned_response)
-        return parsed_events
+            results.put(("done", None))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, min(max_workers, len(chunks))))
+    try:
+        for chunk in chunks:
+            executor.submit(produce, chunk)
+        pending = len(chunks)
+        while pending:
+            kind, value = results.get()
+            if kind == "event":
+                key = _event_key(value)
+                if key not in seen:
+                    seen.add(key)
+                    yield value
+            elif kind == "error":
+                raise value
+            else:
+                pending -= 1
+    finally:
+        # Also reached when the caller stops iterating early: don't start the remaining chunks.
+        stopped.set()
+        executor.shutdown(wait=False, cancel_futures=True)
+
+
+def extraction_cache_stats() -> dict:
+    """Returns the hit and miss counters of the extraction cache."""
+    return get_extraction_cache().stats()
+
 
-    except json.JSONDecodeError:
-        print(f"❌ Error: Gemini returned invalid JSON. Response:\n{response_content}")
+def query_selects_all(user_query: str) -> bool:
+    """True when the query asks for every event of a source rather than some of them."""
+    words = re.findall(r"[a-z]+|\d+", _QUERY_NOISE_RE.sub(" ", user_query or "").lower())
+    return all(word in _UNFILTERED_QUERY_WORDS for word in words)
+
+
+def extract_events_from_row_windows(row_windows, user_query: str = DEFAULT_USER_QUERY,
+                                    force_refresh: bool = False) -> list:
+    """
+    Extracts events from sheet rows arriving in windows (see
+    google_services.iter_google_sheet_row_windows).
+
+    When the first window looks like a regular schedule table, every row is parsed
+    locally by sheet_schedule_parser, and only the rows it can't map that still
+    mention a date or time are sent to Gemini. The local parser takes every row, so it
+    is only used when user_query asks for all events (see query_selects_all); sheets
+    queried for some of their events, and other sheets, go to Gemini as text.
+    """
+    windows = iter(row_windows)
+    first = next(windows, None)
+    while first is not None and not first:
+        first = next(windows, None)
+    if first is None:
         return []
-    except Exception as e:
-        print(f"❌ An error occurred with the Gemini API: {e}")
-        return []
\ No newline at end of file
+
+    parser = ScheduleTableParser.detect(first)
+    if parser is None or not query_selects_all(user_query):
+        if parser is None:
+            print("🤖 Sheet is not a regular schedule table; analyzing it with Gemini.")
+        else:
+            print("🤖 The request asks for some of the events; analyzing the sheet with Gemini.")
+        texts = (format_table_rows(rows) for rows in chain([first], windows) if rows)
+        return extract_events_from_stream(texts, user_query, force_refresh=force_refresh)
+
+    events = []
+    leftovers = []
+    for index, rows in enumerate(chain([first], windows)):
+        parsed, unmapped = parser.parse_rows(rows[parser.data_start_row:] if index == 0 else rows)
+        events.extend(parsed)
+        leftovers.extend(row for row in unmapped if has_date_or_time(" ".join(str(cell) for cell in row)))
+    print(f"⚡ Parsed {len(events)} event(s) from the schedule table without Gemini "
+          f"(columns: {', '.join(sorted(parser.columns))}).")
+
+    if leftovers:
+        print(f"🤖 Sending {len(leftovers)} row(s) the table parser couldn't map to Gemini.")
+        header = [parser.headers] if parser.headers else []
+        events.extend(extract_events_from_text(format_table_rows(header + leftovers), user_query, force_refresh))
+    return merge_event_lists([events])
+
+
+def extract_events_from_rows(rows: list, user_query: str = DEFAULT_USER_QUERY, force_refresh: bool = False) -> list:
+    """Extracts events from a list of sheet rows (see extract_events_from_row_windows)."""
+    return extract_events_from_row_windows([rows], user_query, force_refresh)
@@ -1,8 +1,45 @@
 import streamlit as st
 from tzlocal import get_localzone_name
-from google_auth import get_google_services
-from google_services import get_google_doc_content, get_google_sheet_content, create_calendar_event
-from ai_event_extractor import extract_events_from_text
+from google_auth import get_service_pool
+from credential_store import use_user
+from streamlit_auth import require_google_user
+from document_cache import read_google_doc_cached, read_google_sheet_rows_cached
+from doc_flattener import format_table_rows
+from calendar_index import upsert_calendar_event
+from ai_event_extractor import ExtractionError, iter_events_from_text, extract_events_from_rows
+
+# How long a fetched document is reused before its revision is checked again.
+CONTENT_TTL_SECONDS = 60
+
+
+def load_google_services():
+    """
+    Google clients of the signed-in user (or of token.json in single-user mode).
+    The pools behind them are kept process-wide by google_auth, so this is cheap after the first run.
+    Raises when authentication fails.
+    """
+    return get_service_pool().get_services()
+
+
+# user_id is part of the cache key, so that one user's documents are never served to another.
+@st.cache_data(ttl=CONTENT_TTL_SECONDS, show_spinner=False)
+def fetch_doc_text(doc_id: str, user_id: str = None) -> str:
+    with use_user(user_id):
+        text = read_google_doc_cached(load_google_services(), doc_id)
+    if text is None:
+        # Raising keeps the failure out of the cache.
+        raise LookupError(f"Could not read Google Doc {doc_id}.")
+    return text
+
+
+@st.cache_data(ttl=CONTENT_TTL_SECONDS, show_spinner=False)
+def fetch_sheet_rows(sheet_id: str, user_id: str = None) -> list:
+    with use_user(user_id):
+        rows = read_google_sheet_rows_cached(load_google_services(), sheet_id)
+    if rows is None:
+        raise LookupError(f"Could not read Google Sheet {sheet_id}.")
+    return rows
+
 
 # Set page title and icon
 st.set_page_config(page_title="AI Event Scheduler", page_icon="🚀")
@@ -13,6 +50,9 @@ st.markdown("""
 Extract events from Google Docs/Sheets and add them to Google Calendar.
 """)
 
+# Signs the session in when the server is shared by several users (see streamlit_auth).
+user_id = require_google_user()
+
 # Initialize session state
 if 'events' not in st.session_state:
     st.session_state.events = []
@@ -25,6 +65,14 @@ try:
 except Exception:
     user_timezone = "UTC"
 
+# Loaded on every run (not only when processing), so the Create buttons below have the clients on reruns.
+try:
+    with st.spinner("Authenticating with Google..."):
+        services = load_google_services()
+except Exception as e:
+    st.error(f"Failed to authenticate with Google. Please check your credentials. ({e})")
+    st.stop()
+
 # Sidebar for inputs
 with st.sidebar:
     st.header("Configuration")
@@ -53,18 +101,18 @@ if process_btn:
         st.warning("Please provide a valid ID")
         st.stop()
 
-    with st.spinner("Authenticating with Google..."):
-        services = get_google_services()
-        if not services:
-            st.error("Failed to authenticate with Google. Please check your credentials.")
-            st.stop()
-
     with st.spinner(f"Fetching content from {input_type}..."):
         text_content = None
-        if input_type == "Google Doc":
-            text_content = get_google_doc_content(services["docs"], doc_id)
-        else:
-            text_content = get_google_sheet_content(services["sheets"], sheet_id)
+        sheet_rows = None
+        try:
+            if input_type == "Google Doc":
+                text_content = fetch_doc_text(doc_id, user_id)
+            else:
+                sheet_rows = fetch_sheet_rows(sheet_id, user_id)
+                text_content = format_table_rows(sheet_rows) if sheet_rows else None
+        except LookupError as e:
+            st.error(str(e))
+            st.stop()
 
         if not text_content or not text_content.strip():
             st.error("No content found in the specified document/sheet.")
@@ -75,7 +123,23 @@ if process_btn:
         st.code(text_content.strip())
 
     with st.spinner("AI is analyzing content for events..."):
-        extracted_events = extract_events_from_text(text_content)
+        try:
+            if sheet_rows:
+                # Regular schedule tables are parsed locally; only the rest goes to Gemini.
+                extracted_events = extract_events_from_rows(sheet_rows)
+            else:
+                # Show each event as soon as Gemini has written it; the full list with
+                # its buttons replaces this preview once the analysis is done.
+                extracted_events = []
+                preview = st.empty()
+                found = preview.container()
+                for event in iter_events_from_text(text_content):
+                    extracted_events.append(event)
+                    found.markdown(f"- **{event.get('summary')}** `{event.get('start_datetime')}`")
+                preview.empty()
+        except ExtractionError as e:
+            st.error(f"Could not analyze the content, please try again later: {e}")
+            st.stop()
         st.session_state.events = extracted_events or []
         st.session_state.processed = True
 
@@ -101,13 +165,18 @@ if st.session_state.processed:
                     if st.button("Create Event", key=event_key):
                         with st.spinner(f"Creating '{event.get('summary')}'..."):
                             try:
-                                create_calendar_event(
+                                result = upsert_calendar_event(
                                     services["calendar"],
                                     calendar_id,
                                     event,
                                     user_timezone
                                 )
-                                st.success(f"Event '{event.get('summary')}' created successfully!")
+                                if not result['ok']:
+                                    st.error(f"Failed to create event: {result['error']}")
+                                elif result['action'] == 'unchanged':
+                                    st.info(f"Event '{event.get('summary')}' is already in your calendar.")
+                                else:
+                                    st.success(f"Event '{event.get('summary')}' {result['action']} successfully!")
                             except Exception as e:
                                 st.error(f"Failed to create event: {str(e)}")
 
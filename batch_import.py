@@ -0,0 +1,284 @@
+"""
+Headless, resumable import of many Google Docs and Sheets into Google Calendar.
+
+The manifest is a JSON array with one object per source:
+
+    [
+        {"doc_id": "1AbC...", "calendar_id": "team@group.calendar.google.com"},
+        {"sheet_id": "1XyZ...", "sheet_name": "Schedule", "user_query": "all matches"},
+        {"doc_id": "1DeF..."}
+    ]
+
+calendar_id defaults to the --calendar-id given to main.py, sheet_name to the first
+sheet and user_query to "all events". Sources are processed concurrently by a bounded
+worker pool, and one source's events are written to the calendar while others are still
+being read and analyzed. Repeated occurrences of an event (a weekly class) are written
+as one recurring event. The outcome of every stage is written to a checkpoint file, so a run
+that crashed resumes where it stopped: finished sources are skipped and sources whose
+events were already extracted go straight to the calendar stage.
+"""
+import json
+import os
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import dataclass
+from tzlocal import get_localzone_name
+from google_auth import get_google_services
+from document_cache import read_google_doc_cached, read_google_sheet_rows_cached
+from calendar_index import PipelinedUpsert
+from recurrence import collapse_recurring_events
+from ai_event_extractor import DEFAULT_USER_QUERY, iter_events_from_text, extract_events_from_rows
+
+DEFAULT_WORKERS = 4
+STAGES = ("fetch", "extract", "calendar")
+
+
+@dataclass
+class ManifestItem:
+    """One document or sheet to import, and the calendar its events go to."""
+    kind: str
+    source_id: str
+    calendar_id: str
+    sheet_name: str = None
+    user_query: str = DEFAULT_USER_QUERY
+
+    @property
+    def key(self) -> str:
+        sheet = f"#{self.sheet_name}" if self.sheet_name else ""
+        return f"{self.kind}:{self.source_id}{sheet}->{self.calendar_id}"
+
+
+def load_manifest(path: str, default_calendar_id: str = "primary") -> list:
+    """Reads a manifest file into ManifestItems. Raises ValueError on malformed entries."""
+    with open(path, "r", encoding="utf-8") as f:
+        entries = json.load(f)
+    if not isinstance(entries, list):
+        raise ValueError("The manifest must be a JSON array of objects.")
+
+    items = []
+    for number, entry in enumerate(entries, 1):
+        if not isinstance(entry, dict) or ("doc_id" in entry) == ("sheet_id" in entry):
+            raise ValueError(f"Manifest entry {number} must have exactly one of 'doc_id' or 'sheet_id'.")
+        kind = "doc" if "doc_id" in entry else "sheet"
+        items.append(ManifestItem(
+            kind=kind,
+            source_id=entry[f"{kind}_id"],
+            calendar_id=entry.get("calendar_id") or default_calendar_id,
+            sheet_name=entry.get("sheet_name"),
+            user_query=entry.get("user_query") or DEFAULT_USER_QUERY,
+        ))
+    return items
+
+
+class Checkpoint:
+    """
+    Progress of a batch run, persisted as JSON after every change.
+
+    Each manifest item key maps to a dict with a 'status' ('extracted', 'done' or
+    'failed'), the extracted 'events', the per-stage 'seconds' and, once written,
+    the calendar 'actions' counts. A source stays 'extracted' until every one of its
+    events was written, so that the next run retries the ones that failed.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self.entries = {}
+        if os.path.exists(path):
+            with open(path, "r", encoding="utf-8") as f:
+                self.entries = json.load(f)
+
+    def get(self, key: str) -> dict:
+        with self._lock:
+            return dict(self.entries.get(key, {}))
+
+    def update(self, key: str, **fields):
+        with self._lock:
+            self.entries.setdefault(key, {}).update(fields)
+            temp_path = f"{self.path}.tmp"
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(self.entries, f, ensure_ascii=False, indent=1)
+            os.replace(temp_path, self.path)
+
+
+class _RunStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.stage_seconds = defaultdict(float)
+        self.stage_runs = defaultdict(int)
+        self.counts = defaultdict(int)
+
+    def add_stage(self, stage: str, seconds: float):
+        with self._lock:
+            self.stage_seconds[stage] += seconds
+            self.stage_runs[stage] += 1
+
+    def add(self, name: str, value: int = 1):
+        with self._lock:
+            self.counts[name] += value
+
+
+def _fetch(item: ManifestItem, services: dict, stats: _RunStats):
+    """Returns (content, seconds); content is the doc text or the sheet rows, None when unreadable."""
+    started = time.perf_counter()
+    if item.kind == "doc":
+        content = read_google_doc_cached(services, item.source_id)
+    else:
+        content = read_google_sheet_rows_cached(services, item.source_id, item.sheet_name)
+    seconds = time.perf_counter() - started
+    stats.add_stage("fetch", seconds)
+    return content, seconds
+
+
+def _write(events: list, writer: PipelinedUpsert, timezone: str):
+    for event in collapse_recurring_events(events, timezone):
+        writer.add(event)
+
+
+def _extract_and_write(item: ManifestItem, content, writer: PipelinedUpsert, timezone: str,
+                       stats: _RunStats) -> tuple:
+    """
+    Extracts the events of the content and hands them to writer, with repeated
+    occurrences collapsed into recurring events. Collapsing needs all of a source's
+    events, so they are written once the extraction finished; for sources that list
+    a recurring event, that saves far more calendar requests than streaming would
+    save time. Returns (events, seconds).
+    """
+    started = time.perf_counter()
+    if item.kind == "doc":
+        stream = iter_events_from_text(content, item.user_query) if content.strip() else []
+    else:
+        stream = extract_events_from_rows(content, item.user_query)
+    events = list(stream)
+    seconds = time.perf_counter() - started
+    stats.add_stage("extract", seconds)
+    _write(events, writer, timezone)
+    return events, seconds
+
+
+def _process_item(item: ManifestItem, services: dict, timezone: str, checkpoint: Checkpoint,
+                  stats: _RunStats, calendar_locks: dict) -> str:
+    entry = checkpoint.get(item.key)
+    if entry.get("status") == "done":
+        stats.add("skipped")
+        return "skipped"
+
+    # Writers of the same calendar take turns, so two sources listing the same event
+    # cannot both decide to insert it.
+    writer = PipelinedUpsert(services["calendar"], item.calendar_id, timezone, calendar_locks[item.calendar_id])
+    try:
+        if entry.get("status") == "extracted":
+            events = entry["events"]
+            seconds = entry.get("seconds", {})
+            print(f"⏩ Resuming {item.key}: {len(events)} event(s) already extracted.")
+            _write(events, writer, timezone)
+        else:
+            content, fetch_seconds = _fetch(item, services, stats)
+            if content is None:
+                checkpoint.update(item.key, status="failed", error="Could not read the source.",
+                                  seconds={"fetch": fetch_seconds})
+                stats.add("failed")
+                return "failed"
+            events, extract_seconds = _extract_and_write(item, content, writer, timezone, stats)
+            seconds = {"fetch": fetch_seconds, "extract": extract_seconds}
+            checkpoint.update(item.key, status="extracted", events=events, seconds=seconds)
+    finally:
+        # Whatever happened, wait for the events already handed over to be written.
+        started = time.perf_counter()
+        results = writer.close()
+        # Only the time spent waiting for the calendar after extraction ended.
+        calendar_seconds = time.perf_counter() - started
+    stats.add("events", len(events))
+
+    actions = defaultdict(int)
+    if events:
+        stats.add_stage("calendar", calendar_seconds)
+        seconds = dict(seconds, calendar=calendar_seconds)
+        for result in results:
+            actions[result["action"] if result["ok"] else "failed"] += 1
+        for action, number in actions.items():
+            stats.add(f"events_{action}", number)
+
+    if actions.get("failed"):
+        # Stays 'extracted': the next run writes the events again, and the upsert skips the ones already in.
+        checkpoint.update(item.key, status="extracted", actions=dict(actions), seconds=seconds,
+                          error=f"{actions['failed']} event(s) could not be written.")
+        print(f"❌ {item.key}: {actions['failed']} event(s) could not be written; run again to retry them.")
+        stats.add("failed")
+        return "failed"
+
+    checkpoint.update(item.key, status="done", actions=dict(actions), seconds=seconds, error=None)
+    stats.add("done")
+    return "done"
+
+
+def _print_summary(items: list, stats: _RunStats, wall_seconds: float):
+    processed = stats.counts["done"] + stats.counts["failed"]
+    minutes = wall_seconds / 60 if wall_seconds else 0
+    per_minute = (lambda n: n / minutes) if minutes else (lambda n: 0.0)
+
+    print("\n📊 Batch import summary")
+    print(f"  Sources:     {len(items)} in manifest, {stats.counts['done']} done, "
+          f"{stats.counts['failed']} failed, {stats.counts['skipped']} skipped (finished earlier)")
+    print(f"  Events:      {stats.counts['events']} found, {stats.counts['events_created']} created, "
+          f"{stats.counts['events_updated']} updated, {stats.counts['events_unchanged']} unchanged, "
+          f"{stats.counts['events_failed']} failed")
+    print(f"  Wall time:   {wall_seconds:.1f}s")
+    print(f"  Throughput:  {per_minute(processed):.1f} documents/min, {per_minute(stats.counts['events']):.1f} events/min")
+    for stage in STAGES:
+        runs = stats.stage_runs[stage]
+        total = stats.stage_seconds[stage]
+        average = total / runs if runs else 0.0
+        print(f"  {stage:<12} {total:8.1f}s total, {average:6.2f}s per source ({runs} run(s))")
+
+
+def run_batch_import(manifest_path: str, default_calendar_id: str = "primary", workers: int = DEFAULT_WORKERS,
+                     checkpoint_path: str = None, timezone: str = None) -> dict:
+    """
+    Imports every source of the manifest without asking for confirmation.
+
+    Args:
+        manifest_path: Path of the JSON manifest (see the module docstring)
+        default_calendar_id: Calendar used for entries that don't name one
+        workers: Number of sources processed at the same time
+        checkpoint_path: Checkpoint file; defaults to the manifest path + ".checkpoint.json"
+        timezone: Timezone for the created events; defaults to the local one
+
+    Returns:
+        Dictionary of counters ('done', 'failed', 'skipped', 'events', 'events_created', ...)
+    """
+    try:
+        items = load_manifest(manifest_path, default_calendar_id)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read the manifest: {e}")
+        return None
+
+    services = get_google_services()
+    if not services:
+        return None
+    timezone = timezone or get_localzone_name()
+    checkpoint = Checkpoint(checkpoint_path or f"{manifest_path}.checkpoint.json")
+    stats = _RunStats()
+    calendar_locks = defaultdict(threading.Lock)
+
+    print(f"🚀 Importing {len(items)} source(s) with {workers} worker(s); checkpoint: {checkpoint.path}")
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="batch-import") as executor:
+        futures = {
+            executor.submit(_process_item, item, services, timezone, checkpoint, stats, calendar_locks): item
+            for item in items
+        }
+        for future in as_completed(futures):
+            item = futures[future]
+            try:
+                outcome = future.result()
+            except Exception as e:
+                checkpoint.update(item.key, status="failed", error=str(e))
+                stats.add("failed")
+                outcome = f"failed: {e}"
+            print(f"{'✅' if outcome in ('done', 'skipped') else '❌'} {item.key}: {outcome}")
+
+    _print_summary(items, stats, time.perf_counter() - started)
+    return dict(stats.counts)
@@ -0,0 +1,136 @@
+"""
+Cold-start benchmark for the entry points.
+
+Starts a fresh interpreter for every target with `python -X importtime` and reports
+the wall time until it exits, plus where the import time went, summed per top-level
+package. Heavy SDKs (Gemini, LangChain, the Google client libraries) are meant to be
+imported on first use, so a new top-level import of one shows up here as a jump in
+both numbers.
+
+    python benchmarks/bench_cold_start.py --output cold_start.json
+    python benchmarks/bench_cold_start.py --compare baseline.json cold_start.json
+"""
+import argparse
+import json
+import os
+import platform
+import re
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+TARGETS = [
+    # (name, interpreter arguments)
+    ("main_help", ["main.py", "--help"]),
+    ("import_main", ["-c", "import main"]),
+    ("import_ai_event_extractor", ["-c", "import ai_event_extractor"]),
+    ("import_google_auth", ["-c", "import google_auth"]),
+    ("import_agent_main", ["-c", "import agent_main"]),
+    ("import_agent_tools", ["-c", "import agent_tools"]),
+]
+
+# Relative slowdown reported as a regression by --compare.
+REGRESSION_THRESHOLD = 0.20
+TOP_PACKAGES = 8
+
+_IMPORT_LINE_RE = re.compile(r"^import time:\s+(\d+) \|\s+(\d+) \|( *)(\S+)")
+
+
+def parse_importtime(stderr: str) -> dict:
+    """Sums the self time (in seconds) of the imported modules per top-level package."""
+    packages = defaultdict(float)
+    for line in stderr.splitlines():
+        match = _IMPORT_LINE_RE.match(line)
+        if match:
+            packages[match.group(4).split(".")[0]] += int(match.group(1)) / 1e6
+    return dict(packages)
+
+
+def run_target(name: str, arguments: list, repeat: int) -> dict:
+    command = [sys.executable, "-X", "importtime", *arguments]
+    # One untimed run so that every target starts from compiled bytecode.
+    subprocess.run(command, cwd=ROOT, capture_output=True)
+    timings = []
+    packages = {}
+    for _ in range(repeat):
+        started = time.perf_counter()
+        completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True)
+        timings.append(time.perf_counter() - started)
+        packages = parse_importtime(completed.stderr)
+    top = sorted(packages.items(), key=lambda item: item[1], reverse=True)[:TOP_PACKAGES]
+    return {
+        'target': name,
+        'seconds': min(timings),
+        'seconds_all': timings,
+        'import_seconds': sum(packages.values()),
+        'modules_by_package': {package: round(seconds, 4) for package, seconds in top},
+        'exit_code': completed.returncode,
+    }
+
+
+def compare(baseline_path: str, current_path: str) -> int:
+    """Prints the per-target change between two result files. Returns the number of regressions."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {r['target']: r for r in json.load(f)['results']}
+    with open(current_path, "r", encoding="utf-8") as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'target':<28} {'baseline s':>11} {'current s':>11} {'change':>8}")
+    for result in current:
+        old = baseline.get(result['target'])
+        if old is None:
+            print(f"{result['target']:<28} {'-':>11} {result['seconds']:>11.3f} {'new':>8}")
+            continue
+        change = result['seconds'] / old['seconds'] - 1 if old['seconds'] else 0.0
+        flag = ""
+        if change > REGRESSION_THRESHOLD:
+            flag = "  <-- slower"
+            regressions += 1
+            new_packages = set(result['modules_by_package']) - set(old['modules_by_package'])
+            if new_packages:
+                flag += f" (now importing: {', '.join(sorted(new_packages))})"
+        print(f"{result['target']:<28} {old['seconds']:>11.3f} {result['seconds']:>11.3f} {change:>+8.1%}{flag}")
+    print(f"\n{regressions} target(s) more than {REGRESSION_THRESHOLD:.0%} slower than the baseline.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the start-up time and import breakdown of the entry points.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--only", nargs="+", metavar="TARGET", help="Run only these targets.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per target; the best time is reported.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="Compare two result files instead of running the benchmark.")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+
+    results = []
+    for name, arguments in TARGETS:
+        if args.only and name not in args.only:
+            continue
+        result = run_target(name, arguments, args.repeat)
+        results.append(result)
+        heaviest = ", ".join(f"{package} {seconds:.2f}s" for package, seconds in
+                             list(result['modules_by_package'].items())[:3])
+        print(f"{name:<28} {result['seconds']:>7.3f}s  imports {result['import_seconds']:.3f}s  ({heaviest})")
+
+    if args.output:
+        report = {
+            'python': platform.python_version(),
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'repeat': args.repeat,
+            'results': results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+"""
+Micro-benchmark for doc_flattener.flatten_document.
+
+Builds synthetic Docs API documents with paragraphs, tables and tabs at several sizes and
+reports the flattening time per structural element. The time per element should stay
+roughly constant as documents grow; a rising value means flattening is no longer linear.
+
+    python benchmarks/bench_doc_flattener.py
+    python benchmarks/bench_doc_flattener.py --sizes 1000 10000 50000 --repeat 5
+"""
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from doc_flattener import flatten_document
+
+
+def _paragraph(text: str, start_index: int) -> dict:
+    return {
+        'startIndex': start_index,
+        'paragraph': {'elements': [{'startIndex': start_index, 'textRun': {'content': text + "\n"}}]},
+    }
+
+
+def make_content(elements: int, table_every: int = 20, table_rows: int = 5, start_index: int = 1) -> list:
+    """Returns body content with `elements` structural elements; every table_every-th one is a table."""
+    content = []
+    index = start_index
+    for i in range(elements):
+        if table_every and i % table_every == table_every - 1:
+            rows = []
+            for r in range(table_rows):
+                cells = [
+                    {'startIndex': index, 'content': [_paragraph(value, index)]}
+                    for value in (f"2025-03-{r % 28 + 1:02d}", "10:00", f"Session {i}.{r}")
+                ]
+                rows.append({'startIndex': index, 'tableCells': cells})
+                index += 30
+            content.append({'startIndex': index, 'table': {'tableRows': rows}})
+        else:
+            text = f"Paragraph {i}: the team meets on Monday at 10:00 to review progress."
+            content.append(_paragraph(text, index))
+            index += len(text) + 1
+    return content
+
+
+def make_document(elements: int, tabs: int = 1) -> dict:
+    """Returns a document resource as fetched with includeTabsContent=True."""
+    per_tab = max(1, elements // tabs)
+    return {
+        'documentId': 'synthetic',
+        'tabs': [
+            {
+                'tabProperties': {'tabId': f"t.{t}", 'title': f"Tab {t}"},
+                'documentTab': {'body': {'content': make_content(per_tab)}},
+            }
+            for t in range(tabs)
+        ],
+    }
+
+
+def run(sizes, tabs: int, repeat: int) -> list:
+    results = []
+    for size in sizes:
+        document = make_document(size, tabs)
+        best = float("inf")
+        for _ in range(repeat):
+            started = time.perf_counter()
+            text, offsets = flatten_document(document)
+            best = min(best, time.perf_counter() - started)
+        results.append({
+            'elements': size,
+            'seconds': best,
+            'ns_per_element': best / size * 1e9,
+            'chars': len(text),
+            'spans': len(offsets),
+        })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the structural Google Doc flattener.")
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000, 50000],
+                        help="Numbers of structural elements per document.")
+    parser.add_argument("--tabs", type=int, default=3, help="Number of tabs per document.")
+    parser.add_argument("--repeat", type=int, default=3, help="Runs per size; the best time is reported.")
+    args = parser.parse_args()
+
+    results = run(args.sizes, args.tabs, args.repeat)
+    print(f"{'elements':>10} {'seconds':>10} {'ns/element':>12} {'chars':>12} {'spans':>10}")
+    for r in results:
+        print(f"{r['elements']:>10} {r['seconds']:>10.4f} {r['ns_per_element']:>12.0f} {r['chars']:>12} {r['spans']:>10}")
+
+    growth = results[-1]['ns_per_element'] / results[0]['ns_per_element']
+    print(f"\nTime per element grew {growth:.2f}x from the smallest to the largest document.")
+
+
+if __name__ == "__main__":
+    main()
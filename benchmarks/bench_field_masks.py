@@ -0,0 +1,161 @@
+"""
+Response-size benchmark for the partial-response field masks in google_services.py.
+
+Fetches the same resources through the fake backend (see fakes.py, which applies
+`fields` masks the way Google's servers do) once without a mask and once the way the
+app does, and reports the JSON bytes of both, also gzip-compressed since the client
+asks for compressed responses. Documents get the styles, lists and named styles real
+Docs responses carry, which the flattener never reads. The flattened text of the
+masked document is checked against the full one.
+
+    python benchmarks/bench_field_masks.py
+    python benchmarks/bench_field_masks.py --sizes 1000 10000 --output field_masks.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+from google.auth.credentials import AnonymousCredentials
+from bench_doc_flattener import make_document
+from doc_flattener import flatten_document
+from fakes import FakeGoogleBackend, make_schedule_rows
+from google_auth import ServicePool
+from google_services import create_calendar_event, get_google_doc_content, get_google_sheet_page_names
+
+_PARAGRAPH_STYLE = {
+    "namedStyleType": "NORMAL_TEXT", "direction": "LEFT_TO_RIGHT", "lineSpacing": 115,
+    "spaceAbove": {"magnitude": 0, "unit": "PT"}, "spaceBelow": {"magnitude": 8, "unit": "PT"},
+    "avoidWidowAndOrphan": True, "keepLinesTogether": False, "keepWithNext": False,
+}
+_TEXT_STYLE = {
+    "weightedFontFamily": {"fontFamily": "Arial", "weight": 400},
+    "fontSize": {"magnitude": 11, "unit": "PT"},
+    "foregroundColor": {"color": {"rgbColor": {"red": 0.2, "green": 0.2, "blue": 0.2}}},
+}
+
+
+def _add_styles(content: list):
+    for element in content:
+        if "paragraph" in element:
+            element["endIndex"] = element["startIndex"] + 1
+            element["paragraph"]["paragraphStyle"] = _PARAGRAPH_STYLE
+            for run in element["paragraph"]["elements"]:
+                run["endIndex"] = run["startIndex"] + len(run["textRun"]["content"])
+                run["textRun"]["textStyle"] = _TEXT_STYLE
+        elif "table" in element:
+            element["table"]["columns"] = len(element["table"]["tableRows"][0]["tableCells"])
+            for row in element["table"]["tableRows"]:
+                row["tableRowStyle"] = {"minRowHeight": {"unit": "PT"}}
+                for cell in row["tableCells"]:
+                    cell["tableCellStyle"] = {"rowSpan": 1, "columnSpan": 1, "contentAlignment": "TOP",
+                                              "paddingLeft": {"magnitude": 5, "unit": "PT"}}
+                    _add_styles(cell["content"])
+
+
+def make_styled_document(elements: int) -> dict:
+    """A document like make_document, with the styling a real Docs API response carries."""
+    document = make_document(elements)
+    document["title"] = "Synthetic schedule"
+    for tab in document["tabs"]:
+        body = tab["documentTab"]["body"]
+        _add_styles(body["content"])
+        tab["documentTab"].update({
+            "documentStyle": {"pageSize": {"height": {"magnitude": 792, "unit": "PT"},
+                                           "width": {"magnitude": 612, "unit": "PT"}},
+                              "marginTop": {"magnitude": 72, "unit": "PT"}},
+            "namedStyles": {"styles": [
+                {"namedStyleType": name, "paragraphStyle": _PARAGRAPH_STYLE, "textStyle": _TEXT_STYLE}
+                for name in ("NORMAL_TEXT", "TITLE", "SUBTITLE", "HEADING_1", "HEADING_2", "HEADING_3")
+            ]},
+            "lists": {f"kix.list{i}": {"listProperties": {"nestingLevels": [
+                {"bulletAlignment": "START", "glyphSymbol": "●", "indentStart": {"magnitude": 36 * level, "unit": "PT"}}
+                for level in range(1, 10)
+            ]}} for i in range(elements // 200 + 1)},
+        })
+    return document
+
+
+def _measure(backend: FakeGoogleBackend, request) -> tuple:
+    """Runs request() and returns (its result, response bytes, gzip-compressed response bytes)."""
+    backend.response_bytes = backend.response_gzip_bytes = 0
+    with contextlib.redirect_stdout(io.StringIO()):
+        result = request()
+    return result, backend.response_bytes, backend.response_gzip_bytes
+
+
+def _row(name: str, full: tuple, masked: tuple) -> dict:
+    _, full_bytes, full_gzip_bytes = full
+    _, masked_bytes, masked_gzip_bytes = masked
+    return {
+        "call": name,
+        "full_bytes": full_bytes, "full_gzip_bytes": full_gzip_bytes,
+        "masked_bytes": masked_bytes, "masked_gzip_bytes": masked_gzip_bytes,
+        "saved": 1 - masked_bytes / full_bytes if full_bytes else 0.0,
+    }
+
+
+def run(sizes: list) -> tuple:
+    """Returns (one result dict per call, the backend) for documents of the given sizes, tab titles and an insert."""
+    backend = FakeGoogleBackend()
+    pool = ServicePool(credentials=AnonymousCredentials(), http_factory=backend.http, background_refresh=False)
+    with contextlib.redirect_stdout(io.StringIO()):
+        services = pool.get_services()
+    results = []
+
+    documents = services["docs"].documents()
+    for size in sizes:
+        backend.add_document("doc", make_styled_document(size))
+        full = _measure(backend, lambda: documents.get(documentId="doc", includeTabsContent=True).execute())
+        masked = _measure(backend, lambda: get_google_doc_content(services["docs"], "doc"))
+        if masked[0] != flatten_document(full[0])[0]:
+            raise AssertionError("The masked document flattens to different text.")
+        results.append(_row(f"documents.get ({size} elements)", full, masked))
+
+    backend.add_sheet("sheet", make_schedule_rows(100))
+    for title in ("Archive", "Rooms", "Speakers"):
+        backend.add_sheet("sheet", make_schedule_rows(10), title=title)
+    spreadsheets = services["sheets"].spreadsheets()
+    full = _measure(backend, lambda: spreadsheets.get(spreadsheetId="sheet").execute())
+    masked = _measure(backend, lambda: get_google_sheet_page_names(services["sheets"], "sheet"))
+    results.append(_row("spreadsheets.get (tab titles)", full, masked))
+
+    event = {"summary": "Planning", "description": "Quarterly planning",
+             "start_datetime": "2025-03-05T10:00:00", "end_datetime": "2025-03-05T11:00:00"}
+    body = {"summary": event["summary"], "description": event["description"],
+            "start": {"dateTime": event["start_datetime"], "timeZone": "UTC"},
+            "end": {"dateTime": event["end_datetime"], "timeZone": "UTC"}}
+    events = services["calendar"].events()
+    full = _measure(backend, lambda: events.insert(calendarId="primary", body=body).execute())
+    masked = _measure(backend, lambda: create_calendar_event(services["calendar"], "primary", event, "UTC"))
+    results.append(_row("events.insert", full, masked))
+    return results, backend
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare Google API response sizes with and without field masks.")
+    parser.add_argument("--sizes", nargs="+", type=int, default=[1000, 10000, 50000],
+                        help="Document sizes in structural elements.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    args = parser.parse_args()
+
+    results, backend = run(args.sizes)
+    print(f"{'call':<36} {'full':>12} {'masked':>12} {'saved':>7} {'full gz':>10} {'masked gz':>10}")
+    for row in results:
+        print(f"{row['call']:<36} {row['full_bytes']:>12,} {row['masked_bytes']:>12,} {row['saved']:>7.1%} "
+              f"{row['full_gzip_bytes']:>10,} {row['masked_gzip_bytes']:>10,}")
+    print(f"\n{backend.gzip_requests}/{backend.requests} requests asked for a gzip-compressed response.")
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"results": results}, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
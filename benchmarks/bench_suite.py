@@ -0,0 +1,299 @@
+"""
+Offline benchmark suite for the extraction pipelines.
+
+Runs the main.py pipeline, the agent tools, the calendar batch path and the doc and
+sheet flatteners at several sizes against local fakes (see fakes.py): Google API
+requests and Gemini calls take a configurable, fixed latency instead of a network
+round trip, so the numbers only move when our own code changes. Every scenario runs
+in a fresh temporary directory, so on-disk caches start cold unless the scenario
+warms them itself.
+
+    python benchmarks/bench_suite.py --output results.json
+    python benchmarks/bench_suite.py --quick --google-latency-ms 0 --gemini-latency-ms 0
+    python benchmarks/bench_suite.py --compare baseline.json results.json
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import subprocess
+import sys
+import tempfile
+import time
+from unittest import mock
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+
+with contextlib.redirect_stdout(io.StringIO()):
+    import agent_tools
+    import ai_event_extractor
+    import calendar_index
+    import document_cache
+    import google_auth
+    import main as main_module
+from google.auth.credentials import AnonymousCredentials
+from bench_doc_flattener import make_document
+from doc_flattener import flatten_document, format_table_rows
+from fakes import FakeGenerativeModel, FakeGoogleBackend, make_schedule_rows
+from google_services import create_calendar_events_batch
+from rate_limiter import DEFAULT_LIMITS, configure_rate_limit
+from sheet_schedule_parser import ScheduleTableParser
+
+# Relative slowdown reported as a regression by --compare.
+REGRESSION_THRESHOLD = 0.10
+
+
+class BenchEnvironment:
+    """Fake backends wired into the app, inside a temporary working directory with cold caches."""
+
+    def __init__(self, google_latency: float, gemini_latency: float, gemini_latency_per_kchar: float):
+        self.backend = FakeGoogleBackend(latency=google_latency)
+        self.model = FakeGenerativeModel(latency=gemini_latency, latency_per_kchar=gemini_latency_per_kchar)
+        self._directory = tempfile.TemporaryDirectory(prefix="bench-")
+        self._previous_cwd = os.getcwd()
+
+    def __enter__(self):
+        os.chdir(self._directory.name)
+        # The caches live under the working directory; drop the instances bound to the previous one.
+        ai_event_extractor._extraction_cache = None
+        document_cache._document_cache = None
+        calendar_index._calendar_index = None
+        google_auth.set_service_pool(google_auth.ServicePool(
+            credentials=AnonymousCredentials(), http_factory=self.backend.http, background_refresh=False,
+        ))
+        ai_event_extractor.set_model(self.model)
+        # The fakes have no quota; measure our own code rather than the production rate limits.
+        for api in DEFAULT_LIMITS:
+            configure_rate_limit(api, rate=1e6, burst=10 ** 6)
+        return self
+
+    def __exit__(self, *exc):
+        google_auth.set_service_pool(None)
+        os.chdir(self._previous_cwd)
+        self._directory.cleanup()
+        return False
+
+    def counters(self) -> dict:
+        return {
+            'http_requests': self.backend.requests,
+            'batch_requests': self.backend.batch_requests,
+            'gemini_calls': self.model.calls,
+            'gemini_prompt_chars': self.model.prompt_chars,
+        }
+
+
+def _make_events(count: int) -> list:
+    return [
+        {
+            'summary': f"Session {i}",
+            'start_datetime': f"2025-{i // 28 % 12 + 1:02d}-{i % 28 + 1:02d}T{8 + i % 9:02d}:00:00",
+            'end_datetime': f"2025-{i // 28 % 12 + 1:02d}-{i % 28 + 1:02d}T{9 + i % 9:02d}:00:00",
+            'description': "",
+        }
+        for i in range(count)
+    ]
+
+
+def _run_main(*argv):
+    with mock.patch.object(sys, "argv", ["main.py", *argv]), mock.patch("builtins.input", return_value="a"):
+        main_module.main()
+
+
+# Each scenario prepares its inputs in the environment (untimed) and returns the function to time.
+
+def prepare_flatten_doc(env, paragraphs: int):
+    document = make_document(paragraphs, tabs=3)
+    return lambda: flatten_document(document)
+
+
+def prepare_parse_sheet(env, rows: int):
+    values = make_schedule_rows(rows)
+
+    def run():
+        format_table_rows(values)
+        parser = ScheduleTableParser.detect(values)
+        return parser.parse_rows(values[parser.data_start_row:])
+    return run
+
+
+def prepare_main_doc(env, paragraphs: int, warm: bool = False):
+    env.backend.add_document("doc", make_document(paragraphs, tabs=1))
+    if warm:
+        _run_main("--doc-id", "doc")
+    return lambda: _run_main("--doc-id", "doc")
+
+
+def prepare_main_sheet(env, rows: int):
+    env.backend.add_sheet("sheet", make_schedule_rows(rows))
+    return lambda: _run_main("--sheet-id", "sheet")
+
+
+def prepare_tool_read_doc(env, paragraphs: int):
+    env.backend.add_document("doc", make_document(paragraphs, tabs=1))
+    return lambda: agent_tools.read_google_doc.invoke({"document_id": "doc"})
+
+
+def prepare_tool_read_extract_doc(env, paragraphs: int):
+    """The agent's usual doc flow: read the doc, then extract events through the returned content handle."""
+    env.backend.add_document("doc", make_document(paragraphs, tabs=1))
+
+    def run():
+        preview = agent_tools.read_google_doc.invoke({"document_id": "doc"})
+        handle = next(line.split(": ", 1)[1] for line in preview.splitlines() if line.startswith("Content handle: "))
+        return agent_tools.extract_events_from_document_text.invoke({"text_content": handle, "user_query": "all events"})
+    return run
+
+
+def prepare_tool_extract_text(env, paragraphs: int):
+    text, _ = flatten_document(make_document(paragraphs, tabs=1))
+    return lambda: agent_tools.extract_events_from_document_text.invoke(
+        {"text_content": text, "user_query": "all events"}
+    )
+
+
+def prepare_tool_extract_sheet(env, rows: int):
+    env.backend.add_sheet("sheet", make_schedule_rows(rows))
+    return lambda: agent_tools.extract_events_from_google_sheet.invoke(
+        {"spreadsheet_id": "sheet", "user_query": "all events"}
+    )
+
+
+def prepare_tool_add_events(env, events: int):
+    events_json = json.dumps(_make_events(events))
+    return lambda: agent_tools.add_events_to_calendar.invoke({"events_json": events_json})
+
+
+def prepare_calendar_batch(env, events: int):
+    service = google_auth.get_google_services()["calendar"]
+    batch = _make_events(events)
+    return lambda: create_calendar_events_batch(service, "primary", batch, "UTC")
+
+
+SCENARIOS = [
+    # (name, prepare function, parameters for a full run, parameters for --quick)
+    ("flatten_doc", prepare_flatten_doc, [{'paragraphs': 1000}, {'paragraphs': 10000}], [{'paragraphs': 1000}]),
+    ("parse_sheet", prepare_parse_sheet, [{'rows': 1000}, {'rows': 10000}], [{'rows': 1000}]),
+    ("main_doc", prepare_main_doc, [{'paragraphs': 1000}, {'paragraphs': 10000}], [{'paragraphs': 1000}]),
+    ("main_doc_warm", prepare_main_doc, [{'paragraphs': 10000, 'warm': True}], [{'paragraphs': 1000, 'warm': True}]),
+    ("main_sheet", prepare_main_sheet, [{'rows': 10000}], [{'rows': 1000}]),
+    ("tool_read_doc", prepare_tool_read_doc, [{'paragraphs': 10000}], [{'paragraphs': 1000}]),
+    ("tool_read_extract_doc", prepare_tool_read_extract_doc, [{'paragraphs': 1000}], [{'paragraphs': 1000}]),
+    ("tool_extract_text", prepare_tool_extract_text, [{'paragraphs': 1000}], [{'paragraphs': 1000}]),
+    ("tool_extract_sheet", prepare_tool_extract_sheet, [{'rows': 10000}], [{'rows': 1000}]),
+    ("tool_add_events", prepare_tool_add_events, [{'events': 500}], [{'events': 100}]),
+    ("calendar_batch", prepare_calendar_batch, [{'events': 500}], [{'events': 100}]),
+]
+
+
+def run_scenario(name: str, prepare, params: dict, args) -> dict:
+    timings = []
+    counters = {}
+    for _ in range(args.repeat):
+        with BenchEnvironment(args.google_latency_ms / 1000, args.gemini_latency_ms / 1000,
+                              args.gemini_latency_per_kchar_ms / 1000) as env, \
+                contextlib.redirect_stdout(io.StringIO()):
+            run = prepare(env, **params)
+            before = env.counters()
+            started = time.perf_counter()
+            run()
+            timings.append(time.perf_counter() - started)
+            counters = {key: value - before[key] for key, value in env.counters().items()}
+    return {
+        'scenario': name,
+        'params': params,
+        'seconds': min(timings),
+        'seconds_all': timings,
+        **counters,
+    }
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def _label(result: dict) -> str:
+    params = ",".join(f"{key}={value}" for key, value in sorted(result['params'].items()))
+    return f"{result['scenario']}[{params}]"
+
+
+def compare(baseline_path: str, current_path: str) -> int:
+    """Prints the per-scenario change between two result files. Returns the number of regressions."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = {_label(r): r for r in json.load(f)['results']}
+    with open(current_path, "r", encoding="utf-8") as f:
+        current = json.load(f)['results']
+
+    regressions = 0
+    print(f"{'scenario':<45} {'baseline s':>11} {'current s':>11} {'change':>8} {'requests':>12}")
+    for result in current:
+        label = _label(result)
+        old = baseline.get(label)
+        if old is None:
+            print(f"{label:<45} {'-':>11} {result['seconds']:>11.4f} {'new':>8}")
+            continue
+        change = result['seconds'] / old['seconds'] - 1 if old['seconds'] else 0.0
+        flag = ""
+        if change > REGRESSION_THRESHOLD:
+            flag = "  <-- slower"
+            regressions += 1
+        requests = f"{old['http_requests']}->{result['http_requests']}"
+        print(f"{label:<45} {old['seconds']:>11.4f} {result['seconds']:>11.4f} {change:>+8.1%} {requests:>12}{flag}")
+    print(f"\n{regressions} scenario(s) more than {REGRESSION_THRESHOLD:.0%} slower than the baseline.")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the pipelines offline against fake Google APIs and Gemini.")
+    parser.add_argument("--output", help="Write the results as JSON to this file.")
+    parser.add_argument("--quick", action="store_true", help="Run only the small sizes.")
+    parser.add_argument("--only", nargs="+", metavar="SCENARIO", help="Run only these scenarios.")
+    parser.add_argument("--repeat", type=int, default=1, help="Runs per scenario; the best time is reported.")
+    parser.add_argument("--google-latency-ms", type=float, default=20.0, help="Latency of every fake Google request.")
+    parser.add_argument("--gemini-latency-ms", type=float, default=300.0, help="Fixed latency of every fake Gemini call.")
+    parser.add_argument("--gemini-latency-per-kchar-ms", type=float, default=10.0,
+                        help="Extra fake Gemini latency per 1000 prompt characters.")
+    parser.add_argument("--compare", nargs=2, metavar=("BASELINE", "CURRENT"),
+                        help="Compare two result files instead of running the benchmarks.")
+    args = parser.parse_args()
+
+    if args.compare:
+        sys.exit(1 if compare(*args.compare) else 0)
+
+    results = []
+    print(f"{'scenario':<45} {'seconds':>10} {'requests':>9} {'gemini':>7}")
+    for name, prepare, full_params, quick_params in SCENARIOS:
+        if args.only and name not in args.only:
+            continue
+        for params in (quick_params if args.quick else full_params):
+            result = run_scenario(name, prepare, params, args)
+            results.append(result)
+            print(f"{_label(result):<45} {result['seconds']:>10.4f} {result['http_requests']:>9} {result['gemini_calls']:>7}")
+
+    if args.output:
+        report = {
+            'commit': _git_commit(),
+            'python': platform.python_version(),
+            'created': time.strftime("%Y-%m-%dT%H:%M:%S"),
+            'settings': {
+                'google_latency_ms': args.google_latency_ms,
+                'gemini_latency_ms': args.gemini_latency_ms,
+                'gemini_latency_per_kchar_ms': args.gemini_latency_per_kchar_ms,
+                'repeat': args.repeat,
+                'quick': args.quick,
+            },
+            'results': results,
+        }
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nSaved results to {args.output}")
+
+
+if __name__ == "__main__":
+    main()
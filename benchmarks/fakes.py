@@ -0,0 +1,361 @@
+"""
+Local stand-ins for Google APIs and Gemini, used by the offline benchmark suite.
+
+FakeGoogleBackend holds the documents, sheets and calendar events, and its http()
+method returns transports with the httplib2.Http.request interface (the same one
+googleapiclient.http.HttpMock implements), so it plugs into ServicePool as its
+http_factory. Unlike HttpMock, it routes each request by URL to Docs, Sheets, Drive
+or Calendar handlers and answers Calendar batch requests. FakeGenerativeModel replaces
+genai.GenerativeModel and answers deterministically from the prompt text.
+"""
+import gzip
+import itertools
+import json
+import re
+import threading
+import time
+from urllib.parse import parse_qs, unquote, urlparse
+import httplib2
+
+_BOUNDARY = "fake_batch_boundary"
+_SCHEDULE_LINE_RE = re.compile(r"(\d{4}-\d{2}-\d{2}) \| (\d{1,2}:\d{2})(?: \| (\d{1,2}:\d{2}))? \| ([^|\n]+)")
+
+
+# The parts of real responses that the client never reads, so that field masks have something to save.
+_SPREADSHEET_PROPERTIES = {
+    "title": "Schedule", "locale": "en_US", "autoRecalc": "ON_CHANGE", "timeZone": "Europe/Berlin",
+    "defaultFormat": {
+        "backgroundColor": {"red": 1, "green": 1, "blue": 1},
+        "padding": {"top": 2, "right": 3, "bottom": 2, "left": 3},
+        "verticalAlignment": "BOTTOM", "wrapStrategy": "OVERFLOW_CELL",
+        "textFormat": {"foregroundColor": {}, "fontFamily": "arial,sans,sans-serif", "fontSize": 10,
+                       "bold": False, "italic": False, "strikethrough": False, "underline": False},
+    },
+    "spreadsheetTheme": {"primaryFontFamily": "Arial", "themeColors": [
+        {"colorType": name, "color": {"rgbColor": {"red": 0.26, "green": 0.52, "blue": 0.96}}}
+        for name in ("TEXT", "BACKGROUND", "ACCENT1", "ACCENT2", "ACCENT3", "ACCENT4", "ACCENT5", "ACCENT6", "LINK")
+    ]},
+}
+_EVENT_SERVER_FIELDS = {
+    "kind": "calendar#event", "etag": "\"3381234567890000\"", "status": "confirmed",
+    "created": "2025-01-01T00:00:00.000Z", "updated": "2025-01-01T00:00:00.000Z",
+    "creator": {"email": "someone@example.com", "self": True},
+    "organizer": {"email": "someone@example.com", "self": True},
+    "sequence": 0, "reminders": {"useDefault": True}, "eventType": "default",
+}
+
+
+def _parse_fields_mask(mask: str, position: int = 0) -> tuple:
+    """Parses a partial-response mask ("a/b,c(d,e)") into a tree of dicts. Returns (tree, end position)."""
+    tree = {}
+    path = []
+    name = ""
+    while position < len(mask):
+        char = mask[position]
+        position += 1
+        if char == "/":
+            path.append(name)
+            name = ""
+        elif char == "(":
+            sub, position = _parse_fields_mask(mask, position)
+            path.append(name)
+            name = ""
+            node = tree
+            for part in path[:-1]:
+                node = node.setdefault(part, {})
+            node[path[-1]] = sub
+            path = []
+        elif char in ",)":
+            if name:
+                node = tree
+                for part in path:
+                    node = node.setdefault(part, {})
+                node[name] = None
+            path, name = [], ""
+            if char == ")":
+                return tree, position
+        else:
+            name += char
+    if name:
+        node = tree
+        for part in path:
+            node = node.setdefault(part, {})
+        node[name] = None
+    return tree, position
+
+
+def _apply_tree(value, tree):
+    if tree is None:
+        return value
+    if isinstance(value, list):
+        return [_apply_tree(item, tree) for item in value]
+    if not isinstance(value, dict):
+        return value
+    return {key: _apply_tree(value[key], sub) for key, sub in tree.items() if key in value}
+
+
+def apply_fields_mask(resource: dict, mask: str) -> dict:
+    """Returns the part of an API resource that a `fields` partial-response mask selects, like Google's servers."""
+    # Dots and slashes both select sub-fields ("sheets.properties.title").
+    return _apply_tree(resource, _parse_fields_mask(mask.replace(".", "/"))[0])
+
+
+def make_schedule_rows(rows: int) -> list:
+    """Returns a schedule sheet: a header row plus `rows` rows of date, start, end, title, location, notes."""
+    values = [["Date", "Start", "End", "Title", "Location", "Notes"]]
+    for i in range(rows):
+        month, day = i // 28 % 12 + 1, i % 28 + 1
+        hour = 8 + i % 9
+        values.append([
+            f"2025-{month:02d}-{day:02d}", f"{hour}:00", f"{hour + 1}:00",
+            f"Session {i}", f"Room {i % 12}", "Bring the printed agenda",
+        ])
+    return values
+
+
+class FakeGoogleBackend:
+    """In-memory Docs, Sheets, Drive and Calendar with a fixed latency per HTTP request."""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.documents = {}
+        self.sheets = {}
+        self.modified = {}
+        self.events = {}
+        self.requests = 0
+        self.batch_requests = 0
+        self.response_bytes = 0
+        # What the responses would take on the wire with gzip, which the client asks for.
+        self.response_gzip_bytes = 0
+        self.gzip_requests = 0
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+
+    def add_document(self, document_id: str, document: dict):
+        """Adds a document, or replaces it with a new revision."""
+        previous = self.documents.get(document_id)
+        revision = int(previous["revisionId"].split("-")[1]) + 1 if previous else 1
+        self.documents[document_id] = dict(document, documentId=document_id, revisionId=f"rev-{revision}")
+
+    def add_sheet(self, spreadsheet_id: str, rows: list, title: str = "Sheet1"):
+        self.sheets.setdefault(spreadsheet_id, {})[title] = rows
+        self.modified[spreadsheet_id] = self.modified.get(spreadsheet_id, 0) + 1
+
+    def http(self):
+        """Transport factory for ServicePool(http_factory=...)."""
+        return _FakeHttp(self)
+
+    def handle(self, uri: str, method: str, body, headers: dict) -> tuple:
+        with self._lock:
+            self.requests += 1
+        if self.latency:
+            time.sleep(self.latency)
+
+        url = urlparse(uri)
+        path = unquote(url.path)
+        query = {key: values[0] for key, values in parse_qs(url.query).items()}
+        if headers.get("x-http-method-override"):
+            # googleapiclient sends GETs with very long URLs (e.g. big field masks) as POSTs with the query in the body.
+            method = headers["x-http-method-override"]
+            query.update({key: values[0] for key, values in parse_qs(body).items()})
+            body = None
+        if path.startswith("/batch/"):
+            return self._batch(body, headers)
+        if "gzip" in headers.get("accept-encoding", "") and "gzip" in headers.get("user-agent", ""):
+            with self._lock:
+                self.gzip_requests += 1
+        return self._answer(method, path, query, body)
+
+    def _answer(self, method: str, path: str, query: dict, body) -> tuple:
+        status, response = self._route(method, path, query, body)[:2]
+        if status == 200 and query.get("fields") and isinstance(response, dict):
+            response = apply_fields_mask(response, query["fields"])
+        return status, response
+
+    def _route(self, method: str, path: str, query: dict, body) -> tuple:
+        match = re.match(r"/v1/documents/([^/]+)$", path)
+        if match:
+            document = self.documents.get(match.group(1))
+            if document is None:
+                return 404, {"error": {"code": 404, "message": "Document not found"}}
+            return 200, document
+
+        match = re.match(r"/v4/spreadsheets/([^/]+)/values/(.+)$", path)
+        if match:
+            return 200, {"values": self._sheet_values(match.group(1), match.group(2))}
+
+        match = re.match(r"/v4/spreadsheets/([^/]+)$", path)
+        if match:
+            sheets = self.sheets.get(match.group(1), {})
+            return 200, {
+                "spreadsheetId": match.group(1),
+                "properties": _SPREADSHEET_PROPERTIES,
+                "sheets": [
+                    {"properties": {"sheetId": index, "title": title, "index": index, "sheetType": "GRID",
+                                    "gridProperties": {"rowCount": len(rows),
+                                                       "columnCount": max((len(r) for r in rows), default=0),
+                                                       "frozenRowCount": 1}}}
+                    for index, (title, rows) in enumerate(sheets.items())
+                ],
+                "spreadsheetUrl": f"https://docs.google.com/spreadsheets/d/{match.group(1)}/edit",
+            }
+
+        match = re.match(r"/drive/v3/files/([^/]+)$", path)
+        if match:
+            second = self.modified.get(match.group(1), 0)
+            return 200, {"id": match.group(1), "modifiedTime": f"2025-01-01T00:00:{second:02d}.000Z"}
+
+        match = re.match(r"/calendar/v3/calendars/([^/]+)/events(?:/([^/]+))?$", path)
+        if match:
+            return self._calendar_event(method, match.group(1), match.group(2), body)
+
+        if re.match(r"/calendar/v3/calendars$", path) and method == "POST":
+            calendar = json.loads(body)
+            return 200, dict(calendar, id=f"calendar-{next(self._ids)}@group.calendar.google.com")
+
+        return 404, {"error": {"code": 404, "message": f"No fake route for {method} {path}"}}
+
+    def _sheet_values(self, spreadsheet_id: str, a1_range: str) -> list:
+        title, _, cells = a1_range.rpartition("!")
+        title = title.strip("'").replace("''", "'")
+        rows = self.sheets.get(spreadsheet_id, {}).get(title, [])
+        numbers = [int(n) for n in re.findall(r"\d+", cells)]
+        if len(numbers) == 2:
+            return rows[numbers[0] - 1:numbers[1]]
+        return rows
+
+    def _calendar_event(self, method: str, calendar_id: str, event_id: str, body) -> tuple:
+        if method == "GET" and event_id is None:
+            with self._lock:
+                items = [dict(event, id=key) for (cal, key), event in self.events.items() if cal == calendar_id]
+            return 200, {"items": items, "nextSyncToken": "sync-token"}
+        event = json.loads(body) if body else {}
+        with self._lock:
+            if method == "DELETE":
+                if self.events.pop((calendar_id, event_id), None) is None:
+                    return 410, {"error": {"code": 410, "message": "Resource has been deleted"}}
+                return 204, ""
+            if method == "POST":
+                event_id = f"event{next(self._ids)}"
+                event = dict(_EVENT_SERVER_FIELDS, iCalUID=f"{event_id}@google.com", **event)
+            elif method == "PATCH":
+                event = dict(self.events.get((calendar_id, event_id), {}), **event)
+            self.events[(calendar_id, event_id)] = event
+        return 200, dict(event, id=event_id, htmlLink=f"https://calendar.example/{event_id}")
+
+    def _batch(self, body, headers: dict) -> tuple:
+        with self._lock:
+            self.batch_requests += 1
+        if isinstance(body, bytes):
+            body = body.decode("utf-8")
+        boundary = headers["content-type"].split("boundary=")[1].strip('"')
+        parts = []
+        for part in body.split("--" + boundary):
+            content_id = re.search(r"Content-ID: <(.*)>", part)
+            request_line = re.search(r"^(GET|POST|PATCH|PUT|DELETE) (\S+) HTTP", part, re.MULTILINE)
+            if not content_id or not request_line:
+                continue
+            sections = re.split(r"\r?\n\r?\n", part.strip(), maxsplit=2)
+            payload = sections[2].strip() if len(sections) > 2 else ""
+            url = urlparse(request_line.group(2))
+            query = {key: values[0] for key, values in parse_qs(url.query).items()}
+            status, response = self._answer(request_line.group(1), unquote(url.path), query, payload or None)
+            parts.append(
+                f"--{_BOUNDARY}\r\nContent-Type: application/http\r\n"
+                f"Content-ID: <response-{content_id.group(1)}>\r\n\r\n"
+                f"HTTP/1.1 {status} OK\r\nContent-Type: application/json\r\n\r\n{json.dumps(response)}\r\n"
+            )
+        content = "".join(parts) + f"--{_BOUNDARY}--"
+        return 200, content, f"multipart/mixed; boundary={_BOUNDARY}"
+
+
+class _FakeHttp:
+    """httplib2.Http look-alike bound to a FakeGoogleBackend."""
+
+    def __init__(self, backend: FakeGoogleBackend):
+        self.backend = backend
+        self.timeout = None
+
+    def request(self, uri, method="GET", body=None, headers=None, redirections=1, connection_type=None):
+        result = self.backend.handle(uri, method, body, headers or {})
+        status, payload = result[0], result[1]
+        content_type = result[2] if len(result) > 2 else "application/json"
+        content = payload if isinstance(payload, str) else json.dumps(payload)
+        with self.backend._lock:
+            self.backend.response_bytes += len(content)
+            self.backend.response_gzip_bytes += len(gzip.compress(content.encode("utf-8")))
+        response = httplib2.Response({"status": str(status), "content-type": content_type})
+        return response, content.encode("utf-8")
+
+
+class _UsageMetadata:
+    def __init__(self, prompt_tokens: int, output_tokens: int):
+        self.prompt_token_count = prompt_tokens
+        self.candidates_token_count = output_tokens
+        self.total_token_count = prompt_tokens + output_tokens
+
+
+class _FakeResponse:
+    def __init__(self, text: str, prompt_tokens: int):
+        self.text = text
+        self.usage_metadata = _UsageMetadata(prompt_tokens, len(text) // 4)
+
+
+class _FakeStreamResponse:
+    """Iterates over the response text in pieces, sleeping `delay` seconds before each."""
+
+    def __init__(self, text: str, prompt_tokens: int, pieces: int, delay: float):
+        self._text = text
+        self._pieces = max(1, pieces)
+        self._delay = delay
+        self.usage_metadata = _UsageMetadata(prompt_tokens, len(text) // 4)
+
+    def __iter__(self):
+        size = -(-len(self._text) // self._pieces)
+        for start in range(0, len(self._text), size):
+            if self._delay:
+                time.sleep(self._delay)
+            yield _FakeResponse(self._text[start:start + size], 0)
+
+
+class FakeGenerativeModel:
+    """
+    Deterministic replacement for genai.GenerativeModel.
+
+    Every "date | start | [end |] title" line of the prompt (the way doc tables and sheet
+    rows are flattened) becomes one event. Each call sleeps for latency seconds plus
+    latency_per_kchar seconds per 1000 prompt characters, roughly like a real model. With
+    stream=True, the second part is spread over the pieces of the response.
+    """
+
+    def __init__(self, latency: float = 0.0, latency_per_kchar: float = 0.0):
+        self.latency = latency
+        self.latency_per_kchar = latency_per_kchar
+        self.calls = 0
+        self.prompt_chars = 0
+        self._lock = threading.Lock()
+
+    def generate_content(self, prompt: str, stream: bool = False, **kwargs):
+        with self._lock:
+            self.calls += 1
+            self.prompt_chars += len(prompt)
+        # Streamed responses arrive after the fixed latency, then in pieces over the rest.
+        generation_delay = self.latency_per_kchar * len(prompt) / 1000
+        delay = self.latency + (0 if stream else generation_delay)
+        if delay:
+            time.sleep(delay)
+
+        events = []
+        for date, start, end, title in _SCHEDULE_LINE_RE.findall(prompt):
+            start_hour, start_minute = start.split(":")
+            end = end or f"{int(start_hour) + 1}:{start_minute}"
+            events.append({
+                "summary": title.strip(),
+                "start_datetime": f"{date}T{int(start_hour):02d}:{start_minute}:00",
+                "end_datetime": f"{date}T{int(end.split(':')[0]):02d}:{end.split(':')[1]}:00",
+                "description": "",
+            })
+        if stream:
+            pieces = max(1, len(events))
+            return _FakeStreamResponse(json.dumps(events), len(prompt) // 4, pieces, generation_delay / pieces)
+        return _FakeResponse(json.dumps(events), len(prompt) // 4)
@@ -0,0 +1,374 @@
+import contextvars
+import hashlib
+import os
+import queue
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+from datetime import datetime, timezone as dt_timezone
+from zoneinfo import ZoneInfo
+from googleapiclient.errors import HttpError
+from google_services import CALENDAR_BATCH_SIZE, create_calendar_events_batch, update_calendar_events_batch
+from credential_store import current_user
+
+INDEX_PATH = os.path.join(".cache", "calendar_index.sqlite")
+# Each signed-in user gets an index of their own ("primary" is a different calendar for each).
+USER_INDEX_DIR = os.path.join(".cache", "calendar_index")
+SYNC_PAGE_SIZE = 2500
+SYNC_FIELDS = "items(id,status,summary,description,start,end,recurrence),nextPageToken,nextSyncToken"
+
+
+def normalize_summary(summary) -> str:
+    return " ".join(str(summary or "").split()).casefold()
+
+
+def to_utc(value, timezone: str = None) -> str:
+    """
+    Normalizes a start/end value to a UTC ISO string so that "2025-03-05T10:00:00" in
+    Europe/Berlin and "2025-03-05T09:00:00Z" compare equal. Dates (all-day) are kept as is.
+    """
+    if not value:
+        return ""
+    try:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return str(value)
+    if len(str(value)) <= 10:
+        return moment.date().isoformat()
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=ZoneInfo(timezone) if timezone else dt_timezone.utc)
+    return moment.astimezone(dt_timezone.utc).strftime("%Y-%m-%dT%H:%M:%SZ")
+
+
+def event_fingerprint(summary, start_utc: str) -> str:
+    """Identifies an event by its normalized summary and UTC start."""
+    return hashlib.sha1(f"{normalize_summary(summary)}|{start_utc}".encode("utf-8")).hexdigest()
+
+
+def _recurrence_text(recurrence) -> str:
+    """RRULE/EXDATE lines of a recurring event as one comparable string ("" for single events)."""
+    return "\n".join(recurrence or [])
+
+
+def _resource_time(value: dict) -> str:
+    value = value or {}
+    return to_utc(value.get("dateTime") or value.get("date"), value.get("timeZone"))
+
+
+class CalendarIndex:
+    """
+    Local, per-calendar index of the events already in Google Calendar.
+
+    It is filled by one full sync and then kept current with the Calendar API's
+    incremental syncToken. Events are indexed (SQLite B-trees) by fingerprint and by
+    start time, so looking up whether an extracted event already exists is O(log n).
+    """
+
+    def __init__(self, path: str = INDEX_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS events ("
+                " calendar_id TEXT NOT NULL,"
+                " event_id TEXT NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " start_utc TEXT NOT NULL,"
+                " end_utc TEXT NOT NULL,"
+                " summary TEXT,"
+                " description TEXT,"
+                " recurrence TEXT,"
+                " PRIMARY KEY (calendar_id, event_id))"
+            )
+            columns = {row["name"] for row in conn.execute("PRAGMA table_info(events)")}
+            if "recurrence" not in columns:
+                # Indexes created before recurring events were written.
+                conn.execute("ALTER TABLE events ADD COLUMN recurrence TEXT")
+            conn.execute("CREATE INDEX IF NOT EXISTS events_fingerprint ON events (calendar_id, fingerprint)")
+            conn.execute("CREATE INDEX IF NOT EXISTS events_start ON events (calendar_id, start_utc)")
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS sync_state ("
+                " calendar_id TEXT PRIMARY KEY,"
+                " sync_token TEXT,"
+                " synced_at REAL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        conn.row_factory = sqlite3.Row
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def sync(self, service, calendar_id: str) -> int:
+        """
+        Brings the index of calendar_id up to date: a full listing the first time (or when
+        Google expires the sync token), only the changes since the last sync afterwards.
+        Returns the number of changed events received.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT sync_token FROM sync_state WHERE calendar_id = ?", (calendar_id,)).fetchone()
+        sync_token = row["sync_token"] if row else None
+
+        try:
+            return self._sync_pages(service, calendar_id, sync_token)
+        except HttpError as e:
+            if e.resp.status != 410 or sync_token is None:
+                raise
+            print(f"🔄 Sync token for calendar '{calendar_id}' expired; running a full sync.")
+            return self._sync_pages(service, calendar_id, None)
+
+    def _sync_pages(self, service, calendar_id: str, sync_token: str) -> int:
+        params = {"calendarId": calendar_id, "maxResults": SYNC_PAGE_SIZE, "fields": SYNC_FIELDS}
+        if sync_token:
+            params["syncToken"] = sync_token
+        else:
+            print(f"🔄 Running a full sync of calendar '{calendar_id}'...")
+
+        items = []
+        page_token = None
+        while True:
+            response = service.events().list(pageToken=page_token, **params).execute()
+            items.extend(response.get("items", []))
+            page_token = response.get("nextPageToken")
+            if not page_token:
+                break
+
+        with self._lock, self._connect() as conn:
+            if not sync_token:
+                conn.execute("DELETE FROM events WHERE calendar_id = ?", (calendar_id,))
+            for item in items:
+                if item.get("status") == "cancelled":
+                    conn.execute("DELETE FROM events WHERE calendar_id = ? AND event_id = ?", (calendar_id, item["id"]))
+                    continue
+                start_utc = _resource_time(item.get("start"))
+                self._store(conn, calendar_id, item["id"], item.get("summary"), start_utc,
+                            _resource_time(item.get("end")), item.get("description"), item.get("recurrence"))
+            conn.execute(
+                "INSERT OR REPLACE INTO sync_state (calendar_id, sync_token, synced_at) VALUES (?, ?, ?)",
+                (calendar_id, response.get("nextSyncToken"), time.time()),
+            )
+        return len(items)
+
+    @staticmethod
+    def _store(conn, calendar_id, event_id, summary, start_utc, end_utc, description, recurrence=None):
+        conn.execute(
+            "INSERT OR REPLACE INTO events"
+            " (calendar_id, event_id, fingerprint, start_utc, end_utc, summary, description, recurrence)"
+            " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+            (calendar_id, event_id, event_fingerprint(summary, start_utc), start_utc, end_utc, summary, description,
+             _recurrence_text(recurrence)),
+        )
+
+    def record(self, calendar_id: str, event_id: str, event: dict, timezone: str):
+        """Adds or replaces an event we just wrote, without waiting for the next sync."""
+        self.record_many(calendar_id, [(event_id, event)], timezone)
+
+    def record_many(self, calendar_id: str, written: list, timezone: str):
+        """Adds or replaces (event_id, event) pairs we just wrote, in a single transaction."""
+        with self._lock, self._connect() as conn:
+            for event_id, event in written:
+                self._store(conn, calendar_id, event_id, event.get("summary"),
+                            to_utc(event.get("start_datetime"), timezone), to_utc(event.get("end_datetime"), timezone),
+                            event.get("description"), event.get("recurrence"))
+
+    def forget(self, calendar_id: str, event_ids: list):
+        """Removes events we just deleted, without waiting for the next sync."""
+        with self._lock, self._connect() as conn:
+            conn.executemany("DELETE FROM events WHERE calendar_id = ? AND event_id = ?",
+                             [(calendar_id, event_id) for event_id in event_ids])
+
+    def find(self, calendar_id: str, fingerprint: str):
+        """Returns the indexed event with this fingerprint as a dict, or None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT * FROM events WHERE calendar_id = ? AND fingerprint = ? LIMIT 1",
+                (calendar_id, fingerprint),
+            ).fetchone()
+        return dict(row) if row else None
+
+    def events_between(self, calendar_id: str, start_utc: str, end_utc: str) -> list:
+        """Returns the indexed events starting in [start_utc, end_utc), ordered by start."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute(
+                "SELECT * FROM events WHERE calendar_id = ? AND start_utc >= ? AND start_utc < ? ORDER BY start_utc",
+                (calendar_id, start_utc, end_utc),
+            ).fetchall()
+        return [dict(row) for row in rows]
+
+    def plan(self, calendar_id: str, events: list, timezone: str) -> tuple:
+        """
+        Splits events into (inserts, updates, unchanged) against the index.
+        A recurring event is matched by its first occurrence and updated when its recurrence changed.
+        inserts and unchanged hold input indexes; updates holds (input index, event_id) pairs.
+        Events repeated within the input count as unchanged after their first occurrence.
+        """
+        inserts, updates, unchanged = [], [], []
+        seen = set()
+        with self._lock, self._connect() as conn:
+            planned = []
+            for i, event in enumerate(events):
+                start_utc = to_utc(event.get("start_datetime"), timezone)
+                fingerprint = event_fingerprint(event.get("summary"), start_utc)
+                if fingerprint in seen:
+                    unchanged.append(i)
+                    continue
+                seen.add(fingerprint)
+                row = conn.execute(
+                    "SELECT * FROM events WHERE calendar_id = ? AND fingerprint = ? LIMIT 1",
+                    (calendar_id, fingerprint),
+                ).fetchone()
+                planned.append((i, event, dict(row) if row else None))
+
+        for i, event, existing in planned:
+            if existing is None:
+                inserts.append(i)
+            elif (existing["end_utc"] == to_utc(event.get("end_datetime"), timezone)
+                  and (existing["description"] or "") == (event.get("description") or "")
+                  and (existing["recurrence"] or "") == _recurrence_text(event.get("recurrence"))):
+                unchanged.append(i)
+            else:
+                updates.append((i, existing["event_id"]))
+        return inserts, updates, unchanged
+
+
+_calendar_index = None
+_user_calendar_indexes = {}
+_calendar_index_lock = threading.Lock()
+
+
+def get_calendar_index() -> CalendarIndex:
+    """Returns the calendar index of the current user (or the process-wide one), creating it on first use."""
+    global _calendar_index
+    user_id = current_user()
+    with _calendar_index_lock:
+        if user_id is not None:
+            index = _user_calendar_indexes.get(user_id)
+            if index is None:
+                name = hashlib.sha1(user_id.encode("utf-8")).hexdigest()[:16]
+                index = _user_calendar_indexes[user_id] = CalendarIndex(os.path.join(USER_INDEX_DIR, f"{name}.sqlite"))
+            return index
+        if _calendar_index is None:
+            _calendar_index = CalendarIndex()
+        return _calendar_index
+
+
+def upsert_calendar_events(service, calendar_id: str, events: list, timezone: str, sync: bool = True) -> list:
+    """
+    Creates the events that are not in the calendar yet, updates the ones whose end
+    time or description changed and skips the rest, so re-importing a document only
+    sends what changed. With sync=False the calendar index is used without asking
+    the API for changes first (for callers that just synced it).
+
+    Returns:
+        List with one result dict per input event, in input order, with the keys
+        'summary', 'action' ('created', 'updated' or 'unchanged'), 'ok', 'id', 'htmlLink' and 'error'.
+    """
+    index = get_calendar_index()
+    if sync:
+        try:
+            index.sync(service, calendar_id)
+        except Exception as e:
+            print(f"⚠️ Could not sync the calendar index, events may be duplicated: {e}")
+
+    inserts, updates, unchanged = index.plan(calendar_id, events, timezone)
+    results = [None] * len(events)
+
+    for i in unchanged:
+        results[i] = {'summary': events[i].get('summary'), 'action': 'unchanged', 'ok': True,
+                      'id': None, 'htmlLink': None, 'error': None}
+
+    if inserts:
+        created = create_calendar_events_batch(service, calendar_id, [events[i] for i in inserts], timezone)
+        for i, result in zip(inserts, created):
+            results[i] = dict(result, action='created')
+        index.record_many(calendar_id, [(r['id'], events[i]) for i, r in zip(inserts, created) if r['ok']], timezone)
+
+    if updates:
+        updated = update_calendar_events_batch(
+            service, calendar_id, [(event_id, events[i]) for i, event_id in updates], timezone
+        )
+        for (i, _), result in zip(updates, updated):
+            results[i] = dict(result, action='updated')
+        index.record_many(calendar_id, [(r['id'], events[i]) for (i, _), r in zip(updates, updated) if r['ok']],
+                          timezone)
+
+    print(f"📅 Calendar '{calendar_id}': {len(inserts)} created, {len(updates)} updated, "
+          f"{len(unchanged)} already up to date.")
+    return results
+
+
+def upsert_calendar_event(service, calendar_id: str, event: dict, timezone: str) -> dict:
+    """Creates or updates a single event (see upsert_calendar_events). Returns its result dict."""
+    return upsert_calendar_events(service, calendar_id, [event], timezone)[0]
+
+
+class PipelinedUpsert:
+    """
+    Upserts events while they are still being produced, e.g. streamed out of Gemini by
+    ai_event_extractor.iter_events_from_text. add() queues an event; a writer thread
+    sends whatever has queued up (up to CALENDAR_BATCH_SIZE events) through
+    upsert_calendar_events, so the first events are written while later ones are being
+    generated. close() waits for the writer and returns the results in add() order.
+    The calendar index is synced before the first write only; later writes rely on
+    the index recording our own inserts and updates. An optional lock is held around
+    each write, to serialize writers of the same calendar.
+    """
+
+    _DONE = object()
+
+    def __init__(self, service, calendar_id: str, timezone: str, lock=None):
+        self.service = service
+        self.calendar_id = calendar_id
+        self.timezone = timezone
+        self.lock = lock
+        self.results = []
+        self._queue = queue.Queue()
+        self._error = None
+        # Run the writer in the caller's context, so it writes to the same user's calendar index.
+        context = contextvars.copy_context()
+        self._writer = threading.Thread(target=context.run, args=(self._run,), name="calendar-upsert", daemon=True)
+        self._writer.start()
+
+    def add(self, event: dict):
+        self._queue.put(event)
+
+    def close(self) -> list:
+        self._queue.put(self._DONE)
+        self._writer.join()
+        if self._error is not None:
+            raise self._error
+        return self.results
+
+    def _run(self):
+        done = False
+        synced = False
+        while not done:
+            group = []
+            item = self._queue.get()
+            while item is not self._DONE:
+                group.append(item)
+                if len(group) >= CALENDAR_BATCH_SIZE:
+                    break
+                try:
+                    item = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+            done = item is self._DONE
+            if not group or self._error is not None:
+                continue
+            try:
+                with self.lock or nullcontext():
+                    self.results.extend(upsert_calendar_events(self.service, self.calendar_id, group,
+                                                               self.timezone, sync=not synced))
+                synced = True
+            except Exception as e:
+                self._error = e
@@ -0,0 +1,174 @@
+"""
+Token-bounded conversation memory for the calendar agent.
+
+The agent gets the conversation as chat_history on every turn. Sending all of it makes
+each prompt longer than the last, so ChatMemory keeps it under a fixed token budget:
+
+- the most recent turns are kept verbatim, including their tool calls;
+- tool outputs longer than TOOL_OUTPUT_MAX_CHARS (full document text, sheet dumps)
+  are replaced by a short preview and a note that the tool can be called again;
+- turns that no longer fit are folded into a rolling summary, which the chat model
+  writes in a background thread so the user never waits for it. Until it is ready,
+  a short excerpt of the folded turns stands in for it.
+"""
+import json
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from langchain.agents.format_scratchpad.tools import format_to_tool_messages
+from langchain_core.messages import AIMessage, HumanMessage
+from tracing import count, span
+
+DEFAULT_TOKEN_BUDGET = 4000
+# Part of the budget reserved for the rolling summary.
+SUMMARY_MAX_TOKENS = 600
+# Turns kept verbatim even when they alone exceed the budget.
+MIN_RECENT_TURNS = 1
+TOOL_OUTPUT_MAX_CHARS = 600
+TOOL_OUTPUT_PREVIEW_CHARS = 200
+EXCERPT_CHARS = 200
+# Rough size of a Gemini token; exact counts would need a round trip to the API.
+CHARS_PER_TOKEN = 4
+
+SUMMARY_PROMPT = """Update the summary of a conversation between a user and a calendar assistant.
+Keep what later requests may refer to: document and sheet IDs, calendar IDs, events that were
+found, created or changed (with dates), and open questions. Write at most {max_words} words.
+
+Current summary:
+{summary}
+
+New conversation turns:
+{turns}
+
+Updated summary:"""
+
+# Summaries of all sessions share a couple of threads; a summary is never urgent.
+_summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="chat-summary")
+
+
+def message_text(content) -> str:
+    """Gemini may return content as a list of parts; joins their text."""
+    if isinstance(content, list):
+        return "".join(part.get("text", "") if isinstance(part, dict) else str(part) for part in content)
+    return content or ""
+
+
+def estimate_tokens(messages: list) -> int:
+    chars = 0
+    for message in messages:
+        chars += len(message_text(message.content))
+        for tool_call in getattr(message, "tool_calls", None) or []:
+            chars += len(tool_call["name"]) + len(json.dumps(tool_call["args"], ensure_ascii=False))
+    return chars // CHARS_PER_TOKEN + 1
+
+
+def elide_tool_output(tool_name: str, output) -> str:
+    """Shortens a large tool output to a preview that tells the model how to get the rest."""
+    output = output if isinstance(output, str) else str(output)
+    if len(output) <= TOOL_OUTPUT_MAX_CHARS:
+        return output
+    return (f"{output[:TOOL_OUTPUT_PREVIEW_CHARS]}... [{len(output) - TOOL_OUTPUT_PREVIEW_CHARS} more characters "
+            f"left out of the conversation memory; call {tool_name} again if you need them]")
+
+
+@dataclass
+class _Turn:
+    user: str
+    answer: str
+    messages: list = field(default_factory=list)
+    tokens: int = 0
+
+    def excerpt(self) -> str:
+        return f"User: {self.user[:EXCERPT_CHARS]}\nAssistant: {self.answer[:EXCERPT_CHARS]}"
+
+
+class ChatMemory:
+    """
+    Conversation history for one chat session, bounded to max_tokens.
+
+    Call messages() for the chat_history of the next agent run and add_turn() with the
+    run's input, intermediate steps and output afterwards. Without an llm, folded
+    turns are only kept as short excerpts.
+    """
+
+    def __init__(self, llm=None, max_tokens: int = DEFAULT_TOKEN_BUDGET):
+        self.llm = llm
+        self.max_tokens = max_tokens
+        self.summary = ""
+        self._turns = []
+        self._unsummarized = []
+        self._summarizing = False
+        self._lock = threading.Lock()
+
+    def add_turn(self, user_input: str, intermediate_steps: list, output):
+        """Records a finished agent run; folds the oldest turns away when over budget."""
+        answer = message_text(output)
+        steps = [(action, elide_tool_output(action.tool, observation))
+                 for action, observation in intermediate_steps or []]
+        messages = [HumanMessage(content=user_input), *format_to_tool_messages(steps), AIMessage(content=answer)]
+        turn = _Turn(user=user_input, answer=answer, messages=messages, tokens=estimate_tokens(messages))
+
+        with self._lock:
+            self._turns.append(turn)
+            recent_budget = self.max_tokens - SUMMARY_MAX_TOKENS
+            folded = []
+            while len(self._turns) > MIN_RECENT_TURNS and sum(t.tokens for t in self._turns) > recent_budget:
+                folded.append(self._turns.pop(0))
+            if not folded:
+                return
+            self._unsummarized.extend(folded)
+            count("chat_memory_folded_turns", len(folded))
+            self._schedule_summary()
+
+    def messages(self) -> list:
+        """The chat_history for the next agent run: the summary, then the recent turns verbatim."""
+        with self._lock:
+            history = []
+            summary = self._summary_text()
+            if summary:
+                history.append(AIMessage(content=f"Summary of our earlier conversation:\n{summary}"))
+            for turn in self._turns:
+                history.extend(turn.messages)
+            return history
+
+    def token_estimate(self) -> int:
+        return estimate_tokens(self.messages())
+
+    def _summary_text(self) -> str:
+        """The rolling summary plus excerpts of folded turns it doesn't cover yet, within its budget."""
+        parts = [self.summary] if self.summary else []
+        parts.extend(turn.excerpt() for turn in self._unsummarized)
+        text = "\n\n".join(parts)
+        limit = SUMMARY_MAX_TOKENS * CHARS_PER_TOKEN
+        # Drop the oldest part first: the latest folded turns are the likeliest to be referred to.
+        return text if len(text) <= limit else "..." + text[-limit:]
+
+    def _schedule_summary(self):
+        # Called with the lock held. One summary runs at a time per session; turns folded
+        # meanwhile are picked up by the next one.
+        if self.llm is None or self._summarizing or not self._unsummarized:
+            return
+        self._summarizing = True
+        _summary_executor.submit(self._summarize, self.summary, list(self._unsummarized))
+
+    def _summarize(self, summary: str, turns: list):
+        prompt = SUMMARY_PROMPT.format(
+            max_words=SUMMARY_MAX_TOKENS * 3 // 4,
+            summary=summary or "(none)",
+            turns="\n\n".join(turn.excerpt() for turn in turns),
+        )
+        new_summary = None
+        with span("chat_memory.summarize", turns=len(turns)) as current:
+            try:
+                new_summary = message_text(self.llm.invoke(prompt).content).strip()
+                current.set(summary_chars=len(new_summary))
+            except Exception as e:
+                current.set(error=str(e))
+                print(f"⚠️ Could not summarize the earlier conversation: {e}")
+
+        with self._lock:
+            self._summarizing = False
+            if new_summary:
+                self.summary = new_summary
+                del self._unsummarized[:len(turns)]
+                self._schedule_summary()
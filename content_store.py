@@ -0,0 +1,103 @@
+"""
+In-process store of document content for the agent tools.
+
+Read tools put the text they fetched here and hand the agent a short handle with a
+preview instead of the whole text. Tools that analyze content accept the handle and
+resolve it locally, so a large document doesn't pass through the model's context
+(and its output, when the model copies it into the next tool call) at all.
+"""
+import hashlib
+import re
+import threading
+from collections import OrderedDict
+from credential_store import current_user
+
+# Oldest entries are dropped once the store holds more than this many characters.
+MAX_TOTAL_CHARS = 20_000_000
+PREVIEW_CHARS = 500
+CHARS_PER_TOKEN = 4
+
+HANDLE_RE = re.compile(r"^(doc|sheet|text):[0-9a-f]{12}$")
+
+
+class UnknownHandleError(KeyError):
+    """The handle was never issued by this process or its content has been evicted."""
+
+
+class ContentStore:
+    """
+    LRU map from handles to text, bounded by total size.
+    Entries belong to the user that stored them; other users can't resolve their handles.
+    """
+
+    def __init__(self, max_total_chars: int = MAX_TOTAL_CHARS):
+        self.max_total_chars = max_total_chars
+        self._entries = OrderedDict()
+        self._total_chars = 0
+        self._lock = threading.Lock()
+
+    def put(self, kind: str, text: str) -> str:
+        """Stores text and returns its handle. The same user storing the same text gets the same handle."""
+        owner = current_user() or ""
+        digest = hashlib.sha1(f"{owner}\0{text}".encode("utf-8")).hexdigest()[:12]
+        handle = f"{kind}:{digest}"
+        with self._lock:
+            if handle in self._entries:
+                self._entries.move_to_end(handle)
+                return handle
+            self._entries[handle] = (owner, text)
+            self._total_chars += len(text)
+            while self._total_chars > self.max_total_chars and len(self._entries) > 1:
+                _, (_, evicted) = self._entries.popitem(last=False)
+                self._total_chars -= len(evicted)
+        return handle
+
+    def get(self, handle: str) -> str:
+        with self._lock:
+            owner, text = self._entries.get(handle, (None, None))
+            if text is None or owner != (current_user() or ""):
+                raise UnknownHandleError(handle)
+            self._entries.move_to_end(handle)
+            return text
+
+
+_content_store = None
+_content_store_lock = threading.Lock()
+
+
+def get_content_store() -> ContentStore:
+    """Returns the process-wide content store, creating it on first use."""
+    global _content_store
+    with _content_store_lock:
+        if _content_store is None:
+            _content_store = ContentStore()
+        return _content_store
+
+
+def is_handle(value: str) -> bool:
+    return isinstance(value, str) and HANDLE_RE.match(value.strip()) is not None
+
+
+def resolve_content(value: str) -> str:
+    """
+    Returns the text behind a handle. Anything that isn't a handle is returned as is,
+    so tools keep working when the model passes the text itself.
+    Raises UnknownHandleError for handles that are not (or no longer) in the store.
+    """
+    if is_handle(value):
+        return get_content_store().get(value.strip())
+    return value
+
+
+def describe_content(handle: str, text: str, title: str) -> str:
+    """The tool output for stored content: the handle, a few statistics and the beginning of the text."""
+    lines = text.count("\n") + 1 if text else 0
+    preview = text[:PREVIEW_CHARS]
+    more = f"\n... ({len(text) - PREVIEW_CHARS} more characters)" if len(text) > PREVIEW_CHARS else ""
+    return (
+        f"{title}\n"
+        f"Content handle: {handle}\n"
+        f"Size: {len(text)} characters, {lines} lines, about {len(text) // CHARS_PER_TOKEN} tokens.\n"
+        f"Pass the handle (not the text) to extract_events_from_document_text or read_content_excerpt.\n"
+        f"Preview:\n{preview}{more}"
+    )
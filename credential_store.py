@@ -0,0 +1,133 @@
+"""
+Per-user Google credentials for serving many users from one process.
+
+Tokens are kept in SQLite, encrypted with Fernet (AES plus HMAC from the cryptography
+package). The key comes from the CREDENTIAL_STORE_KEY environment variable. Without
+one, a key is generated on first use and saved next to the database, readable by the
+owner only. Set the variable in production, so that a copy of .cache alone doesn't
+expose the tokens.
+
+Which user the current request belongs to is tracked in a context variable, so code
+deep in the call stack (tool functions, the calendar index) can pick that user's
+clients and data without passing the user around. asyncio tasks inherit it; thread
+pools need contextvars.copy_context() (see agent_tools._make_async).
+"""
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+STORE_PATH = os.path.join(".cache", "credentials.sqlite")
+KEY_PATH = os.path.join(".cache", "credential_store.key")
+KEY_ENV = "CREDENTIAL_STORE_KEY"
+
+_current_user = ContextVar("google_user", default=None)
+
+
+def current_user():
+    """The user whose Google account the current request acts on, or None in single-user mode."""
+    return _current_user.get()
+
+
+def set_current_user(user_id):
+    """Sets the current user for this context (e.g. one Streamlit script run). Returns a reset token."""
+    return _current_user.set(user_id)
+
+
+@contextmanager
+def use_user(user_id):
+    """Makes user_id the current user inside the with block."""
+    token = _current_user.set(user_id)
+    try:
+        yield
+    finally:
+        _current_user.reset(token)
+
+
+def _load_key(key_path: str) -> bytes:
+    key = os.getenv(KEY_ENV)
+    if key:
+        return key.encode("ascii")
+    from cryptography.fernet import Fernet
+    if os.path.exists(key_path):
+        with open(key_path, "rb") as f:
+            return f.read().strip()
+    print(f"⚠️ {KEY_ENV} is not set; generating a local key in {key_path}.")
+    key = Fernet.generate_key()
+    directory = os.path.dirname(key_path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    descriptor = os.open(key_path, os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+    with os.fdopen(descriptor, "wb") as f:
+        f.write(key)
+    return key
+
+
+class CredentialStore:
+    """SQLite table of encrypted authorized-user tokens, keyed by user ID (the account's email)."""
+
+    def __init__(self, path: str = STORE_PATH, key: bytes = None, key_path: str = KEY_PATH):
+        from cryptography.fernet import Fernet
+        self.path = path
+        self._fernet = Fernet(key or _load_key(key_path))
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS tokens ("
+                " user_id TEXT PRIMARY KEY,"
+                " token BLOB NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, user_id: str) -> dict:
+        """Returns the stored token info (the authorized-user JSON as a dict), or None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT token FROM tokens WHERE user_id = ?", (user_id,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(self._fernet.decrypt(row[0]))
+
+    def put(self, user_id: str, token_info: dict):
+        token = self._fernet.encrypt(json.dumps(token_info).encode("utf-8"))
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO tokens (user_id, token, updated_at) VALUES (?, ?, ?)",
+                (user_id, token, time.time()),
+            )
+
+    def delete(self, user_id: str):
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM tokens WHERE user_id = ?", (user_id,))
+
+    def user_ids(self) -> list:
+        with self._lock, self._connect() as conn:
+            return [row[0] for row in conn.execute("SELECT user_id FROM tokens ORDER BY user_id")]
+
+
+_credential_store = None
+_credential_store_lock = threading.Lock()
+
+
+def get_credential_store() -> CredentialStore:
+    """Returns the process-wide credential store, creating it on first use."""
+    global _credential_store
+    with _credential_store_lock:
+        if _credential_store is None:
+            _credential_store = CredentialStore()
+        return _credential_store
@@ -0,0 +1,124 @@
+import re
+from dataclasses import dataclass
+
+# Lines kept before and after every line that mentions a date or time.
+DEFAULT_CONTEXT_LINES = 2
+GAP_MARKER = "[...]\n"
+
+_MONTHS = [
+    # English
+    r"jan(?:uary)?", r"feb(?:ruary)?", r"mar(?:ch)?", r"apr(?:il)?", r"june?", r"july?",
+    r"aug(?:ust)?", r"sep(?:t|tember)?", r"oct(?:ober)?", r"nov(?:ember)?", r"dec(?:ember)?",
+    # German
+    r"januar", r"februar", r"märz", r"juni", r"juli", r"oktober", r"dezember",
+    # French
+    r"janvier", r"février", r"mars", r"avril", r"mai", r"juin", r"juillet", r"août",
+    r"septembre", r"octobre", r"novembre", r"décembre",
+    # Spanish
+    r"enero", r"febrero", r"marzo", r"abril", r"mayo", r"junio", r"julio", r"agosto",
+    r"septiembre", r"octubre", r"noviembre", r"diciembre",
+    # Russian (stems cover all cases)
+    r"январ\w*", r"феврал\w*", r"март\w*", r"апрел\w*", r"ма[йя]", r"июн\w*", r"июл\w*",
+    r"август\w*", r"сентябр\w*", r"октябр\w*", r"ноябр\w*", r"декабр\w*",
+    # Ukrainian
+    r"січ\w*", r"лют\w*", r"берез\w*", r"квіт\w*", r"трав\w*", r"черв\w*", r"лип\w*",
+    r"серп\w*", r"верес\w*", r"жовт\w*", r"листопад\w*", r"груд\w*",
+]
+
+_WEEKDAYS = [
+    # English
+    r"mon(?:day)?", r"tue(?:s|sday)?", r"wed(?:nesday)?", r"thu(?:rs|rsday)?", r"fri(?:day)?",
+    r"sat(?:urday)?", r"sun(?:day)?",
+    # German
+    r"montag", r"dienstag", r"mittwoch", r"donnerstag", r"freitag", r"samstag", r"sonntag",
+    # French
+    r"lundi", r"mardi", r"mercredi", r"jeudi", r"vendredi", r"samedi", r"dimanche",
+    # Spanish
+    r"lunes", r"martes", r"miércoles", r"jueves", r"viernes", r"sábado", r"domingo",
+    # Russian
+    r"понедельник\w*", r"вторник\w*", r"сред[аыу]", r"четверг\w*", r"пятниц\w*", r"суббот\w*",
+    r"воскресень\w*",
+    # Ukrainian
+    r"понеділ\w*", r"вівтор\w*", r"серед\w*", r"четвер\w*", r"п[ʼ'’]?ятниц\w*", r"субот\w*", r"неділ\w*",
+]
+
+_RELATIVE_DAYS = [
+    r"today", r"tomorrow", r"tonight", r"next\s+week", r"heute", r"morgen", r"übermorgen",
+    r"aujourd['’]hui", r"demain", r"hoy", r"mañana", r"сегодня", r"завтра", r"послезавтра",
+    r"сьогодні", r"післязавтра",
+]
+
+_NUMERIC_PATTERNS = [
+    r"\d{4}-\d{1,2}-\d{1,2}",                    # 2025-03-14
+    r"\d{1,2}[./]\d{1,2}[./]\d{2,4}",            # 14.03.2025, 3/14/25
+    r"\d{1,2}/\d{1,2}",                          # 3/14
+    r"\d{1,2}:\d{2}",                            # 10:00, 9:30
+    r"\d{1,2}\s?(?:am|pm|a\.m\.|p\.m\.)",        # 3pm, 10 a.m.
+    r"\d{1,2}h(?:\d{2})?",                       # 14h, 14h30
+    r"\d{1,2}(?:st|nd|rd|th)",                   # 21st
+    r"noon|midnight",
+    r"may\s+\d{1,2}|\d{1,2}\s+may",             # "may" alone is too common a word
+]
+
+_CANDIDATE_RE = re.compile(
+    r"\b(?:"
+    + "|".join(_NUMERIC_PATTERNS)
+    + "|(?:" + "|".join(_MONTHS + _WEEKDAYS + _RELATIVE_DAYS) + r")\b"
+    + r")",
+    re.IGNORECASE,
+)
+
+
+@dataclass
+class PrefilterResult:
+    """Outcome of prefilter_text: the text to send on and how much it shrank."""
+    text: str
+    original_chars: int
+    kept_chars: int
+    candidate_lines: int
+    used_fallback: bool
+
+    @property
+    def reduction(self) -> float:
+        """Fraction of the input that was dropped (0.0 when nothing was)."""
+        if not self.original_chars:
+            return 0.0
+        return 1 - self.kept_chars / self.original_chars
+
+
+def has_date_or_time(line: str) -> bool:
+    """Returns True when the line contains a date, time, weekday or relative day expression."""
+    return _CANDIDATE_RE.search(line) is not None
+
+
+def prefilter_text(text: str, context_lines: int = DEFAULT_CONTEXT_LINES, head_lines: int = 1) -> PrefilterResult:
+    """
+    Keeps only the lines that mention dates or times, plus context_lines lines around each
+    of them and the first head_lines lines (titles, table headers). Dropped stretches are
+    replaced by GAP_MARKER. When no line mentions a date or time the full text is returned.
+    """
+    lines = text.splitlines(keepends=True)
+    keep = bytearray(len(lines))
+    candidates = 0
+    for i, line in enumerate(lines):
+        if _CANDIDATE_RE.search(line):
+            candidates += 1
+            start, end = max(0, i - context_lines), min(len(lines), i + context_lines + 1)
+            keep[start:end] = b"\x01" * (end - start)
+
+    if not candidates:
+        return PrefilterResult(text, len(text), len(text), 0, True)
+
+    keep[:head_lines] = b"\x01" * min(head_lines, len(lines))
+    parts = []
+    in_gap = False
+    for flag, line in zip(keep, lines):
+        if flag:
+            parts.append(line if line.endswith("\n") else line + "\n")
+            in_gap = False
+        elif not in_gap:
+            parts.append(GAP_MARKER)
+            in_gap = True
+
+    filtered = "".join(parts)
+    return PrefilterResult(filtered, len(text), len(filtered), candidates, False)
@@ -0,0 +1,130 @@
+from array import array
+from bisect import bisect_right
+
+CELL_SEPARATOR = " | "
+
+
+class DocOffsetMap:
+    """
+    Maps offsets in flattened document text back to the structural element they came from.
+
+    Spans are stored as parallel arrays: span i covers the output text from starts[i] up to
+    starts[i + 1] and was produced by the element starting at source_indexes[i] (the Docs API
+    startIndex, -1 when unknown) in the tab tab_ids[tab_indexes[i]].
+    """
+
+    def __init__(self):
+        self.starts = array('l')
+        self.source_indexes = array('l')
+        self.tab_indexes = array('l')
+        self.tab_ids = []
+
+    def __len__(self):
+        return len(self.starts)
+
+    def add_tab(self, tab_id: str) -> int:
+        self.tab_ids.append(tab_id)
+        return len(self.tab_ids) - 1
+
+    def add_span(self, output_start: int, source_index: int, tab_index: int):
+        self.starts.append(output_start)
+        self.source_indexes.append(source_index)
+        self.tab_indexes.append(tab_index)
+
+    def lookup(self, offset: int):
+        """Returns {'tab_id', 'start_index'} of the element that produced the text at offset."""
+        span = bisect_right(self.starts, offset) - 1
+        if span < 0:
+            return None
+        tab_index = self.tab_indexes[span]
+        return {
+            'tab_id': self.tab_ids[tab_index] if tab_index >= 0 else None,
+            'start_index': self.source_indexes[span],
+        }
+
+
+class _Flattener:
+    def __init__(self):
+        self.parts = []
+        self.position = 0
+        self.offsets = DocOffsetMap()
+
+    def emit(self, text: str, source_index: int, tab_index: int):
+        if not text:
+            return
+        self.offsets.add_span(self.position, source_index, tab_index)
+        self.parts.append(text)
+        self.position += len(text)
+
+    def trim_trailing_space(self):
+        # Only ever removes one character from the last part, so span starts stay valid.
+        if self.parts and self.parts[-1].endswith(" ") and len(self.parts[-1]) > 1:
+            self.parts[-1] = self.parts[-1][:-1]
+            self.position -= 1
+
+    def walk_content(self, content: list, tab_index: int, in_cell: bool = False):
+        for element in content:
+            if 'paragraph' in element:
+                for run in element['paragraph'].get('elements', []):
+                    text = run.get('textRun', {}).get('content')
+                    if not text:
+                        continue
+                    if in_cell:
+                        # Keep each table row on one line.
+                        text = text.replace("\n", " ")
+                    self.emit(text, run.get('startIndex', element.get('startIndex', -1)), tab_index)
+            elif 'table' in element:
+                self.walk_table(element, tab_index)
+            elif 'tableOfContents' in element:
+                self.walk_content(element['tableOfContents'].get('content', []), tab_index, in_cell)
+
+    def walk_table(self, element: dict, tab_index: int):
+        for row in element['table'].get('tableRows', []):
+            row_index = row.get('startIndex', element.get('startIndex', -1))
+            for column, cell in enumerate(row.get('tableCells', [])):
+                if column:
+                    self.emit(CELL_SEPARATOR, cell.get('startIndex', row_index), tab_index)
+                self.walk_content(cell.get('content', []), tab_index, in_cell=True)
+                self.trim_trailing_space()
+            self.emit("\n", row_index, tab_index)
+
+    def walk_tabs(self, tabs: list, show_titles: bool):
+        for tab in tabs:
+            properties = tab.get('tabProperties', {})
+            tab_index = self.offsets.add_tab(properties.get('tabId'))
+            if show_titles:
+                self.emit(f"=== {properties.get('title', 'Untitled tab')} ===\n", -1, tab_index)
+            body = tab.get('documentTab', {}).get('body', {})
+            self.walk_content(body.get('content', []), tab_index)
+            self.walk_tabs(tab.get('childTabs', []), show_titles)
+
+
+def format_table_rows(rows: list) -> str:
+    """Formats table rows (lists of cell strings) one per line, cells separated by CELL_SEPARATOR."""
+    return "".join(CELL_SEPARATOR.join(str(cell) for cell in row) + "\n" for row in rows)
+
+
+def _count_tabs(tabs: list) -> int:
+    return sum(1 + _count_tabs(tab.get('childTabs', [])) for tab in tabs)
+
+
+def flatten_document(document: dict) -> tuple:
+    """
+    Flattens a Docs API document resource into plain text in a single pass.
+
+    Paragraphs keep their own line breaks, each table row becomes one line with its cells
+    separated by CELL_SEPARATOR, and every tab (including child tabs) is visited when the
+    document was fetched with includeTabsContent=True. Multi-tab documents get a title line
+    before each tab.
+
+    Returns:
+        (text, DocOffsetMap) tuple
+    """
+    flattener = _Flattener()
+    tabs = document.get('tabs')
+    if tabs:
+        flattener.walk_tabs(tabs, show_titles=_count_tabs(tabs) > 1)
+    else:
+        tab_index = flattener.offsets.add_tab(None)
+        flattener.walk_content(document.get('body', {}).get('content', []), tab_index)
+    return "".join(flattener.parts), flattener.offsets
@@ -0,0 +1,149 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from google_services import (
+    get_google_doc_content,
+    get_google_doc_revision,
+    get_google_sheet_content,
+    get_drive_file_modified_time,
+    get_google_sheet_rows,
+)
+
+CACHE_PATH = os.path.join(".cache", "document_cache.sqlite")
+# Bump whenever the flattened text format changes so that old entries are not reused.
+CONTENT_FORMAT_VERSION = "3"
+
+
+class DocumentCache:
+    """
+    SQLite-backed cache of flattened document content.
+    Every entry remembers the version (Docs revisionId or Drive modifiedTime) it was
+    read at, and is only returned while the caller sees the same version.
+    """
+
+    def __init__(self, path: str = CACHE_PATH):
+        self.path = path
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS documents ("
+                " key TEXT PRIMARY KEY,"
+                " version TEXT NOT NULL,"
+                " content TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str, version: str):
+        """Returns the cached content for key if it was stored at version, else None."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT version, content FROM documents WHERE key = ?", (key,)).fetchone()
+            if row is None or row[0] != version:
+                self.misses += 1
+                return None
+            self.hits += 1
+            return row[1]
+
+    def put(self, key: str, version: str, content: str):
+        """Stores content for key at version, replacing any older entry."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO documents (key, version, content, updated_at) VALUES (?, ?, ?, ?)",
+                (key, version, content, time.time()),
+            )
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of stored documents."""
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM documents").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
+
+
+_document_cache = None
+_document_cache_lock = threading.Lock()
+
+
+def get_document_cache() -> DocumentCache:
+    """Returns the process-wide document cache, creating it on first use."""
+    global _document_cache
+    with _document_cache_lock:
+        if _document_cache is None:
+            _document_cache = DocumentCache()
+        return _document_cache
+
+
+def _read_through(key: str, version: str, fetch):
+    if not version:
+        # Without a version there is nothing to validate an entry against.
+        return fetch()
+
+    cache = get_document_cache()
+    version = f"{CONTENT_FORMAT_VERSION}:{version}"
+    content = cache.get(key, version)
+    if content is not None:
+        print(f"⚡ Using cached content for {key} (unchanged since last read).")
+        return content
+
+    content = fetch()
+    if content is not None:
+        cache.put(key, version, content)
+    return content
+
+
+def read_google_doc_cached(services: dict, document_id: str) -> str:
+    """
+    Returns the text of a Google Doc like get_google_doc_content, but only downloads
+    and flattens the body when its revisionId differs from the cached copy.
+    """
+    revision = get_google_doc_revision(services["docs"], document_id)
+    return _read_through(
+        f"doc:{document_id}",
+        revision,
+        lambda: get_google_doc_content(services["docs"], document_id),
+    )
+
+
+def read_google_sheet_cached(services: dict, spreadsheet_id: str, sheet_name: str = None,
+                             sheet_range: str = None) -> str:
+    """
+    Returns the content of a Google Sheet like get_google_sheet_content, but only
+    downloads the values when the spreadsheet's Drive modifiedTime has changed.
+    Without a sheet_range the whole sheet is read.
+    """
+    modified_time = get_drive_file_modified_time(services["drive"], spreadsheet_id)
+    return _read_through(
+        f"sheet:{spreadsheet_id}:{sheet_name or ''}:{sheet_range or '*'}",
+        modified_time,
+        lambda: get_google_sheet_content(services["sheets"], spreadsheet_id, sheet_name, sheet_range),
+    )
+
+
+def read_google_sheet_rows_cached(services: dict, spreadsheet_id: str, sheet_name: str = None) -> list:
+    """
+    Returns all rows of a sheet as lists of cell strings, downloading them only when the
+    spreadsheet's Drive modifiedTime has changed. Returns None on error.
+    """
+    def fetch():
+        rows = get_google_sheet_rows(services["sheets"], spreadsheet_id, sheet_name)
+        return json.dumps(rows, ensure_ascii=False) if rows is not None else None
+
+    modified_time = get_drive_file_modified_time(services["drive"], spreadsheet_id)
+    content = _read_through(f"sheet-rows:{spreadsheet_id}:{sheet_name or ''}", modified_time, fetch)
+    return json.loads(content) if content is not None else None
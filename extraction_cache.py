@@ -0,0 +1,106 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+
+CACHE_PATH = os.path.join(".cache", "extraction_cache.sqlite")
+CACHE_MAX_ENTRIES = 5000
+CACHE_MAX_AGE_SECONDS = 30 * 24 * 3600
+
+
+def normalize_text(text: str) -> str:
+    """Collapses whitespace so that formatting-only differences map to the same key."""
+    return " ".join((text or "").split())
+
+
+def make_cache_key(text: str, user_query: str, model_name: str, prompt_version: str, today: str) -> str:
+    """Returns the content address of an extraction request."""
+    payload = json.dumps(
+        [normalize_text(text), normalize_text(user_query), model_name, prompt_version, today],
+        ensure_ascii=False,
+    )
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class ExtractionCache:
+    """
+    SQLite-backed cache of Gemini extraction results keyed by make_cache_key().
+    Entries older than max_age_seconds are dropped, and the least recently used
+    entries are evicted once there are more than max_entries.
+    """
+
+    def __init__(self, path: str = CACHE_PATH, max_entries: int = CACHE_MAX_ENTRIES,
+                 max_age_seconds: float = CACHE_MAX_AGE_SECONDS):
+        self.path = path
+        self.max_entries = max_entries
+        self.max_age_seconds = max_age_seconds
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS extractions ("
+                " key TEXT PRIMARY KEY,"
+                " events TEXT NOT NULL,"
+                " created_at REAL NOT NULL,"
+                " last_used REAL NOT NULL)"
+            )
+            conn.execute("CREATE INDEX IF NOT EXISTS extractions_last_used ON extractions (last_used)")
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def get(self, key: str):
+        """Returns the cached event list for key, or None on a miss."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT events, created_at FROM extractions WHERE key = ?", (key,)).fetchone()
+            if row is None or now - row[1] > self.max_age_seconds:
+                if row is not None:
+                    conn.execute("DELETE FROM extractions WHERE key = ?", (key,))
+                self.misses += 1
+                return None
+            conn.execute("UPDATE extractions SET last_used = ? WHERE key = ?", (now, key))
+            self.hits += 1
+        return json.loads(row[0])
+
+    def put(self, key: str, events: list):
+        """Stores the event list for key and applies the eviction policy."""
+        now = time.time()
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO extractions (key, events, created_at, last_used) VALUES (?, ?, ?, ?)",
+                (key, json.dumps(events, ensure_ascii=False), now, now),
+            )
+            conn.execute("DELETE FROM extractions WHERE created_at < ?", (now - self.max_age_seconds,))
+            count = conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+            if count > self.max_entries:
+                conn.execute(
+                    "DELETE FROM extractions WHERE key IN"
+                    " (SELECT key FROM extractions ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+
+    def clear(self):
+        """Removes every cached entry."""
+        with self._lock, self._connect() as conn:
+            conn.execute("DELETE FROM extractions")
+
+    def stats(self) -> dict:
+        """Returns hit/miss counters and the number of stored entries."""
+        with self._lock, self._connect() as conn:
+            entries = conn.execute("SELECT COUNT(*) FROM extractions").fetchone()[0]
+        return {"hits": self.hits, "misses": self.misses, "entries": entries}
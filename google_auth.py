@@ -1,45 +1,408 @@
+import functools
+import json
 import os.path
-from google.auth.transport.requests import Request
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+import httplib2
+from google_auth_httplib2 import AuthorizedHttp
 from google.oauth2.credentials import Credentials
-from google_auth_oauthlib.flow import InstalledAppFlow
-from googleapiclient.discovery import build
+from googleapiclient import discovery_cache
+from googleapiclient.discovery import build_from_document
+from googleapiclient.http import HttpRequest
+from tracing import span, count, tracing_enabled
+from rate_limiter import call_with_backoff
+from credential_store import current_user, get_credential_store
 
 SCOPES = [
     "https://www.googleapis.com/auth/documents.readonly",
     "https://www.googleapis.com/auth/spreadsheets.readonly",
     "https://www.googleapis.com/auth/calendar",
+    "https://www.googleapis.com/auth/drive.metadata.readonly",
 ]
 
-def get_google_services():
+TOKEN_FILE = "token.json"
+CREDENTIALS_FILE = "credentials.json"
+
+# API name -> version of every client the pool builds.
+SERVICE_VERSIONS = {
+    "calendar": "v3",
+    "docs": "v1",
+    "sheets": "v4",
+    "drive": "v3",
+}
+
+DISCOVERY_CACHE_DIR = os.path.join(".cache", "discovery")
+DISCOVERY_URL = "https://{api}.googleapis.com/$discovery/rest?version={version}"
+
+# Refresh the access token this long before it actually expires.
+REFRESH_MARGIN = timedelta(minutes=5)
+REFRESH_RETRY_SECONDS = 60
+
+# At most this many per-user pools are kept; the least recently used one is dropped first.
+MAX_USER_POOLS = int(os.getenv("GOOGLE_USER_POOLS_MAX", "256"))
+# A web sign-in must be completed within this many seconds of starting it.
+OAUTH_STATE_TTL_SECONDS = 600
+
+
+def _auth_request():
+    # google.auth.transport.requests pulls in requests and urllib3; only token refreshes need it.
+    from google.auth.transport.requests import Request
+    return Request()
+
+
+def load_credentials():
     """
-    Handles user authentication and builds service objects for Google APIs.
-    Returns a dictionary of service objects for Calendar, Docs, and Sheets.
+    Loads the user's credentials from token.json, refreshing them or running
+    the OAuth flow when needed, and saves the result back to token.json.
     """
     creds = None
 
-    if os.path.exists("token.json"):
-        creds = Credentials.from_authorized_user_file("token.json", SCOPES)
+    if os.path.exists(TOKEN_FILE) and _token_has_scopes(TOKEN_FILE):
+        creds = Credentials.from_authorized_user_file(TOKEN_FILE, SCOPES)
 
     if not creds or not creds.valid:
         if creds and creds.expired and creds.refresh_token:
-            creds.refresh(Request())
+            creds.refresh(_auth_request())
         else:
-            flow = InstalledAppFlow.from_client_secrets_file("credentials.json", SCOPES)
+            from google_auth_oauthlib.flow import InstalledAppFlow
+            flow = InstalledAppFlow.from_client_secrets_file(CREDENTIALS_FILE, SCOPES)
             creds = flow.run_local_server(port=0)
-        with open("token.json", "w") as token:
-            token.write(creds.to_json())
+        _save_token(creds)
+
+    return creds
+
+
+def _token_has_scopes(path: str) -> bool:
+    """Returns False when the saved token was granted fewer scopes than SCOPES now requires."""
+    with open(path, "r") as token:
+        granted = json.load(token).get("scopes")
+    return granted is None or set(SCOPES) <= set(granted)
+
+
+def _save_token(creds):
+    with open(TOKEN_FILE, "w") as token:
+        token.write(creds.to_json())
+
+
+def _user_token_saver(user_id: str):
+    def save(creds):
+        get_credential_store().put(user_id, json.loads(creds.to_json()))
+    return save
+
+
+def _load_discovery_document(api: str, version: str) -> str:
+    """
+    Returns the discovery document for an API without a network round trip when possible.
+    Looks at the documents bundled with googleapiclient first, then at the local cache
+    directory, and only downloads (and caches) the document as a last resort.
+    """
+    document = discovery_cache.get_static_doc(api, version)
+    if document:
+        return document
+
+    path = os.path.join(DISCOVERY_CACHE_DIR, f"{api}.{version}.json")
+    if os.path.exists(path):
+        with open(path, "r", encoding="utf-8") as f:
+            return f.read()
+
+    print(f"🌐 Downloading discovery document for {api} {version}")
+    with span("google.discovery.download", api=api, version=version):
+        response, content = httplib2.Http().request(DISCOVERY_URL.format(api=api, version=version))
+    if response.status >= 400:
+        raise RuntimeError(f"Could not download discovery document for {api} {version}: HTTP {response.status}")
+    document = content.decode("utf-8")
+    json.loads(document)
+
+    os.makedirs(DISCOVERY_CACHE_DIR, exist_ok=True)
+    with open(path, "w", encoding="utf-8") as f:
+        f.write(document)
+    return document
+
+
+@functools.lru_cache(maxsize=None)
+def _parsed_discovery_document(api: str, version: str) -> dict:
+    # Parsed once per process and shared by every pool: parsing is most of the cost of
+    # building a client, and the parsed schemas most of its memory.
+    return json.loads(_load_discovery_document(api, version))
+
+
+class _PooledHttpRequest(HttpRequest):
+    """
+    HttpRequest whose execute() waits for the API's shared rate limiter, retries
+    throttling and server errors with backoff, and records a tracing span per attempt.
+    POSTs (inserts) are retried only when throttled: after a server error they may have
+    been carried out already, and a retry would create a duplicate.
+    """
+
+    def execute(self, http=None, num_retries=0):
+        api = (self.methodId or "").split(".")[0]
+        # Long GET URLs are sent as POSTs with an x-http-method-override header; those stay idempotent.
+        idempotent = self.method != "POST" or self.headers.get("x-http-method-override") == "GET"
+        return call_with_backoff(api, self._execute_traced, http, num_retries, idempotent=idempotent)
+
+    def _execute_traced(self, http, num_retries):
+        if not tracing_enabled():
+            return super().execute(http=http, num_retries=num_retries)
+
+        name = self.methodId or "request"
+        with span(f"google.{name}", http_method=self.method, request_bytes=len(self.body or "")) as current:
+            postproc = self.postproc
+
+            def measured(resp, content):
+                current.set(status=resp.status, response_bytes=len(content or b""))
+                return postproc(resp, content)
+
+            self.postproc = measured
+            try:
+                return super().execute(http=http, num_retries=num_retries)
+            finally:
+                self.postproc = postproc
+                count("google_api_calls", method=name)
+
+
+class ServicePool:
+    """
+    Long-lived pool of Google API clients sharing one credential object.
+
+    The clients are built once per pool. Requests made through them are routed to an
+    authorized HTTP transport owned by the calling thread, because httplib2 is not
+    thread-safe. With background_refresh, the credential is refreshed in a background
+    thread shortly before it expires so that tool calls don't pay for the refresh;
+    otherwise (per-user pools, which would need a thread each) get_services() refreshes
+    it when it is about to expire. Refreshed tokens are passed to token_saver.
+    """
+
+    def __init__(self, credentials=None, http_factory=None, background_refresh: bool = True, token_saver=None):
+        self._credentials = credentials
+        self._http_factory = http_factory or httplib2.Http
+        self._background_refresh = background_refresh
+        self._token_saver = token_saver or _save_token
+        self._lock = threading.RLock()
+        self._local = threading.local()
+        self._services = None
+        self._refresher = None
+        self._stop = threading.Event()
+
+        self.builds = 0
+        self.refreshes = 0
+        self.hits = 0
+
+    @property
+    def credentials(self):
+        return self._credentials
+
+    def get_services(self) -> dict:
+        """Returns the dictionary of service objects, building them on first use."""
+        with self._lock:
+            if self._services is not None:
+                self.hits += 1
+                if not self._background_refresh and self._expires_soon():
+                    self.refresh()
+                return self._services
 
+            if self._credentials is None:
+                self._credentials = load_credentials()
+
+            services = {}
+            for api, version in SERVICE_VERSIONS.items():
+                services[api] = build_from_document(
+                    _parsed_discovery_document(api, version),
+                    http=self._thread_http(),
+                    requestBuilder=self._request_builder,
+                )
+            self._services = services
+            self.builds += 1
+            print("Successfully connected to Google services.")
+
+            if self._background_refresh:
+                self._start_refresher()
+            return self._services
+
+    def stats(self) -> dict:
+        """Returns build, refresh and hit counters for this pool."""
+        with self._lock:
+            return {
+                "builds": self.builds,
+                "refreshes": self.refreshes,
+                "hits": self.hits,
+            }
+
+    def refresh(self):
+        """Refreshes the shared credential and persists the new token."""
+        with self._lock, span("google.auth.refresh"):
+            self._credentials.refresh(_auth_request())
+            self.refreshes += 1
+            self._token_saver(self._credentials)
+
+    def close(self):
+        """Stops the background refresher."""
+        self._stop.set()
+
+    def _expires_soon(self) -> bool:
+        creds = self._credentials
+        expiry = getattr(creds, "expiry", None)
+        if expiry is None or not getattr(creds, "refresh_token", None):
+            return False
+        return expiry - REFRESH_MARGIN <= datetime.utcnow()
+
+    def _thread_http(self):
+        http = getattr(self._local, "http", None)
+        if http is None:
+            http = AuthorizedHttp(self._credentials, http=self._http_factory())
+            self._local.http = http
+        return http
+
+    def _request_builder(self, http, *args, **kwargs):
+        # Ignore the transport the client was built with and use the caller's own.
+        return _PooledHttpRequest(self._thread_http(), *args, **kwargs)
+
+    def _start_refresher(self):
+        creds = self._credentials
+        if self._refresher is not None or not getattr(creds, "refresh_token", None):
+            return
+        self._refresher = threading.Thread(target=self._refresh_loop, name="google-token-refresher", daemon=True)
+        self._refresher.start()
+
+    def _refresh_loop(self):
+        while not self._stop.is_set():
+            expiry = self._credentials.expiry
+            if expiry is None:
+                return
+            # google-auth stores expiry as a naive UTC datetime.
+            wait = (expiry - REFRESH_MARGIN - datetime.utcnow()).total_seconds()
+            if self._stop.wait(max(wait, 0)):
+                return
+            try:
+                self.refresh()
+            except Exception as e:
+                print(f"⚠️ Background token refresh failed: {e}")
+                self._stop.wait(REFRESH_RETRY_SECONDS)
+
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+_user_pools = OrderedDict()
+_pending_sign_ins = {}
+
+
+def get_service_pool() -> ServicePool:
+    """
+    Returns the service pool of the current user (see credential_store.current_user),
+    or, in single-user mode, the process-wide pool using token.json. Pools are created
+    on first use.
+    """
+    user_id = current_user()
+    if user_id is not None:
+        return get_user_service_pool(user_id)
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ServicePool()
+        return _pool
+
+
+def get_user_service_pool(user_id: str) -> ServicePool:
+    """
+    Returns the pool of a user whose token is in the credential store.
+    At most MAX_USER_POOLS pools are kept; an evicted pool is rebuilt from the store
+    when its user comes back, which is cheap since the parsed discovery documents are shared.
+    Raises LookupError when the user has not signed in.
+    """
+    with _pool_lock:
+        pool = _user_pools.get(user_id)
+        if pool is not None:
+            _user_pools.move_to_end(user_id)
+            return pool
+
+    token_info = get_credential_store().get(user_id)
+    if token_info is None:
+        raise LookupError(f"No Google credentials stored for {user_id}; sign in first.")
+    credentials = Credentials.from_authorized_user_info(token_info, SCOPES)
+    pool = ServicePool(credentials=credentials, background_refresh=False, token_saver=_user_token_saver(user_id))
+    return _add_user_pool(user_id, pool)
+
+
+def _add_user_pool(user_id: str, pool: ServicePool) -> ServicePool:
+    with _pool_lock:
+        # Another thread may have built the same user's pool meanwhile; keep the first.
+        existing = _user_pools.get(user_id)
+        if existing is not None:
+            _user_pools.move_to_end(user_id)
+            return existing
+        _user_pools[user_id] = pool
+        while len(_user_pools) > MAX_USER_POOLS:
+            _, evicted = _user_pools.popitem(last=False)
+            evicted.close()
+        return pool
+
+
+def start_web_sign_in(redirect_uri: str) -> str:
+    """
+    Starts the OAuth web flow for a new user and returns the Google URL to send them to.
+    Google redirects back to redirect_uri with 'state' and 'code' query parameters,
+    which finish_web_sign_in takes.
+    """
+    from google_auth_oauthlib.flow import Flow
+    flow = Flow.from_client_secrets_file(CREDENTIALS_FILE, scopes=SCOPES, redirect_uri=redirect_uri)
+    url, state = flow.authorization_url(access_type="offline", prompt="consent")
+    now = time.monotonic()
+    with _pool_lock:
+        for expired in [key for key, (_, started) in _pending_sign_ins.items()
+                        if now - started > OAUTH_STATE_TTL_SECONDS]:
+            del _pending_sign_ins[expired]
+        _pending_sign_ins[state] = (flow, now)
+    return url
+
+
+def finish_web_sign_in(state: str, code: str) -> str:
+    """
+    Exchanges the authorization code for tokens, stores them under the account's email
+    address and returns that address as the user ID.
+    Raises LookupError for an unknown or expired state.
+    """
+    with _pool_lock:
+        flow, _ = _pending_sign_ins.pop(state, (None, None))
+    if flow is None:
+        raise LookupError("The sign-in link has expired; please sign in again.")
+    flow.fetch_token(code=code)
+    credentials = flow.credentials
+
+    # The ID of the primary calendar is the account's email address.
+    calendar = ServicePool(credentials=credentials, background_refresh=False).get_services()["calendar"]
+    user_id = calendar.calendars().get(calendarId="primary", fields="id").execute()["id"]
+
+    get_credential_store().put(user_id, json.loads(credentials.to_json()))
+    pool = ServicePool(credentials=credentials, background_refresh=False, token_saver=_user_token_saver(user_id))
+    with _pool_lock:
+        replaced = _user_pools.pop(user_id, None)
+    if replaced is not None:
+        replaced.close()
+    _add_user_pool(user_id, pool)
+    print(f"🔑 Signed in {user_id}.")
+    return user_id
+
+
+def set_service_pool(pool: ServicePool):
+    """Replaces the process-wide service pool, e.g. with one using a fake transport in benchmarks."""
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.close()
+        _pool = pool
+
+
+def get_google_services():
+    """
+    Handles user authentication and builds service objects for Google APIs.
+    Returns a dictionary of service objects for Calendar, Docs, Sheets, and Drive.
+    The objects come from the process-wide pool, so only the first call builds them.
+    """
     try:
-        calendar_service = build("calendar", "v3", credentials=creds)
-        docs_service = build("docs", "v1", credentials=creds)
-        sheets_service = build("sheets", "v4", credentials=creds)
-        
-        print("Successfully connected to Google services.")
-        return {
-            "calendar": calendar_service,
-            "docs": docs_service,
-            "sheets": sheets_service
-        }
+        return get_service_pool().get_services()
     except Exception as e:
         print(f"An error occurred while building Google services: {e}")
-        return None
\ No newline at end of file
+        return None
@@ -1,22 +1,84 @@
+import time
+from concurrent.futures import ThreadPoolExecutor
+from doc_flattener import flatten_document, format_table_rows
+from tracing import span, count
+from rate_limiter import backoff_delay, get_rate_limiter, is_retryable_error, is_throttling_error, retry_after_seconds
+
+# The Calendar API accepts at most 50 calls in one batch request.
+CALENDAR_BATCH_SIZE = 50
+BATCH_MAX_RETRIES = 5
+
+# Number of rows requested per values().get call when paging through a sheet.
+SHEET_WINDOW_ROWS = 1000
+
+# Partial-response masks: every call asks only for the fields its caller reads.
+# (Responses are gzip-compressed already: googleapiclient sends "Accept-Encoding: gzip"
+# and a user agent containing "gzip", which Google APIs require for compression.)
+
+
+class SheetReadError(Exception):
+    """Raised by the streaming sheet readers when a window can't be read, so a partial read is never taken for the whole sheet."""
+
+
+def _doc_content_fields(depth: int) -> str:
+    # Masks can't recurse, so nested tables (tables in table cells) are covered to a fixed depth.
+    # Start indexes are left out: only the offset map of flatten_document uses them.
+    paragraphs = "paragraph/elements/textRun/content"
+    if not depth:
+        return paragraphs
+    return (f"{paragraphs},tableOfContents/content({paragraphs}),"
+            f"table/tableRows/tableCells/content({_doc_content_fields(depth - 1)})")
+
+
+def _doc_tab_fields(depth: int) -> str:
+    fields = f"tabProperties(tabId,title),documentTab/body/content({_doc_content_fields(2)})"
+    if depth:
+        fields += f",childTabs({_doc_tab_fields(depth - 1)})"
+    return fields
+
+
+# What get_google_doc_content reads: text runs, table cells and tab titles (child tabs nest up to 3 levels),
+# and the legacy body for responses without tabs.
+DOC_CONTENT_FIELDS = f"tabs({_doc_tab_fields(3)}),body/content({_doc_content_fields(2)})"
+SHEET_TITLES_FIELDS = "sheets.properties.title"
+SHEET_VALUES_FIELDS = "values"
+EVENT_WRITE_FIELDS = "id,htmlLink"
+
+
 def get_google_doc_content(service, document_id: str) -> str:
-    """Reads and returns the text content of a Google Doc."""
+    """Reads and returns the text content of a Google Doc, including tables and all tabs."""
     try:
         print(f"📄 Reading content from Google Doc ID: {document_id}")
-        doc = service.documents().get(documentId=document_id).execute()
-        content = doc.get('body').get('content')
-        
-        text = ""
-        for value in content:
-            if 'paragraph' in value:
-                elements = value.get('paragraph').get('elements')
-                for elem in elements:
-                    text += elem.get('textRun', {}).get('content', '')
+        doc = service.documents().get(
+            documentId=document_id, includeTabsContent=True, fields=DOC_CONTENT_FIELDS
+        ).execute()
+        text, _ = flatten_document(doc)
         return text
     except Exception as e:
         print(f"❌ Error reading Google Doc: {e}")
         return None
 
 
+def get_google_doc_revision(service, document_id: str) -> str:
+    """Returns the current revisionId of a Google Doc without downloading its body (None on error)."""
+    try:
+        doc = service.documents().get(documentId=document_id, fields='revisionId').execute()
+        return doc.get('revisionId')
+    except Exception as e:
+        print(f"❌ Error fetching Google Doc revision: {e}")
+        return None
+
+
+def get_drive_file_modified_time(service, file_id: str) -> str:
+    """Returns the Drive modifiedTime of a file, e.g. a spreadsheet (None on error)."""
+    try:
+        file = service.files().get(fileId=file_id, fields='modifiedTime').execute()
+        return file.get('modifiedTime')
+    except Exception as e:
+        print(f"❌ Error fetching Drive file metadata: {e}")
+        return None
+
+
 def get_google_sheet_page_names(service, spreadsheet_id: str) -> list:
     """Returns the names of all sheets/pages in a Google Spreadsheet.
 
@@ -30,7 +92,7 @@ def get_google_sheet_page_names(service, spreadsheet_id: str) -> list:
     try:
         print(f"📑 Fetching sheet names from Google Sheet ID: {spreadsheet_id}")
         spreadsheet = service.spreadsheets().get(
-            spreadsheetId=spreadsheet_id
+            spreadsheetId=spreadsheet_id, fields=SHEET_TITLES_FIELDS
         ).execute()
 
         sheet_names = [
@@ -46,24 +108,155 @@ def get_google_sheet_page_names(service, spreadsheet_id: str) -> list:
         return []
 
 
-def get_google_sheet_content(service, spreadsheet_id: str, sheet_name: str = None, sheet_range: str = "A1:Z100") -> str:
-    """Reads and returns the content of a Google Sheet as a single string."""
+def _column_letter(index: int) -> str:
+    """Converts a 1-based column index to its A1 letters (1 -> A, 27 -> AA)."""
+    letters = ""
+    while index > 0:
+        index, remainder = divmod(index - 1, 26)
+        letters = chr(ord('A') + remainder) + letters
+    return letters
+
+
+def _quote_sheet_name(sheet_name: str) -> str:
+    return "'" + sheet_name.replace("'", "''") + "'"
+
+
+def _format_sheet_rows(rows: list) -> str:
+    # Keep the column boundaries visible, the same way doc tables are flattened.
+    return format_table_rows(rows).rstrip("\n")
+
+
+def get_google_sheet_dimensions(service, spreadsheet_id: str, sheet_name: str = None) -> tuple:
+    """Returns (title, row_count, column_count) of a sheet's grid; the first sheet if no name is given."""
+    spreadsheet = service.spreadsheets().get(
+        spreadsheetId=spreadsheet_id,
+        fields='sheets.properties(title,gridProperties(rowCount,columnCount))'
+    ).execute()
+
+    for sheet in spreadsheet.get('sheets', []):
+        properties = sheet['properties']
+        if sheet_name is None or properties['title'] == sheet_name:
+            grid = properties.get('gridProperties', {})
+            return properties['title'], grid.get('rowCount', 0), grid.get('columnCount', 0)
+    raise ValueError(f"Sheet '{sheet_name}' not found in spreadsheet {spreadsheet_id}")
+
+
+def _iter_sheet_row_windows(service, spreadsheet_id: str, sheet_name: str, window_rows: int):
+    title, row_count, column_count = get_google_sheet_dimensions(service, spreadsheet_id, sheet_name)
+    if not row_count or not column_count:
+        return
+    last_column = _column_letter(column_count)
+
+    def fetch(first_row):
+        last_row = min(first_row + window_rows - 1, row_count)
+        result = service.spreadsheets().values().get(
+            spreadsheetId=spreadsheet_id,
+            range=f"{_quote_sheet_name(title)}!A{first_row}:{last_column}{last_row}",
+            fields=SHEET_VALUES_FIELDS
+        ).execute()
+        return result.get('values', [])
+
+    with ThreadPoolExecutor(max_workers=1, thread_name_prefix="sheet-prefetch") as prefetcher:
+        first_row = 1
+        pending = prefetcher.submit(fetch, first_row)
+        while pending is not None:
+            rows = pending.result()
+            first_row += window_rows
+            pending = prefetcher.submit(fetch, first_row) if first_row <= row_count else None
+            yield rows
+
+
+def iter_google_sheet_row_windows(service, spreadsheet_id: str, sheet_name: str = None,
+                                  window_rows: int = SHEET_WINDOW_ROWS):
+    """Yields the rows of a whole sheet, one window of up to window_rows rows at a time.
+
+    The sheet's grid dimensions are looked up first, so every column is read no matter
+    how wide the sheet is. While the caller works on one window, the next one is
+    downloaded in the background; at most two windows are held in memory.
+
+    Args:
+        service: Google Sheets API service object
+        spreadsheet_id: ID of the spreadsheet to read
+        sheet_name: Name of the sheet/tab to read (the first sheet if None)
+        window_rows: Number of rows to request per API call
+
+    Yields:
+        Lists of rows, each row being a list of cell strings
+
+    Raises:
+        SheetReadError: when the sheet or one of its windows can't be read, after the
+            windows before it were yielded
+    """
+    try:
+        print(f"📊 Streaming content from Google Sheet ID: {spreadsheet_id}")
+        yield from _iter_sheet_row_windows(service, spreadsheet_id, sheet_name, window_rows)
+    except Exception as e:
+        print(f"❌ Error reading Google Sheet: {e}")
+        raise SheetReadError(f"Could not read sheet {spreadsheet_id}: {e}") from e
+
+
+def iter_google_sheet_rows(service, spreadsheet_id: str, sheet_name: str = None,
+                           window_rows: int = SHEET_WINDOW_ROWS):
+    """Yields the rows of a whole sheet one by one (see iter_google_sheet_row_windows)."""
+    for rows in iter_google_sheet_row_windows(service, spreadsheet_id, sheet_name, window_rows):
+        yield from rows
+
+
+def iter_google_sheet_text(service, spreadsheet_id: str, sheet_name: str = None,
+                           window_rows: int = SHEET_WINDOW_ROWS):
+    """Yields the text of a whole sheet, one newline-terminated block per window of rows."""
+    for rows in iter_google_sheet_row_windows(service, spreadsheet_id, sheet_name, window_rows):
+        if rows:
+            yield _format_sheet_rows(rows) + "\n"
+
+
+def get_google_sheet_rows(service, spreadsheet_id: str, sheet_name: str = None) -> list:
+    """Reads all rows of a sheet as lists of cell strings (None on error)."""
+    try:
+        print(f"📊 Reading rows from Google Sheet ID: {spreadsheet_id}")
+        rows = []
+        for window in _iter_sheet_row_windows(service, spreadsheet_id, sheet_name, SHEET_WINDOW_ROWS):
+            rows.extend(window)
+        return rows
+    except Exception as e:
+        print(f"❌ Error reading Google Sheet: {e}")
+        return None
+
+
+def get_google_sheet_content(service, spreadsheet_id: str, sheet_name: str = None, sheet_range: str = None) -> str:
+    """Reads and returns the content of a Google Sheet as a single string.
+
+    Without a sheet_range the whole sheet is read window by window; prefer
+    iter_google_sheet_text for very large sheets to avoid building one big string.
+    """
     try:
         print(f"📊 Reading content from Google Sheet ID: {spreadsheet_id}")
+        if sheet_range is None:
+            return "\n".join(
+                _format_sheet_rows(rows)
+                for rows in _iter_sheet_row_windows(service, spreadsheet_id, sheet_name, SHEET_WINDOW_ROWS)
+                if rows
+            )
+
         result = service.spreadsheets().values().get(
-            spreadsheetId=spreadsheet_id, range=((sheet_name + "!") if sheet_name is not None else "") + sheet_range
+            spreadsheetId=spreadsheet_id, range=((sheet_name + "!") if sheet_name is not None else "") + sheet_range,
+            fields=SHEET_VALUES_FIELDS
         ).execute()
         values = result.get('values', [])
-        
-        text = "\n".join([" ".join(row) for row in values])
+
+        text = _format_sheet_rows(values)
         return text
     except Exception as e:
         print(f"❌ Error reading Google Sheet: {e}")
         return None
 
-def create_calendar_event(service, calendar_id: str, event_data: dict, timezone: str):
-    """Creates an event in the specified Google Calendar using the provided timezone."""
-    event_body = {
+
+def _build_event_body(event_data: dict, timezone: str) -> dict:
+    """
+    Converts an extracted event dict into a Calendar API event resource.
+    A 'recurrence' list (RRULE/EXDATE lines, see recurrence.py) makes it a recurring event.
+    """
+    body = {
         'summary': event_data.get('summary'),
         'description': event_data.get('description'),
         'start': {
@@ -75,11 +268,214 @@ def create_calendar_event(service, calendar_id: str, event_data: dict, timezone:
             'timeZone': timezone,
         },
     }
-    
+    if event_data.get('recurrence'):
+        body['recurrence'] = list(event_data['recurrence'])
+    return body
+
+
+def create_calendar_event(service, calendar_id: str, event_data: dict, timezone: str) -> dict:
+    """
+    Creates an event in the specified Google Calendar using the provided timezone.
+    Throttling and server errors are retried by the transport (see rate_limiter.py).
+
+    Returns:
+        A result dict like the ones of create_calendar_events_batch, with the keys
+        'summary', 'ok', 'id', 'htmlLink', 'error' and 'status' (the HTTP status of a failed insert, when known).
+    """
+    event_body = _build_event_body(event_data, timezone)
+    result = {'summary': event_body.get('summary'), 'ok': False, 'id': None, 'htmlLink': None,
+              'error': None, 'status': None}
+
     try:
         event = service.events().insert(
-            calendarId=calendar_id, body=event_body
+            calendarId=calendar_id, body=event_body, fields=EVENT_WRITE_FIELDS
         ).execute()
-        print(f"✅ Event created in timezone {timezone}: {event.get('summary')} -> {event.get('htmlLink')}")
     except Exception as e:
-        print(f"❌ Error creating calendar event: {e}")
\ No newline at end of file
+        # The request itself is traced by the transport; only the give-up is counted here.
+        result.update(error=str(e), status=getattr(getattr(e, 'resp', None), 'status', None))
+        count("google_calendar_insert_failures", status=result['status'] or "unknown")
+        return result
+    result.update(ok=True, id=event.get('id'), htmlLink=event.get('htmlLink'))
+    return result
+
+
+def _execute_calendar_batch(service, build_requests: list, labels: list, batch_size: int, max_retries: int,
+                            idempotent: bool = True) -> list:
+    """Runs one request per entry of build_requests in Calendar batch HTTP calls.
+
+    build_requests holds callables that return a fresh request object, so that only the
+    sub-requests that failed with a retryable error are rebuilt and retried (only
+    throttled ones unless idempotent, see rate_limiter.is_retryable_error). Every
+    sub-request takes a token from the shared Calendar rate limiter, and throttled
+    sub-requests slow it down.
+    Returns one result dict per request with the keys 'summary', 'ok', 'id', 'htmlLink', 'error'
+    and 'status' (the HTTP status of a failed request, when known).
+    """
+    results = [
+        {'summary': label, 'ok': False, 'id': None, 'htmlLink': None, 'error': None, 'status': None}
+        for label in labels
+    ]
+    pending = list(range(len(build_requests)))
+    limiter = get_rate_limiter("calendar")
+
+    for attempt in range(max_retries + 1):
+        retry = []
+        retry_after = []
+
+        def note_failure(indexes, error):
+            if not is_retryable_error(error, idempotent):
+                return
+            retry.extend(indexes)
+            if is_throttling_error(error):
+                limiter.on_throttle()
+            seconds = retry_after_seconds(error)
+            if seconds is not None:
+                retry_after.append(seconds)
+
+        def handle_response(request_id, response, exception):
+            index = int(request_id)
+            if exception is None:
+                # Deletes answer with an empty body.
+                response = response or {}
+                results[index].update(ok=True, id=response.get('id'), htmlLink=response.get('htmlLink'),
+                                      error=None, status=None)
+                limiter.on_success()
+            else:
+                results[index]['error'] = str(exception)
+                results[index]['status'] = getattr(getattr(exception, 'resp', None), 'status', None)
+                note_failure([index], exception)
+
+        for start in range(0, len(pending), batch_size):
+            chunk = pending[start:start + batch_size]
+            batch = service.new_batch_http_request(callback=handle_response)
+            for index in chunk:
+                batch.add(build_requests[index](), request_id=str(index))
+            # The quota counts every sub-request, not the batch HTTP call.
+            limiter.acquire(len(chunk))
+            try:
+                with span("google.calendar.batch", requests=len(chunk), attempt=attempt):
+                    batch.execute()
+            except Exception as e:
+                for index in chunk:
+                    results[index]['error'] = str(e)
+                note_failure(chunk, e)
+
+        if not retry or attempt == max_retries:
+            break
+        pending = sorted(retry)
+        count("google_batch_retries", len(pending), api="calendar")
+        delay = backoff_delay(attempt, max(retry_after) if retry_after else None)
+        print(f"🔁 Retrying {len(pending)} failed calendar request(s) in {delay:.1f}s...")
+        time.sleep(delay)
+
+    return results
+
+
+def create_calendar_events_batch(service, calendar_id: str, events: list, timezone: str,
+                                 batch_size: int = CALENDAR_BATCH_SIZE,
+                                 max_retries: int = BATCH_MAX_RETRIES) -> list:
+    """Creates many events using Calendar API batch requests.
+
+    Up to `batch_size` inserts are sent in a single HTTP call. Sub-requests that were
+    throttled are retried (and only those) with exponential backoff. Inserts that failed
+    with a server error are not retried, as they may have been carried out already.
+
+    Args:
+        service: Google Calendar API service object
+        calendar_id: ID of the calendar to add the events to
+        events: List of event dicts as returned by extract_events_from_text
+        timezone: Timezone name used for the start and end times
+
+    Returns:
+        List with one result dict per input event, in input order, with the keys
+        'summary', 'ok', 'id', 'htmlLink' and 'error'.
+    """
+    # Building a Resource walks the whole discovery document, so do it once, not per event.
+    events_resource = service.events()
+    results = _execute_calendar_batch(
+        service,
+        [
+            lambda event=event: events_resource.insert(
+                calendarId=calendar_id, body=_build_event_body(event, timezone), fields=EVENT_WRITE_FIELDS
+            )
+            for event in events
+        ],
+        [event.get('summary') for event in events],
+        batch_size,
+        max_retries,
+        idempotent=False,
+    )
+
+    created = sum(1 for result in results if result['ok'])
+    print(f"✅ Created {created}/{len(events)} events in calendar '{calendar_id}' (timezone {timezone}).")
+    for result in results:
+        if not result['ok']:
+            print(f"❌ Error creating calendar event '{result['summary']}': {result['error']}")
+    return results
+
+
+def update_calendar_events_batch(service, calendar_id: str, updates: list, timezone: str,
+                                 batch_size: int = CALENDAR_BATCH_SIZE,
+                                 max_retries: int = BATCH_MAX_RETRIES) -> list:
+    """Patches existing events using Calendar API batch requests.
+
+    Args:
+        service: Google Calendar API service object
+        calendar_id: ID of the calendar holding the events
+        updates: List of (event_id, event dict) pairs
+        timezone: Timezone name used for the start and end times
+
+    Returns:
+        List with one result dict per update, in input order (see create_calendar_events_batch).
+    """
+    events_resource = service.events()
+    results = _execute_calendar_batch(
+        service,
+        [
+            lambda event_id=event_id, event=event: events_resource.patch(
+                calendarId=calendar_id, eventId=event_id, body=_build_event_body(event, timezone),
+                fields=EVENT_WRITE_FIELDS
+            )
+            for event_id, event in updates
+        ],
+        [event.get('summary') for _, event in updates],
+        batch_size,
+        max_retries,
+    )
+
+    for result in results:
+        if not result['ok']:
+            print(f"❌ Error updating calendar event '{result['summary']}': {result['error']}")
+    return results
+
+
+def delete_calendar_events_batch(service, calendar_id: str, event_ids: list,
+                                 batch_size: int = CALENDAR_BATCH_SIZE,
+                                 max_retries: int = BATCH_MAX_RETRIES) -> list:
+    """Deletes events by ID using Calendar API batch requests.
+
+    Events that are already gone (404 or 410) count as deleted.
+
+    Returns:
+        List with one result dict per ID, in input order (see create_calendar_events_batch).
+    """
+    events_resource = service.events()
+    results = _execute_calendar_batch(
+        service,
+        [
+            lambda event_id=event_id: events_resource.delete(calendarId=calendar_id, eventId=event_id)
+            for event_id in event_ids
+        ],
+        list(event_ids),
+        batch_size,
+        max_retries,
+    )
+
+    for event_id, result in zip(event_ids, results):
+        if not result['ok'] and result['status'] in (404, 410):
+            result.update(ok=True, error=None)
+        if result['ok']:
+            result['id'] = event_id
+        else:
+            print(f"❌ Error deleting calendar event '{event_id}': {result['error']}")
+    return results
@@ -0,0 +1,89 @@
+"""
+Incremental parsing of a JSON array of objects that arrives in pieces, such as a
+streamed Gemini response.
+
+Every object is returned as soon as its closing brace arrives, so callers can act on
+the first event while the rest of the array is still being generated. A malformed
+object is skipped on its own instead of invalidating the whole array.
+"""
+import json
+
+
+class JsonArrayStreamParser:
+    """
+    Feed it text with feed(); each call returns the objects completed by that text.
+    Anything before the opening bracket (such as a markdown fence) is ignored.
+    """
+
+    def __init__(self):
+        self._buffer = ""
+        self._position = 0
+        self._object_start = None
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self.started = False
+        self.closed = False
+        self.parsed = 0
+        self.skipped = 0
+        self.chars = 0
+
+    @property
+    def complete(self) -> bool:
+        """True when the closing bracket arrived and every object in the array was valid."""
+        return self.closed and not self.skipped
+
+    def feed(self, text: str) -> list:
+        self.chars += len(text)
+        if self.closed:
+            return []
+        self._buffer += text
+        objects = []
+        buffer = self._buffer
+        i = self._position
+        while i < len(buffer):
+            char = buffer[i]
+            if not self.started:
+                self.started = char == "["
+            elif self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == "\\":
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char == "{":
+                if self._depth == 0:
+                    self._object_start = i
+                self._depth += 1
+            elif char == "}" and self._depth:
+                self._depth -= 1
+                if self._depth == 0:
+                    self._emit(buffer[self._object_start:i + 1], objects)
+                    self._object_start = None
+            elif char == "]" and self._depth == 0:
+                self.closed = True
+                break
+            i += 1
+
+        # Keep only the unfinished object; everything before it has been handled.
+        keep_from = self._object_start if self._object_start is not None else len(buffer)
+        self._buffer = buffer[keep_from:]
+        self._position = i - keep_from if self._object_start is not None else 0
+        if self._object_start is not None:
+            self._object_start = 0
+        return objects
+
+    def _emit(self, text: str, objects: list):
+        try:
+            value = json.loads(text)
+        except json.JSONDecodeError:
+            self.skipped += 1
+            return
+        if isinstance(value, dict):
+            self.parsed += 1
+            objects.append(value)
+        else:
+            self.skipped += 1
@@ -1,8 +1,5 @@
 import argparse
-from tzlocal import get_localzone_name
-from google_auth import get_google_services
-from google_services import get_google_doc_content, get_google_sheet_content, create_calendar_event
-from ai_event_extractor import extract_events_from_text
+from tracing import enable_tracing
 
 def main():
     """Main function to run the AI event scheduler."""
@@ -10,9 +7,39 @@ def main():
     group = parser.add_mutually_exclusive_group(required=True)
     group.add_argument("--doc-id", help="The ID of the Google Doc to process.")
     group.add_argument("--sheet-id", help="The ID of the Google Sheet to process.")
+    group.add_argument("--manifest", help="JSON manifest of docs/sheets to import without prompting (see batch_import.py).")
     parser.add_argument("--calendar-id", default="primary", help="The ID of the calendar to add events to (default: 'primary').")
+    parser.add_argument("--workers", type=int, help="With --manifest: number of sources processed at once (default: 4).")
+    parser.add_argument("--checkpoint", help="With --manifest: checkpoint file (default: <manifest>.checkpoint.json).")
+    parser.add_argument("--watch", action="store_true",
+                        help="With --manifest: keep polling the sources and apply their changes to the calendar.")
+    parser.add_argument("--interval", type=float, help="With --watch: seconds between polls (default: 300).")
+    parser.add_argument("--trace", action="store_true", help="Record timing spans and metrics under .cache/traces/.")
     
     args = parser.parse_args()
+    if args.watch and not args.manifest:
+        parser.error("--watch requires --manifest")
+    if args.trace:
+        enable_tracing()
+
+    # Imported only now: the Google and Gemini client libraries take a while to load,
+    # and --help or a bad argument shouldn't wait for them.
+    from tzlocal import get_localzone_name
+    from google_auth import get_google_services
+    from document_cache import read_google_doc_cached
+    from google_services import SheetReadError, iter_google_sheet_row_windows
+    from calendar_index import upsert_calendar_event, upsert_calendar_events
+    from recurrence import collapse_recurring_events
+    from ai_event_extractor import ExtractionError, iter_events_from_text, extract_events_from_row_windows
+    from batch_import import DEFAULT_WORKERS, run_batch_import
+
+    if args.watch:
+        from watcher import DEFAULT_INTERVAL_SECONDS, run_watcher
+        run_watcher(args.manifest, args.calendar_id, args.interval or DEFAULT_INTERVAL_SECONDS)
+        return
+    if args.manifest:
+        run_batch_import(args.manifest, args.calendar_id, args.workers or DEFAULT_WORKERS, args.checkpoint)
+        return
 
     print("🚀 Starting AI Event Scheduler...")
 
@@ -27,18 +54,30 @@ def main():
     if not services:
         return
 
-    text_content = None
-    if args.doc_id:
-        text_content = get_google_doc_content(services["docs"], args.doc_id)
-    elif args.sheet_id:
-        text_content = get_google_sheet_content(services["sheets"], args.sheet_id)
-
-    if not text_content or not text_content.strip():
-        print("📄 No content found in the specified document/sheet. Exiting.")
+    try:
+        if args.doc_id:
+            text_content = read_google_doc_cached(services, args.doc_id)
+            if not text_content or not text_content.strip():
+                print("📄 No content found in the specified document/sheet. Exiting.")
+                return
+            print("Data")
+            print(text_content.strip())
+            extracted_events = []
+            for event in iter_events_from_text(text_content):
+                # Printed as soon as Gemini writes each one; the full list follows below.
+                print(f"  • {event.get('summary')} ({event.get('start_datetime')})")
+                extracted_events.append(event)
+        else:
+            # Sheets can be arbitrarily large: analyze row windows while later ones download.
+            extracted_events = extract_events_from_row_windows(
+                iter_google_sheet_row_windows(services["sheets"], args.sheet_id)
+            )
+    except ExtractionError as e:
+        print(f"❌ Could not analyze the document, please try again later: {e}")
+        return
+    except SheetReadError as e:
+        print(f"❌ Could not read the whole sheet, please try again later: {e}")
         return
-    print("Data")
-    print(text_content.strip())
-    extracted_events = extract_events_from_text(text_content)
 
     if not extracted_events:
         print("✅ No events found by the AI. All done!")
@@ -53,12 +92,21 @@ def main():
         print(f"  Desc:  {event.get('description')}")
     
     print("\n")
-    for event in extracted_events:
-        confirm = input(f"Create event '{event.get('summary')}' in your calendar? [y/N]: ").lower()
-        if confirm == 'y':
-            create_calendar_event(services["calendar"], args.calendar_id, event, user_timezone)
-        else:
-            print(f"Skipping event: '{event.get('summary')}'")
+    choice = input(f"Create all {len(extracted_events)} event(s) in your calendar? [a]ll / [o]ne by one / [N]one: ").lower()
+    if choice == 'a':
+        # Repeated occurrences become one recurring event; events already in the
+        # calendar are skipped or updated instead of duplicated.
+        events = collapse_recurring_events(extracted_events, user_timezone)
+        upsert_calendar_events(services["calendar"], args.calendar_id, events, user_timezone)
+    elif choice == 'o':
+        for event in extracted_events:
+            confirm = input(f"Create event '{event.get('summary')}' in your calendar? [y/N]: ").lower()
+            if confirm == 'y':
+                upsert_calendar_event(services["calendar"], args.calendar_id, event, user_timezone)
+            else:
+                print(f"Skipping event: '{event.get('summary')}'")
+    else:
+        print("Skipping all events.")
 
     print("\n🎉 Process complete.")
 
@@ -0,0 +1,233 @@
+"""
+Process-wide rate limiting and retrying for Google APIs and Gemini.
+
+Every API has its own token bucket. Callers take a token before each request, so
+concurrent tools, chunk workers and batch imports share one budget per API instead of
+each bursting on their own. The bucket's rate is adjusted additively-increase /
+multiplicatively-decrease: it is halved when the API answers with throttling, then
+grows back slowly, and more slowly again near the rate that was last throttled, so
+sustained throughput settles just under the quota instead of oscillating between
+bursts and failures.
+"""
+import email.utils
+import os
+import random
+import re
+import threading
+import time
+from googleapiclient.errors import HttpError
+from tracing import count
+
+# Requests per second allowed at most for each API, and how many may go out back to back.
+# The defaults sit just under the per-minute, per-user quotas of a standard Google Cloud
+# project. A rate can be overridden with e.g. RATE_LIMIT_GEMINI=10 in the environment.
+DEFAULT_LIMITS = {
+    "calendar": {"rate": 10.0, "burst": 100},
+    "docs": {"rate": 5.0, "burst": 60},
+    "sheets": {"rate": 1.0, "burst": 30},
+    "drive": {"rate": 20.0, "burst": 100},
+    "gemini": {"rate": 2.0, "burst": 10},
+}
+FALLBACK_LIMIT = {"rate": 5.0, "burst": 5}
+
+MIN_RATE_FRACTION = 0.05
+DECREASE_FACTOR = 0.5
+# Fraction of the maximum rate regained per second while requests succeed.
+INCREASE_FRACTION_PER_SECOND = 0.05
+# After a throttle, further throttles within this window don't lower the rate again
+# (they are usually answers to requests sent before the first decrease).
+DECREASE_COOLDOWN_SECONDS = 2.0
+
+MAX_RETRIES = 5
+BACKOFF_BASE_SECONDS = 1.0
+BACKOFF_MAX_SECONDS = 60.0
+
+RETRYABLE_STATUS_CODES = {429, 500, 502, 503, 504}
+RATE_LIMIT_REASONS = {'rateLimitExceeded', 'userRateLimitExceeded'}
+
+_RETRY_IN_RE = re.compile(r"retry in (\d+(?:\.\d+)?)\s*s", re.IGNORECASE)
+
+
+class AdaptiveRateLimiter:
+    """Token bucket whose refill rate adapts to the throttling signals of the API."""
+
+    def __init__(self, name: str, rate: float, burst: int):
+        self.name = name
+        self.max_rate = rate
+        self.min_rate = rate * MIN_RATE_FRACTION
+        self.rate = rate
+        self.burst = burst
+        self._tokens = float(burst)
+        self._updated = time.monotonic()
+        self._throttled_rate = None
+        self._last_decrease = 0.0
+        self._last_increase = time.monotonic()
+        self._lock = threading.Lock()
+
+        self.throttles = 0
+        self.waited_seconds = 0.0
+
+    def _refill(self, now: float):
+        self._tokens = min(self.burst, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    def acquire(self, tokens: int = 1):
+        """Blocks until `tokens` requests may be sent. Requests are served in arrival order."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            # Reserve the tokens now, even if that takes the bucket below zero: later
+            # callers then queue behind this one instead of racing for the next refill.
+            self._tokens -= tokens
+            wait = -self._tokens / self.rate if self._tokens < 0 else 0.0
+            self.waited_seconds += wait
+        if wait:
+            time.sleep(wait)
+
+    def on_success(self):
+        with self._lock:
+            now = time.monotonic()
+            # Grow with time rather than per request, so the growth doesn't speed up with the rate.
+            elapsed = min(now - self._last_increase, 1.0)
+            self._last_increase = now
+            if self.rate >= self.max_rate:
+                return
+            step = self.max_rate * INCREASE_FRACTION_PER_SECOND * elapsed
+            if self._throttled_rate and self.rate >= 0.9 * self._throttled_rate:
+                # Creep towards the rate that was throttled last time.
+                step /= 10
+            self._refill(now)
+            self.rate = min(self.max_rate, self.rate + step)
+
+    def on_throttle(self):
+        with self._lock:
+            now = time.monotonic()
+            self.throttles += 1
+            if now - self._last_decrease < DECREASE_COOLDOWN_SECONDS:
+                return
+            self._refill(now)
+            self._throttled_rate = self.rate
+            self.rate = max(self.min_rate, self.rate * DECREASE_FACTOR)
+            self._last_decrease = self._last_increase = now
+        count("rate_limit_throttles", api=self.name)
+        print(f"🐢 {self.name} is throttling; slowing down to {self.rate:.2f} requests/s.")
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "max_rate": self.max_rate,
+                "throttles": self.throttles,
+                "waited_seconds": self.waited_seconds,
+            }
+
+
+_limiters = {}
+_limiters_lock = threading.Lock()
+
+
+def get_rate_limiter(api: str) -> AdaptiveRateLimiter:
+    """Returns the process-wide limiter of an API ("calendar", "docs", "sheets", "drive", "gemini")."""
+    with _limiters_lock:
+        limiter = _limiters.get(api)
+        if limiter is None:
+            limit = DEFAULT_LIMITS.get(api, FALLBACK_LIMIT)
+            rate = float(os.getenv(f"RATE_LIMIT_{api.upper()}", limit["rate"]))
+            limiter = _limiters[api] = AdaptiveRateLimiter(api, rate, limit["burst"])
+        return limiter
+
+
+def configure_rate_limit(api: str, rate: float, burst: int = None):
+    """Replaces the limiter of an API, e.g. for a project with a higher quota."""
+    with _limiters_lock:
+        _limiters[api] = AdaptiveRateLimiter(api, rate, burst or max(1, int(rate)))
+
+
+def _status_code(error):
+    if isinstance(error, HttpError):
+        return error.resp.status
+    # google.api_core exceptions (raised by the Gemini client) carry the HTTP code.
+    code = getattr(error, "code", None)
+    return code if isinstance(code, int) else None
+
+
+def is_throttling_error(error) -> bool:
+    """Returns True when the error says that we are sending too many requests."""
+    status = _status_code(error)
+    if status == 429:
+        return True
+    if status == 403 and isinstance(error, HttpError):
+        details = error.error_details if isinstance(error.error_details, list) else []
+        return any(isinstance(d, dict) and d.get('reason') in RATE_LIMIT_REASONS for d in details)
+    return False
+
+
+def is_retryable_error(error, idempotent: bool = True) -> bool:
+    """
+    Returns True for errors that are worth retrying: throttling, server errors and dropped
+    connections. A request that is not idempotent (an insert) may have been carried out
+    before a server error or a dropped connection, so for those only throttling is retried.
+    """
+    if not idempotent:
+        return is_throttling_error(error)
+    if isinstance(error, (ConnectionError, TimeoutError)):
+        return True
+    return _status_code(error) in RETRYABLE_STATUS_CODES or is_throttling_error(error)
+
+
+def retry_after_seconds(error):
+    """Returns the delay the server asked for (Retry-After header or "retry in Ns" message), or None."""
+    if isinstance(error, HttpError):
+        value = error.resp.get("retry-after")
+        if value:
+            if value.strip().isdigit():
+                return float(value)
+            try:
+                return max(0.0, email.utils.parsedate_to_datetime(value).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    match = _RETRY_IN_RE.search(str(error))
+    return float(match.group(1)) if match else None
+
+
+def backoff_delay(attempt: int, retry_after: float = None) -> float:
+    """Seconds to wait before retry number attempt + 1: the server's Retry-After, or full-jitter exponential."""
+    if retry_after is not None:
+        return min(BACKOFF_MAX_SECONDS, retry_after) + random.uniform(0, BACKOFF_BASE_SECONDS)
+    return random.uniform(0, min(BACKOFF_MAX_SECONDS, BACKOFF_BASE_SECONDS * 2 ** attempt))
+
+
+def backoff_after_error(api: str, error: Exception, attempt: int, max_retries: int = MAX_RETRIES,
+                        idempotent: bool = True) -> float:
+    """
+    Handles the failure of attempt number `attempt` of a request to api: re-raises error
+    when it is not retryable (see is_retryable_error) or the retries are used up, lowers
+    the API's rate when it is throttling, and returns the seconds to wait before the next attempt.
+    """
+    if not is_retryable_error(error, idempotent) or attempt >= max_retries:
+        raise error
+    if is_throttling_error(error):
+        get_rate_limiter(api).on_throttle()
+    delay = backoff_delay(attempt, retry_after_seconds(error))
+    count("rate_limit_retries", api=api)
+    print(f"🔁 {api} request failed ({error.__class__.__name__}); retrying in {delay:.1f}s...")
+    return delay
+
+
+def call_with_backoff(api: str, func, *args, max_retries: int = MAX_RETRIES, idempotent: bool = True, **kwargs):
+    """
+    Calls func(*args, **kwargs) within the rate limit of api, retrying retryable errors
+    with backoff (only throttling when the call is not idempotent). Throttling errors
+    also lower the API's rate. Re-raises the last error when it is not retryable or the
+    retries are used up.
+    """
+    limiter = get_rate_limiter(api)
+    for attempt in range(max_retries + 1):
+        limiter.acquire()
+        try:
+            result = func(*args, **kwargs)
+        except Exception as e:
+            time.sleep(backoff_after_error(api, e, attempt, max_retries, idempotent))
+        else:
+            limiter.on_success()
+            return result
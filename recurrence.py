@@ -0,0 +1,140 @@
+"""
+Collapses repeated occurrences of one event into a single recurring calendar event.
+
+Documents list a weekly class or a daily stand-up once per date, and the extractor
+returns every occurrence as its own event. collapse_recurring_events groups events by
+normalized summary and description, duration and local time of day, looks for a daily,
+weekly or monthly pattern in each group's dates and turns a group that follows one into
+a single event with an RRULE, listing the dates the pattern skips as EXDATEs.
+"""
+import math
+from datetime import datetime, timedelta
+from zoneinfo import ZoneInfo
+from calendar_index import normalize_summary
+
+# Fewer occurrences than this stay separate events.
+MIN_OCCURRENCES = 3
+# A pattern may skip at most this fraction of its dates (holidays, a cancelled week).
+MAX_EXCEPTION_RATIO = 0.25
+
+_WEEKDAYS = ["MO", "TU", "WE", "TH", "FR", "SA", "SU"]
+
+
+def _local_time(value, timezone: str):
+    """Parses an ISO date-time as wall-clock time in timezone. Returns None for dates and unparsable values."""
+    if not value or len(str(value)) <= 10:
+        return None
+    try:
+        moment = datetime.fromisoformat(str(value).replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if moment.tzinfo is not None:
+        moment = moment.astimezone(ZoneInfo(timezone)).replace(tzinfo=None)
+    return moment
+
+
+def _daily(days: list) -> tuple:
+    span = (days[-1] - days[0]).days
+    return "FREQ=DAILY", [days[0] + timedelta(days=k) for k in range(span + 1)]
+
+
+def _weekly(days: list) -> tuple:
+    week_start = days[0] - timedelta(days=days[0].weekday())
+    weeks = [(day - week_start).days // 7 for day in days]
+    interval = math.gcd(*weeks) or 1
+    weekdays = sorted({day.weekday() for day in days})
+    expected = [
+        days[0] + timedelta(days=k) for k in range((days[-1] - days[0]).days + 1)
+        if (days[0] + timedelta(days=k)).weekday() in weekdays and (k + days[0].weekday()) // 7 % interval == 0
+    ]
+    rule = f"FREQ=WEEKLY;BYDAY={','.join(_WEEKDAYS[weekday] for weekday in weekdays)}"
+    if interval > 1:
+        rule += f";INTERVAL={interval}"
+    return rule, expected
+
+
+def _monthly(days: list):
+    if len({day.day for day in days}) > 1:
+        return None
+    months = [(day.year - days[0].year) * 12 + day.month - days[0].month for day in days]
+    interval = math.gcd(*months) or 1
+    expected = []
+    for month in range(0, months[-1] + 1, interval):
+        year, month_index = divmod(days[0].month - 1 + month, 12)
+        try:
+            expected.append(days[0].replace(year=days[0].year + year, month=month_index + 1))
+        except ValueError:
+            # Months without that day (the 31st in April) are skipped by the RRULE as well.
+            continue
+    rule = f"FREQ=MONTHLY;BYMONTHDAY={days[0].day}"
+    if interval > 1:
+        rule += f";INTERVAL={interval}"
+    return rule, expected
+
+
+def detect_recurrence(days: list):
+    """
+    Finds the pattern that fits the sorted, distinct dates best.
+    Returns (rule, expected dates) with the rule without COUNT, or None when no pattern
+    covers them with few enough exceptions. Daily beats weekly beats monthly on a tie.
+    """
+    if len(days) < MIN_OCCURRENCES:
+        return None
+    best = None
+    for candidate in (_daily(days), _weekly(days), _monthly(days)):
+        if candidate is None:
+            continue
+        _, expected = candidate
+        exceptions = len(expected) - len(days)
+        if exceptions > MAX_EXCEPTION_RATIO * len(expected):
+            continue
+        if best is None or exceptions < len(best[1]) - len(days):
+            best = candidate
+    return best
+
+
+def collapse_recurring_events(events: list, timezone: str) -> list:
+    """
+    Returns the events with every recurring group replaced by one event: the group's
+    first occurrence with a 'recurrence' list (an RRULE and, if dates are skipped, an
+    EXDATE line) as the Calendar API expects it. Other events are returned unchanged,
+    and the order follows the first occurrence of each. timezone is the one the events
+    are created in; the pattern is detected in its wall-clock time.
+    """
+    groups = {}
+    for i, event in enumerate(events):
+        start = _local_time(event.get("start_datetime"), timezone)
+        end = _local_time(event.get("end_datetime"), timezone)
+        if start is None or event.get("recurrence"):
+            continue
+        key = (
+            normalize_summary(event.get("summary")),
+            normalize_summary(event.get("description")),
+            end - start if end is not None else None,
+            start.time(),
+        )
+        groups.setdefault(key, []).append((start, i))
+
+    replaced = {}
+    skipped = set()
+    for members in groups.values():
+        members.sort()
+        days = sorted({start.date() for start, _ in members})
+        pattern = detect_recurrence(days)
+        if pattern is None:
+            continue
+        rule, expected = pattern
+        first_start, first_index = members[0]
+        recurrence = [f"RRULE:{rule};COUNT={len(expected)}"]
+        missing = sorted(set(expected) - set(days))
+        if missing:
+            recurrence.append(f"EXDATE;TZID={timezone}:" + ",".join(
+                datetime.combine(day, first_start.time()).strftime("%Y%m%dT%H%M%S") for day in missing
+            ))
+        replaced[first_index] = dict(events[first_index], recurrence=recurrence)
+        skipped.update(i for _, i in members[1:])
+
+    if not replaced:
+        return list(events)
+    print(f"🔁 Collapsed {len(replaced) + len(skipped)} events into {len(replaced)} recurring event(s).")
+    return [replaced.get(i, event) for i, event in enumerate(events) if i not in skipped]
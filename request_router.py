@@ -0,0 +1,261 @@
+"""
+Fast path in front of the chat agent for requests with a fixed workflow.
+
+Most requests name one Google Doc or Sheet and either want its events in the calendar
+("get info from docs <id> and add to calendar") or want to see them ("... when it
+starts and ends"). Through the agent those take four or more sequential Gemini round
+trips (pick a tool, read, extract, insert, answer). RequestRouter recognizes them with
+regular expressions, runs read -> extract -> upsert itself and makes only the one
+extraction call. Anything it doesn't recognize confidently, it leaves to the agent:
+handle() returns None.
+
+The router counts how many requests it handled and, from the agent runs it is told
+about (record_agent_run), estimates the time it saved.
+"""
+import re
+import threading
+import time
+from dataclasses import dataclass
+from tracing import count, span
+from ai_event_extractor import query_selects_all
+
+_ID_CHARS = r"[A-Za-z0-9_-]"
+DOC_URL_RE = re.compile(rf"docs\.google\.com/document/(?:u/\d+/)?d/({_ID_CHARS}{{20,}})")
+SHEET_URL_RE = re.compile(rf"docs\.google\.com/spreadsheets/(?:u/\d+/)?d/({_ID_CHARS}{{20,}})")
+URL_RE = re.compile(r"https?://\S+")
+# Drive file IDs are about 44 characters of letters, digits, "-" and "_".
+BARE_ID_RE = re.compile(rf"(?<![\w-])(?=[\w-]*\d)(?=[\w-]*[A-Za-z]){_ID_CHARS}{{30,}}(?![\w-])")
+
+DOC_WORD_RE = re.compile(r"\b(docs?|documents?)\b", re.IGNORECASE)
+SHEET_WORD_RE = re.compile(r"\b(sheets?|spreadsheets?|tables?)\b", re.IGNORECASE)
+
+ADD_INTENT_RE = re.compile(
+    r"\b(add|put|schedule|import|save|create|copy|sync)\b.*\bcalendar\b|\b(to|in|into) (my |the )?calendar\b",
+    re.IGNORECASE,
+)
+LIST_INTENT_RE = re.compile(
+    r"\b(when|what|which|list|show|find|get|extract)\b.*\b(events?|dates?|schedule|starts?|ends?|meetings?|times?)\b",
+    re.IGNORECASE,
+)
+# Requests that need the agent's reasoning or its other tools.
+AGENT_ONLY_RE = re.compile(
+    r"\b(new calendar|summari[sz]e|explain|tell|describe|why|how many|compare|translate|delete|remove|cancel"
+    r"|move|reschedule|excerpt|quote)\b",
+    re.IGNORECASE,
+)
+# A calendar named by its ID (an email-like address); the fast path only writes to the primary calendar.
+CALENDAR_ID_RE = re.compile(r"[\w.+-]+@[\w-]+\.[\w.-]+")
+# "... calendar called Uni", "... calendars"
+NAMED_CALENDAR_RE = re.compile(r"\bcalendars\b|\bcalendar\s+(called|named|titled)\b", re.IGNORECASE)
+# Every "calendar" must read as the user's own one: preceded by to/in/my/the/primary/google (or
+# nothing) and followed only by words that don't qualify it ("... to my calendar please").
+# "my Work calendar", "the calendar Team Sync" and "to calendar as all-day events" go to the agent.
+CALENDAR_WORD_RE = re.compile(r"(\w+)?\W*\bcalendar\b", re.IGNORECASE)
+PRIMARY_CALENDAR_BEFORE = {"to", "in", "into", "on", "my", "the", "primary", "google"}
+PRIMARY_CALENDAR_AFTER = {"please", "too", "also", "now", "thanks", "thank", "you", "from", "the", "this", "my",
+                          "google", "doc", "docs", "document", "sheet", "sheets", "spreadsheet"}
+# How the events should be written (all-day, reminders, a time zone, ...), which the fast path can't honor.
+EVENT_OPTIONS_RE = re.compile(
+    r"\b(all[- ]day|remind\w*|notif\w*|alerts?|invite\w*|attendees?|guests?|colou?r\w*|private|busy|free"
+    r"|time ?zones?|UTC|GMT|location|recurring|repeat\w*)\b|\b[A-Z][a-z]+/[A-Z][A-Za-z_]+\b",
+    re.IGNORECASE,
+)
+NEGATION_RE = re.compile(r"\b(not|never|without|dont|cannot)\b|n['’]t\b", re.IGNORECASE)
+
+MAX_LISTED_EVENTS = 50
+
+
+@dataclass
+class Route:
+    """A recognized request: what to read and what to do with its events ('add' or 'list')."""
+    kind: str
+    source_id: str
+    intent: str
+
+
+def _mentions_other_calendar(text: str) -> bool:
+    if CALENDAR_ID_RE.search(text) or NAMED_CALENDAR_RE.search(text):
+        return True
+    for match in CALENDAR_WORD_RE.finditer(text):
+        before = match.group(1)
+        if before and before.lower() not in PRIMARY_CALENDAR_BEFORE:
+            return True
+        after = BARE_ID_RE.sub(" ", URL_RE.sub(" ", text[match.end():]))
+        if any(word.lower() not in PRIMARY_CALENDAR_AFTER for word in re.findall(r"\w+", after)):
+            return True
+    return False
+
+
+def match_request(text: str):
+    """Returns the Route for a request the fast path can handle, or None."""
+    if (AGENT_ONLY_RE.search(text) or NEGATION_RE.search(text) or EVENT_OPTIONS_RE.search(URL_RE.sub(" ", text))
+            or _mentions_other_calendar(text)):
+        return None
+
+    doc_ids = set(DOC_URL_RE.findall(text))
+    sheet_ids = set(SHEET_URL_RE.findall(text))
+    if not doc_ids and not sheet_ids:
+        bare_ids = set(BARE_ID_RE.findall(URL_RE.sub(" ", text)))
+        mentions_doc, mentions_sheet = DOC_WORD_RE.search(text), SHEET_WORD_RE.search(text)
+        if mentions_doc and not mentions_sheet:
+            doc_ids = bare_ids
+        elif mentions_sheet and not mentions_doc:
+            sheet_ids = bare_ids
+    if len(doc_ids) + len(sheet_ids) != 1:
+        return None
+
+    if ADD_INTENT_RE.search(text):
+        intent = "add"
+    elif LIST_INTENT_RE.search(text):
+        intent = "list"
+    else:
+        return None
+    if doc_ids:
+        return Route("doc", doc_ids.pop(), intent)
+    # Schedule tables are parsed without Gemini, which can't pick some of the events;
+    # the agent handles sheet requests that ask for less than all of them.
+    if not query_selects_all(text):
+        return None
+    return Route("sheet", sheet_ids.pop(), intent)
+
+
+def _format_events(events: list) -> list:
+    lines = []
+    for event in events[:MAX_LISTED_EVENTS]:
+        line = f"- {event.get('summary')}: {event.get('start_datetime')} to {event.get('end_datetime')}"
+        if event.get("description"):
+            line += f" ({event['description']})"
+        lines.append(line)
+    if len(events) > MAX_LISTED_EVENTS:
+        lines.append(f"- ... and {len(events) - MAX_LISTED_EVENTS} more.")
+    return lines
+
+
+class RequestRouter:
+    """Runs recognized requests directly and keeps hit-rate and latency statistics."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.hits = 0
+        self.routed_seconds = 0.0
+        self.agent_runs = 0
+        self.agent_seconds = 0.0
+
+    def handle(self, text: str):
+        """Answers the request through the fast path. Returns None when the agent should handle it."""
+        with self._lock:
+            self.requests += 1
+        route = match_request(text)
+        if route is None:
+            count("router_requests", outcome="agent")
+            return None
+
+        started = time.perf_counter()
+        with span("router.route", kind=route.kind, intent=route.intent) as current:
+            answer = self._run(route, text)
+            current.set(routed=answer is not None)
+        if answer is None:
+            count("router_requests", outcome="agent")
+            return None
+
+        seconds = time.perf_counter() - started
+        with self._lock:
+            self.hits += 1
+            self.routed_seconds += seconds
+        count("router_requests", outcome="routed")
+        print(f"⚡ Handled without the agent in {seconds:.1f}s ({self.summary()})")
+        return answer
+
+    def record_agent_run(self, seconds: float):
+        """Tells the router how long a request the agent handled took, for the saved-time estimate."""
+        with self._lock:
+            self.agent_runs += 1
+            self.agent_seconds += seconds
+
+    def stats(self) -> dict:
+        """Hit rate and, once the agent has run at least once, the estimated seconds saved."""
+        with self._lock:
+            routed_mean = self.routed_seconds / self.hits if self.hits else 0.0
+            agent_mean = self.agent_seconds / self.agent_runs if self.agent_runs else None
+            return {
+                "requests": self.requests,
+                "hits": self.hits,
+                "hit_rate": self.hits / self.requests if self.requests else 0.0,
+                "routed_mean_seconds": routed_mean,
+                "agent_mean_seconds": agent_mean,
+                "saved_seconds": max(0.0, agent_mean - routed_mean) * self.hits if agent_mean is not None else None,
+            }
+
+    def summary(self) -> str:
+        stats = self.stats()
+        text = f"fast path: {stats['hits']}/{stats['requests']} requests ({stats['hit_rate']:.0%})"
+        if stats["saved_seconds"] is not None:
+            text += f", about {stats['saved_seconds']:.0f}s saved"
+        return text
+
+    def _run(self, route: Route, text: str):
+        # Imported on first use, like the agent, so that the prompt appears quickly.
+        from tzlocal import get_localzone_name
+        from google_auth import get_google_services
+        from document_cache import read_google_doc_cached, read_google_sheet_rows_cached
+        from ai_event_extractor import ExtractionError, extract_events_from_rows, extract_events_from_text
+        from calendar_index import upsert_calendar_events
+        from recurrence import collapse_recurring_events
+
+        services = get_google_services()
+        if not services:
+            return None
+        if route.kind == "doc":
+            content = read_google_doc_cached(services, route.source_id)
+        else:
+            content = read_google_sheet_rows_cached(services, route.source_id)
+        if content is None:
+            # Perhaps not a doc (or sheet) after all; the agent can work that out.
+            return None
+
+        source = f"the {'document' if route.kind == 'doc' else 'sheet'} {route.source_id}"
+        try:
+            if route.kind == "doc":
+                events = extract_events_from_text(content, text) if content.strip() else []
+            else:
+                events = extract_events_from_rows(content, text) if content else []
+        except ExtractionError as e:
+            return f"⚠️ The events in {source} could not be extracted, the AI service failed ({e}). Please try again."
+        if not events:
+            return f"No matching events were found in {source}."
+
+        if route.intent == "list":
+            return "\n".join([f"Found {len(events)} event(s) in {source}:"] + _format_events(events))
+
+        try:
+            timezone = get_localzone_name()
+        except Exception:
+            timezone = "UTC"
+        events = collapse_recurring_events(events, timezone)
+        results = upsert_calendar_events(services["calendar"], "primary", events, timezone)
+        actions = {action: sum(1 for r in results if r["ok"] and r["action"] == action)
+                   for action in ("created", "updated", "unchanged")}
+        lines = [f"Added the events of {source} to your calendar: {actions['created']} created, "
+                 f"{actions['updated']} updated, {actions['unchanged']} already there."]
+        for event, result in zip(events, results):
+            repeats = " (recurring)" if event.get("recurrence") else ""
+            if result["ok"]:
+                lines.append(f"- {result['action'].capitalize()} '{event.get('summary')}' "
+                             f"at {event.get('start_datetime')}{repeats}")
+            else:
+                lines.append(f"- Failed '{event.get('summary')}': {result['error']}")
+        return "\n".join(lines)
+
+
+_router = None
+_router_lock = threading.Lock()
+
+
+def get_request_router() -> RequestRouter:
+    """Returns the process-wide request router, creating it on first use."""
+    global _router
+    with _router_lock:
+        if _router is None:
+            _router = RequestRouter()
+        return _router
@@ -0,0 +1,396 @@
+import re
+from datetime import date, datetime, time, timedelta
+
+# A table is only parsed locally when at least this fraction of the sampled data rows
+# turns into events; anything less is left to Gemini.
+MIN_PARSE_RATE = 0.8
+# A column gets a type (date, time, ...) when this fraction of its non-empty cells parses as it.
+MIN_COLUMN_TYPE_RATE = 0.8
+HEADER_SCAN_ROWS = 5
+SAMPLE_ROWS = 50
+DEFAULT_DURATION = timedelta(hours=1)
+
+_HEADER_SYNONYMS = {
+    'summary': {
+        'title', 'event', 'event name', 'summary', 'name', 'subject', 'session', 'activity', 'topic',
+        'class', 'course', 'meeting', 'titel', 'veranstaltung', 'titre', 'événement', 'evento',
+        'título', 'название', 'событие', 'тема', 'назва', 'подія',
+    },
+    'date': {'date', 'day', 'datum', 'tag', 'jour', 'fecha', 'día', 'дата', 'день'},
+    'datetime': {'date and time', 'date/time', 'datetime', 'when', 'start date', 'starts at'},
+    'start': {
+        'start', 'start time', 'starts', 'begin', 'begins', 'from', 'time', 'beginn', 'von', 'uhrzeit',
+        'début', 'heure', 'inicio', 'hora', 'начало', 'время', 'початок', 'час',
+    },
+    'end': {
+        'end', 'end time', 'ends', 'finish', 'to', 'until', 'ende', 'bis', 'fin', 'конец',
+        'окончание', 'кінець',
+    },
+    'duration': {'duration', 'length', 'minutes', 'mins', 'hours', 'dauer', 'durée', 'duración',
+                 'длительность', 'тривалість'},
+    'description': {
+        'description', 'details', 'notes', 'note', 'comment', 'comments', 'beschreibung',
+        'описание', 'опис', 'примечание',
+    },
+}
+
+_MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3, 'apr': 4, 'april': 4,
+    'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7, 'aug': 8, 'august': 8, 'sep': 9, 'sept': 9,
+    'september': 9, 'oct': 10, 'october': 10, 'nov': 11, 'november': 11, 'dec': 12, 'december': 12,
+}
+
+_ISO_DATE_RE = re.compile(r"^(\d{4})[-/.](\d{1,2})[-/.](\d{1,2})$")
+_NUMERIC_DATE_RE = re.compile(r"^(\d{1,2})([./-])(\d{1,2})(?:\2(\d{2}|\d{4}))?$")
+_DAY_MONTH_RE = re.compile(r"^(\d{1,2})(?:st|nd|rd|th)?\.?\s+([a-z]+)\.?,?(?:\s+(\d{4}))?$")
+_MONTH_DAY_RE = re.compile(r"^([a-z]+)\.?\s+(\d{1,2})(?:st|nd|rd|th)?,?(?:\s+(\d{4}))?$")
+_WEEKDAY_PREFIX_RE = re.compile(r"^(?:mon|tue|wed|thu|fri|sat|sun)[a-z]*\.?,?\s+")
+_TIME_RE = re.compile(
+    r"^(?P<hour>\d{1,2})(?::(?P<minute>\d{2})|(?P<h>h)(?P<h_minute>\d{2})?)?(?::(?P<second>\d{2}))?"
+    r"\s*(?P<meridiem>am|pm|a\.m\.|p\.m\.)?$"
+)
+_RANGE_SPLIT_RE = re.compile(r"\s*(?:-|–|—|\bto\b|\bbis\b|\bдо\b)\s*")
+_DATETIME_SPLIT_RE = re.compile(r"^(.*?)(?:t|,?\s+(?:at\s+)?)(\d{1,2}(?::\d{2}){1,2}\s*(?:am|pm)?)$")
+_DURATION_RE = re.compile(
+    r"^(?:(\d+(?:\.\d+)?)\s*(?:h|hr|hrs|hour|hours|ч)\.?)?\s*(?:(\d+)\s*(?:m|min|mins|minutes|мин)?\.?)?$"
+)
+_CLOCK_DURATION_RE = re.compile(r"^(\d{1,2}):(\d{2})$")
+
+
+def _clean(value) -> str:
+    return str(value).strip().lower() if value is not None else ""
+
+
+def parse_date(value, today: date = None, order: str = "MDY"):
+    """Parses a date cell. Returns a date or None. order decides ambiguous d/m/y cells ("MDY" or "DMY")."""
+    text = _WEEKDAY_PREFIX_RE.sub("", _clean(value))
+    if not text:
+        return None
+    year_default = (today or date.today()).year
+
+    try:
+        m = _ISO_DATE_RE.match(text)
+        if m:
+            return date(int(m.group(1)), int(m.group(2)), int(m.group(3)))
+
+        m = _NUMERIC_DATE_RE.match(text)
+        if m:
+            first, second = int(m.group(1)), int(m.group(3))
+            if m.group(2) == "-" and not m.group(4):
+                return None
+            year = int(m.group(4)) if m.group(4) else year_default
+            if year < 100:
+                year += 2000
+            month, day = (first, second) if order == "MDY" else (second, first)
+            return date(year, month, day)
+
+        m = _DAY_MONTH_RE.match(text)
+        if m and m.group(2) in _MONTHS:
+            return date(int(m.group(3) or year_default), _MONTHS[m.group(2)], int(m.group(1)))
+
+        m = _MONTH_DAY_RE.match(text)
+        if m and m.group(1) in _MONTHS:
+            return date(int(m.group(3) or year_default), _MONTHS[m.group(1)], int(m.group(2)))
+    except ValueError:
+        return None
+    return None
+
+
+def parse_time(value, allow_bare_hour: bool = False):
+    """Parses a clock time such as 9:30, 14:00:00, 3pm, 10 a.m., 14h30 or 14h. Returns a time or None."""
+    text = _clean(value)
+    m = _TIME_RE.match(text)
+    if not m:
+        return None
+    hour, second, meridiem = int(m.group("hour")), m.group("second"), m.group("meridiem")
+    minute = m.group("minute") or m.group("h_minute")
+    if minute is None and meridiem is None and not (allow_bare_hour or m.group("h")):
+        return None
+    if meridiem:
+        if hour < 1 or hour > 12:
+            return None
+        hour = hour % 12 + (12 if meridiem.startswith("p") else 0)
+    try:
+        return time(hour, int(minute or 0), int(second or 0))
+    except ValueError:
+        return None
+
+
+def parse_time_range(value):
+    """Parses a range such as 10:00-11:30 or 9-11am. Returns (start, end) times or None."""
+    parts = _RANGE_SPLIT_RE.split(_clean(value))
+    if len(parts) != 2:
+        return None
+    start = parse_time(parts[0])
+    end = parse_time(parts[1])
+    if end is not None and start is None:
+        # "9-11am": the meridiem is only written on the end.
+        meridiem = re.search(r"(am|pm)$", parts[1])
+        if meridiem:
+            start = parse_time(parts[0] + meridiem.group(1))
+    if start is None or end is None:
+        return None
+    return start, end
+
+
+def parse_datetime(value, today: date = None, order: str = "MDY"):
+    """Parses a cell holding both a date and a time. Returns a datetime or None."""
+    text = _clean(value)
+    m = _DATETIME_SPLIT_RE.match(text)
+    if not m:
+        return None
+    day = parse_date(m.group(1).strip(" ,"), today, order)
+    clock = parse_time(m.group(2))
+    if day is None or clock is None:
+        return None
+    return datetime.combine(day, clock)
+
+
+def parse_duration(value):
+    """Parses a duration such as 90, 90 min, 1h, 1h30, 1.5 hours or 1:30. Returns a timedelta or None."""
+    text = _clean(value)
+    if not text:
+        return None
+    m = _CLOCK_DURATION_RE.match(text)
+    if m:
+        return timedelta(hours=int(m.group(1)), minutes=int(m.group(2)))
+    m = _DURATION_RE.match(text)
+    if not m or not (m.group(1) or m.group(2)):
+        return None
+    duration = timedelta(hours=float(m.group(1) or 0), minutes=int(m.group(2) or 0))
+    return duration if duration > timedelta(0) else None
+
+
+def _normalize_header(value) -> str:
+    text = re.sub(r"\(.*?\)", "", _clean(value))
+    return " ".join(re.sub(r"[:*#_]", " ", text).split())
+
+
+def _match_header(row: list) -> dict:
+    """Returns role -> column index for the cells of row that look like known column names."""
+    roles = {}
+    for index, cell in enumerate(row):
+        name = _normalize_header(cell)
+        for role, synonyms in _HEADER_SYNONYMS.items():
+            if name in synonyms and role not in roles:
+                roles[role] = index
+                break
+    return roles
+
+
+def _rate(values: list, parser) -> float:
+    values = [v for v in values if _clean(v)]
+    if not values:
+        return 0.0
+    return sum(1 for v in values if parser(v) is not None) / len(values)
+
+
+def _column(rows: list, index: int) -> list:
+    return [row[index] if index < len(row) else "" for row in rows]
+
+
+def _detect_date_order(values: list) -> str:
+    mdy = dmy = False
+    for value in values:
+        m = _NUMERIC_DATE_RE.match(_clean(value))
+        if m:
+            first, second = int(m.group(1)), int(m.group(3))
+            dmy = dmy or first > 12
+            mdy = mdy or second > 12
+            if m.group(2) == ".":
+                dmy = True
+    if dmy and not mdy:
+        return "DMY"
+    return "MDY"
+
+
+class ScheduleTableParser:
+    """
+    Turns the rows of a regular schedule table into event dicts without calling Gemini.
+
+    Use ScheduleTableParser.detect(rows) on the first rows of a sheet: it finds the header
+    row (if any), infers which columns hold the title, date, start, end, duration and
+    description, and returns None unless the inferred mapping parses most of the rows.
+    The returned parser can then be applied to the rest of the sheet window by window.
+    """
+
+    def __init__(self, columns: dict, headers: list, data_start_row: int, date_order: str,
+                 today: date = None, default_duration: timedelta = DEFAULT_DURATION):
+        self.columns = columns
+        self.headers = headers
+        self.data_start_row = data_start_row
+        self.date_order = date_order
+        self.today = today or date.today()
+        self.default_duration = default_duration
+        self.confidence = 0.0
+
+    @classmethod
+    def detect(cls, rows: list, today: date = None):
+        """Returns a parser for the table in rows, or None if it can't be mapped with confidence."""
+        non_empty = [i for i, row in enumerate(rows) if any(_clean(cell) for cell in row)]
+        if not non_empty:
+            return None
+
+        header_index = None
+        columns = {}
+        for i in non_empty[:HEADER_SCAN_ROWS]:
+            roles = _match_header(rows[i])
+            if len(roles) >= 2:
+                header_index, columns = i, roles
+                break
+
+        data_start_row = header_index + 1 if header_index is not None else 0
+        data = [rows[i] for i in non_empty if i >= data_start_row][:SAMPLE_ROWS]
+        if not data:
+            return None
+        width = max(len(row) for row in data)
+        columns = cls._infer_types(data, width, columns)
+        if 'summary' not in columns or not ({'date', 'datetime'} & columns.keys()):
+            return None
+
+        date_column = columns.get('date', columns.get('datetime'))
+        headers = list(rows[header_index]) if header_index is not None else []
+        parser = cls(columns, headers, data_start_row, _detect_date_order(_column(data, date_column)), today)
+        parsed = sum(1 for row in data if parser.parse_row(row) is not None)
+        parser.confidence = parsed / len(data)
+        return parser if parser.confidence >= MIN_PARSE_RATE else None
+
+    @staticmethod
+    def _infer_types(data: list, width: int, columns: dict) -> dict:
+        columns = dict(columns)
+        typed = set(columns.values())
+
+        # A "date" column that also carries times is really a datetime column.
+        if 'date' in columns and _rate(_column(data, columns['date']), parse_datetime) >= MIN_COLUMN_TYPE_RATE:
+            columns['datetime'] = columns.pop('date')
+        # A lone time column may hold ranges such as "10:00-11:00".
+        if 'start' in columns and 'end' not in columns:
+            if _rate(_column(data, columns['start']), parse_time_range) >= MIN_COLUMN_TYPE_RATE:
+                columns['range'] = columns.pop('start')
+
+        free = [i for i in range(width) if i not in typed]
+        if not ({'date', 'datetime'} & columns.keys()):
+            for i in free:
+                values = _column(data, i)
+                if _rate(values, parse_datetime) >= MIN_COLUMN_TYPE_RATE:
+                    columns['datetime'] = i
+                    break
+                if _rate(values, parse_date) >= MIN_COLUMN_TYPE_RATE:
+                    columns['date'] = i
+                    break
+        if not ({'start', 'range', 'datetime'} & columns.keys()):
+            for i in free:
+                if i in columns.values():
+                    continue
+                values = _column(data, i)
+                if _rate(values, parse_time_range) >= MIN_COLUMN_TYPE_RATE:
+                    columns['range'] = i
+                    break
+                if _rate(values, parse_time) >= MIN_COLUMN_TYPE_RATE:
+                    if 'start' not in columns:
+                        columns['start'] = i
+                    elif 'end' not in columns:
+                        columns['end'] = i
+                        break
+        if 'summary' not in columns:
+            # The title is the text column with the most distinct values.
+            candidates = [i for i in free if i not in columns.values()]
+            best, best_distinct = None, 0
+            for i in candidates:
+                values = [_clean(v) for v in _column(data, i) if _clean(v)]
+                if len(values) < len(data) * MIN_COLUMN_TYPE_RATE:
+                    continue
+                if _rate(values, parse_duration) >= MIN_COLUMN_TYPE_RATE:
+                    continue
+                distinct = len(set(values))
+                if distinct > best_distinct:
+                    best, best_distinct = i, distinct
+            if best is not None:
+                columns['summary'] = best
+        return columns
+
+    def _cell(self, row: list, role: str) -> str:
+        index = self.columns.get(role)
+        if index is None or index >= len(row):
+            return ""
+        return str(row[index]).strip()
+
+    def parse_row(self, row: list):
+        """Returns the event dict for one data row, or None if the row can't be mapped."""
+        summary = self._cell(row, 'summary')
+        if not summary:
+            return None
+
+        end = None
+        if 'datetime' in self.columns:
+            start = parse_datetime(self._cell(row, 'datetime'), self.today, self.date_order)
+            if start is None:
+                return None
+            day = start.date()
+        else:
+            day = parse_date(self._cell(row, 'date'), self.today, self.date_order)
+            if day is None:
+                return None
+            if 'range' in self.columns:
+                times = parse_time_range(self._cell(row, 'range'))
+                if times is None:
+                    return None
+                start = datetime.combine(day, times[0])
+                end = datetime.combine(day, times[1])
+            else:
+                start_time = parse_time(self._cell(row, 'start'), allow_bare_hour=True)
+                if start_time is None:
+                    return None
+                start = datetime.combine(day, start_time)
+
+        if end is None and self._cell(row, 'end'):
+            end_value = self._cell(row, 'end')
+            end_time = parse_time(end_value, allow_bare_hour=True)
+            if end_time is not None:
+                end = datetime.combine(day, end_time)
+            else:
+                end = parse_datetime(end_value, self.today, self.date_order)
+        if end is None and self._cell(row, 'duration'):
+            duration = parse_duration(self._cell(row, 'duration'))
+            if duration is not None:
+                end = start + duration
+        if end is None:
+            end = start + self.default_duration
+        elif end <= start:
+            # An end time before the start time means the event runs past midnight.
+            end += timedelta(days=1)
+
+        return {
+            'summary': summary,
+            'start_datetime': start.isoformat(timespec='seconds'),
+            'end_datetime': end.isoformat(timespec='seconds'),
+            'description': self._description(row),
+        }
+
+    def _description(self, row: list) -> str:
+        parts = []
+        description = self._cell(row, 'description')
+        if description:
+            parts.append(description)
+        mapped = set(self.columns.values())
+        for index, value in enumerate(row):
+            value = str(value).strip()
+            if index in mapped or not value:
+                continue
+            label = str(self.headers[index]).strip() if index < len(self.headers) else ""
+            parts.append(f"{label}: {value}" if label else value)
+        return "; ".join(parts)
+
+    def parse_rows(self, rows: list) -> tuple:
+        """Parses data rows. Returns (events, unmapped_rows); empty rows are dropped."""
+        events = []
+        unmapped = []
+        for row in rows:
+            if not any(str(cell).strip() for cell in row):
+                continue
+            event = self.parse_row(row)
+            if event is None:
+                unmapped.append(row)
+            else:
+                events.append(event)
+        return events, unmapped
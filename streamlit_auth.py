@@ -0,0 +1,66 @@
+"""
+Google sign-in for the Streamlit apps when one server is shared by several users.
+
+Multi-user mode is off by default: the apps then act on the account in token.json,
+like the command-line tools. With EVENT_SCHEDULER_MULTI_USER=1 every browser session
+signs in with its own Google account through the OAuth web flow, its tokens go to the
+encrypted credential store, and each script run is bound to that user (see
+credential_store.set_current_user), so the Google clients, the calendar index and
+the agent's content handles are the user's own.
+
+The OAuth client in credentials.json must be a "Web application" client that lists
+OAUTH_REDIRECT_URI (the app's own URL) as an authorized redirect URI.
+"""
+import os
+import streamlit as st
+from credential_store import set_current_user
+from google_auth import finish_web_sign_in, start_web_sign_in
+
+MULTI_USER_ENV = "EVENT_SCHEDULER_MULTI_USER"
+REDIRECT_URI = os.getenv("OAUTH_REDIRECT_URI", "http://localhost:8501")
+
+
+def multi_user_enabled() -> bool:
+    return os.getenv(MULTI_USER_ENV, "").lower() in ("1", "true", "yes")
+
+
+def require_google_user():
+    """
+    Returns the signed-in user's ID (their email address), or None in single-user mode.
+    Renders the sign-in link and stops the script run while nobody is signed in.
+    Call it near the top of the script, before anything uses the Google clients.
+    """
+    if not multi_user_enabled():
+        return None
+
+    params = st.query_params
+    if "code" in params and "state" in params:
+        # Google redirected back here after the consent screen.
+        try:
+            st.session_state.google_user = finish_web_sign_in(params["state"], params["code"])
+        except Exception as e:
+            st.error(f"Google sign-in failed: {e}")
+        st.session_state.pop("sign_in_url", None)
+        params.clear()
+
+    user_id = st.session_state.get("google_user")
+    set_current_user(user_id)
+    if user_id is None:
+        st.info("Sign in with Google to let the app read your documents and manage your calendar.")
+        if "sign_in_url" not in st.session_state:
+            try:
+                st.session_state.sign_in_url = start_web_sign_in(REDIRECT_URI)
+            except Exception as e:
+                st.error(f"Could not start the Google sign-in: {e}")
+                st.stop()
+        st.link_button("Sign in with Google", st.session_state.sign_in_url)
+        st.stop()
+
+    with st.sidebar:
+        st.caption(f"Signed in as {user_id}")
+        if st.button("Sign out"):
+            # Also drops the conversation and results, so the next user of this browser doesn't see them.
+            st.session_state.clear()
+            set_current_user(None)
+            st.rerun()
+    return user_id
@@ -0,0 +1,25 @@
+import os
+import sys
+from datetime import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from sheet_schedule_parser import parse_time, parse_time_range
+
+
+def test_parse_time_hour_with_h_suffix():
+    assert parse_time("14h") == time(14, 0)
+    assert parse_time("9H") == time(9, 0)
+
+
+def test_parse_time_h_separated_minutes():
+    assert parse_time("14h30") == time(14, 30)
+
+
+def test_parse_time_bare_hour_needs_allow_bare_hour():
+    assert parse_time("14") is None
+    assert parse_time("14", allow_bare_hour=True) == time(14, 0)
+
+
+def test_parse_time_range_with_h_suffix():
+    assert parse_time_range("9h-11h") == (time(9, 0), time(11, 0))
@@ -0,0 +1,238 @@
+"""
+Lightweight tracing for the hot paths: agent tools, Google API calls and Gemini calls.
+
+Tracing is off by default and then costs one boolean check per instrumented call.
+Turn it on with EVENT_SCHEDULER_TRACE=1 in the environment (or .env) or by calling
+enable_tracing(). Finished spans are appended to TRACE_PATH as JSON lines, and
+aggregated timings and counters are written to METRICS_PATH in the Prometheus text
+format at most every SNAPSHOT_INTERVAL_SECONDS and when the process exits.
+"""
+import atexit
+import functools
+import itertools
+import json
+import os
+import threading
+import time
+from contextvars import ContextVar
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TRACE_ENV = "EVENT_SCHEDULER_TRACE"
+TRACE_DIR = os.path.join(".cache", "traces")
+TRACE_PATH = os.path.join(TRACE_DIR, "spans.jsonl")
+METRICS_PATH = os.path.join(TRACE_DIR, "metrics.prom")
+SNAPSHOT_INTERVAL_SECONDS = 10.0
+METRIC_PREFIX = "event_scheduler"
+
+_enabled = False
+_lock = threading.Lock()
+_span_ids = itertools.count(1)
+_current_span = ContextVar("current_span", default=None)
+
+# span name -> [count, errors, total seconds, max seconds]
+_span_stats = {}
+# (metric name, sorted label items) -> value
+_counters = {}
+_last_snapshot = 0.0
+
+
+class _NullSpan:
+    """Stand-in returned by span() while tracing is off; every method is a no-op."""
+    recording = False
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+
+_NULL_SPAN = _NullSpan()
+
+
+class Span:
+    """A timed operation. Use through span(); attributes can be added with set() while it runs."""
+    recording = True
+
+    def __init__(self, name: str, attributes: dict):
+        self.name = name
+        self.attributes = attributes
+        self.span_id = next(_span_ids)
+        self.parent_id = None
+        self._token = None
+        self._start_time = 0.0
+        self._started = 0.0
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def __enter__(self):
+        parent = _current_span.get()
+        self.parent_id = parent.span_id if parent is not None else None
+        self._token = _current_span.set(self)
+        self._start_time = time.time()
+        self._started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        duration = time.perf_counter() - self._started
+        _current_span.reset(self._token)
+        _finish(self, duration, exc)
+        return False
+
+
+def tracing_enabled() -> bool:
+    return _enabled
+
+
+def enable_tracing(trace_path: str = None, metrics_path: str = None):
+    """Turns tracing on, optionally writing to other files than TRACE_PATH and METRICS_PATH."""
+    global _enabled, TRACE_PATH, METRICS_PATH
+    with _lock:
+        TRACE_PATH = trace_path or TRACE_PATH
+        METRICS_PATH = metrics_path or METRICS_PATH
+        for path in (TRACE_PATH, METRICS_PATH):
+            directory = os.path.dirname(path)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+        _enabled = True
+    print(f"📈 Tracing enabled: spans -> {TRACE_PATH}, metrics -> {METRICS_PATH}")
+
+
+def disable_tracing():
+    global _enabled
+    _enabled = False
+
+
+def span(name: str, **attributes):
+    """
+    Returns a context manager that times the enclosed block as a span named name.
+    Spans opened inside it (in the same thread or task) record it as their parent.
+    """
+    if not _enabled:
+        return _NULL_SPAN
+    return Span(name, attributes)
+
+
+def traced(name: str = None):
+    """Decorator that wraps every call of the function in a span (named after it by default)."""
+    def decorator(func):
+        span_name = name or f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+            with Span(span_name, {}):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def count(metric: str, value: float = 1, **labels):
+    """Adds value to the counter metric{labels}, exported as <METRIC_PREFIX>_<metric>_total."""
+    if not _enabled:
+        return
+    key = (metric, tuple(sorted(labels.items())))
+    with _lock:
+        _counters[key] = _counters.get(key, 0) + value
+
+
+def _finish(finished: Span, duration: float, exc):
+    record = {
+        "name": finished.name,
+        "span_id": finished.span_id,
+        "parent_id": finished.parent_id,
+        "thread": threading.current_thread().name,
+        "start": round(finished._start_time, 6),
+        "duration_ms": round(duration * 1000, 3),
+        "status": "error" if exc is not None else "ok",
+    }
+    if exc is not None:
+        record["error"] = f"{type(exc).__name__}: {exc}"
+    if finished.attributes:
+        record["attributes"] = finished.attributes
+    line = json.dumps(record, ensure_ascii=False, default=str) + "\n"
+
+    global _last_snapshot
+    with _lock:
+        stats = _span_stats.setdefault(finished.name, [0, 0, 0.0, 0.0])
+        stats[0] += 1
+        stats[1] += exc is not None
+        stats[2] += duration
+        stats[3] = max(stats[3], duration)
+        with open(TRACE_PATH, "a", encoding="utf-8") as f:
+            f.write(line)
+        snapshot_due = time.monotonic() - _last_snapshot >= SNAPSHOT_INTERVAL_SECONDS
+        if snapshot_due:
+            _last_snapshot = time.monotonic()
+    if snapshot_due:
+        write_metrics_snapshot()
+
+
+def _escape_label(value) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(items) -> str:
+    if not items:
+        return ""
+    return "{" + ",".join(f'{key}="{_escape_label(value)}"' for key, value in items) + "}"
+
+
+def metrics_text() -> str:
+    """Returns the current span timings and counters in the Prometheus text exposition format."""
+    with _lock:
+        span_stats = {name: list(stats) for name, stats in _span_stats.items()}
+        counters = dict(_counters)
+
+    lines = [
+        f"# HELP {METRIC_PREFIX}_span_seconds Wall time of traced operations.",
+        f"# TYPE {METRIC_PREFIX}_span_seconds summary",
+    ]
+    for name, (calls, _, total, _) in sorted(span_stats.items()):
+        labels = _labels([("span", name)])
+        lines.append(f"{METRIC_PREFIX}_span_seconds_count{labels} {calls}")
+        lines.append(f"{METRIC_PREFIX}_span_seconds_sum{labels} {total:.6f}")
+    lines.append(f"# TYPE {METRIC_PREFIX}_span_seconds_max gauge")
+    for name, stats in sorted(span_stats.items()):
+        lines.append(f"{METRIC_PREFIX}_span_seconds_max{_labels([('span', name)])} {stats[3]:.6f}")
+    lines.append(f"# TYPE {METRIC_PREFIX}_span_errors_total counter")
+    for name, stats in sorted(span_stats.items()):
+        lines.append(f"{METRIC_PREFIX}_span_errors_total{_labels([('span', name)])} {stats[1]}")
+
+    typed = set()
+    for (metric, label_items), value in sorted(counters.items()):
+        full_name = f"{METRIC_PREFIX}_{metric}_total"
+        if full_name not in typed:
+            lines.append(f"# TYPE {full_name} counter")
+            typed.add(full_name)
+        lines.append(f"{full_name}{_labels(label_items)} {value:g}")
+    return "\n".join(lines) + "\n"
+
+
+def write_metrics_snapshot(path: str = None):
+    """Writes metrics_text() to path (METRICS_PATH by default), replacing the previous snapshot."""
+    path = path or METRICS_PATH
+    temp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with open(temp_path, "w", encoding="utf-8") as f:
+        f.write(metrics_text())
+    os.replace(temp_path, path)
+
+
+@atexit.register
+def _write_final_snapshot():
+    if _enabled and _span_stats:
+        try:
+            write_metrics_snapshot()
+        except OSError as e:
+            print(f"⚠️ Could not write the metrics snapshot: {e}")
+
+
+if os.getenv(TRACE_ENV, "").strip().lower() in ("1", "true", "yes", "on"):
+    enable_tracing()
@@ -0,0 +1,314 @@
+"""
+Keeps the calendar in sync with living schedule documents.
+
+watch() polls the sources of a batch-import manifest (see batch_import.py). A poll of
+an unchanged source costs one small request: the Docs revisionId or the spreadsheet's
+Drive modifiedTime. When it changed, the flattened content is split into regions (the
+lines of a doc, the rows of a sheet) and diffed against the snapshot from the last
+poll with difflib. Only the changed regions, with a few lines of context around each,
+go through Gemini, so the cost of a poll grows with how much changed, not with the
+size of the document.
+
+Every calendar event the watcher wrote is remembered together with the region it was
+extracted from. Events of changed regions are upserted (see calendar_index); events
+whose region disappeared and that were not extracted again are deleted.
+
+Events are kept one per occurrence here (they are not collapsed into recurring events,
+see recurrence.py), so an edited line maps to the one event it describes.
+"""
+import difflib
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from tzlocal import get_localzone_name
+from google_auth import get_google_services
+from batch_import import load_manifest
+from ai_event_extractor import ExtractionError, extract_events_from_rows, extract_events_from_text, iter_events_from_text
+from calendar_index import event_fingerprint, get_calendar_index, normalize_summary, to_utc, upsert_calendar_events
+from doc_flattener import format_table_rows
+from google_services import (
+    delete_calendar_events_batch,
+    get_drive_file_modified_time,
+    get_google_doc_content,
+    get_google_doc_revision,
+    get_google_sheet_rows,
+)
+
+STATE_PATH = os.path.join(".cache", "watcher.sqlite")
+DEFAULT_INTERVAL_SECONDS = 300
+# Lines of unchanged text sent along with a changed doc region (headings, dates above it).
+CONTEXT_BEFORE = 3
+CONTEXT_AFTER = 1
+# Above this fraction of changed regions, the whole source is extracted again.
+FULL_EXTRACTION_RATIO = 0.5
+
+
+_WORD_RE = re.compile(r"\w+")
+
+
+def _region_hash(text: str) -> str:
+    return hashlib.sha1(text.encode("utf-8")).hexdigest()[:16]
+
+
+class WatchState:
+    """
+    SQLite store of what the watcher saw last: per source the version and the regions
+    of its content, and the fingerprints of the calendar events extracted from it,
+    each with the hash of the region it came from.
+    """
+
+    def __init__(self, path: str = STATE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with self._connect() as conn:
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS snapshots ("
+                " source_key TEXT PRIMARY KEY,"
+                " version TEXT NOT NULL,"
+                " regions TEXT NOT NULL,"
+                " updated_at REAL NOT NULL)"
+            )
+            conn.execute(
+                "CREATE TABLE IF NOT EXISTS source_events ("
+                " source_key TEXT NOT NULL,"
+                " fingerprint TEXT NOT NULL,"
+                " region_hash TEXT NOT NULL,"
+                " PRIMARY KEY (source_key, fingerprint))"
+            )
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def snapshot(self, source_key: str) -> tuple:
+        """Returns (version, regions) of the last poll that changed the source, or (None, None)."""
+        with self._lock, self._connect() as conn:
+            row = conn.execute("SELECT version, regions FROM snapshots WHERE source_key = ?", (source_key,)).fetchone()
+        if row is None:
+            return None, None
+        return row[0], json.loads(row[1])
+
+    def events(self, source_key: str) -> dict:
+        """Returns {fingerprint: region hash} of the events written for the source."""
+        with self._lock, self._connect() as conn:
+            rows = conn.execute("SELECT fingerprint, region_hash FROM source_events WHERE source_key = ?",
+                                (source_key,)).fetchall()
+        return dict(rows)
+
+    def save(self, source_key: str, version: str, regions: list, owned: dict, removed: list):
+        """Stores the new snapshot, records owned {fingerprint: region hash} and drops the removed fingerprints."""
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO snapshots (source_key, version, regions, updated_at) VALUES (?, ?, ?, ?)",
+                (source_key, version, json.dumps(regions, ensure_ascii=False), time.time()),
+            )
+            conn.executemany("INSERT OR REPLACE INTO source_events (source_key, fingerprint, region_hash)"
+                             " VALUES (?, ?, ?)", [(source_key, fp, region) for fp, region in owned.items()])
+            conn.executemany("DELETE FROM source_events WHERE source_key = ? AND fingerprint = ?",
+                             [(source_key, fp) for fp in removed])
+
+
+def _changed_regions(old: list, new: list) -> tuple:
+    """Diffs two region lists. Returns (indexes of new regions that changed, hashes of old regions that went away)."""
+    changed = []
+    removed = set()
+    matcher = difflib.SequenceMatcher(None, old, new, autojunk=False)
+    for tag, old_start, old_end, new_start, new_end in matcher.get_opcodes():
+        if tag == "equal":
+            continue
+        changed.extend(range(new_start, new_end))
+        removed.update(_region_hash(region) for region in old[old_start:old_end])
+    # A line moved elsewhere in the document has not gone away.
+    removed -= {_region_hash(region) for region in new}
+    return changed, removed
+
+
+def _windows(changed: list, count: int, before: int, after: int) -> list:
+    """Merges the changed region indexes, widened by before/after regions of context, into (start, end) ranges."""
+    windows = []
+    for index in changed:
+        start, end = max(0, index - before), min(count, index + 1 + after)
+        if windows and start <= windows[-1][1]:
+            windows[-1] = (windows[-1][0], max(windows[-1][1], end))
+        else:
+            windows.append((start, end))
+    return windows
+
+
+def _owning_region(event: dict, regions: list) -> str:
+    """
+    Picks the region an event was most likely extracted from: the one sharing the most
+    words with its summary, preferring one that also mentions its start date or time.
+    Returns the region's hash.
+    """
+    words = set(_WORD_RE.findall(normalize_summary(event.get("summary"))))
+    start = str(event.get("start_datetime") or "")
+    hints = {start[:10], start[11:16], start[11:16].lstrip("0")} if len(start) >= 16 else set()
+
+    def score(region):
+        text = region.casefold()
+        return len(words & set(_WORD_RE.findall(text))) + 0.5 * sum(1 for hint in hints if hint and hint in text)
+
+    return _region_hash(max(regions, key=score))
+
+
+def _read_regions(item, services: dict) -> tuple:
+    """
+    Returns (regions, rows): the stripped non-empty lines of a doc and None, or the
+    formatted rows of a sheet (its header first) and the rows themselves.
+    regions is None when the source can't be read.
+    """
+    if item.kind == "doc":
+        text = get_google_doc_content(services["docs"], item.source_id)
+        if text is None:
+            return None, None
+        return [line.strip() for line in text.splitlines() if line.strip()], None
+    rows = get_google_sheet_rows(services["sheets"], item.source_id, item.sheet_name)
+    if not rows:
+        return None, None
+    return [format_table_rows([row]).strip() for row in rows], rows
+
+
+def _extract(item, regions: list, rows: list, windows: list) -> list:
+    """Extracts the events of the given region windows. Returns (event, owning region hash) pairs."""
+    extracted = []
+    for start, end in windows:
+        if rows is not None:
+            # Every window is read with the header, which is never part of one itself.
+            start = max(1, start)
+            events = extract_events_from_rows([rows[0]] + rows[start:end], item.user_query)
+        elif (start, end) == (0, len(regions)):
+            events = list(iter_events_from_text("\n".join(regions), item.user_query))
+        else:
+            events = extract_events_from_text("\n".join(regions[start:end]), item.user_query)
+        window = regions[start:end]
+        if window:
+            extracted.extend((event, _owning_region(event, window)) for event in events)
+    return extracted
+
+
+def sync_source(item, services: dict, timezone: str, state: WatchState) -> dict:
+    """
+    Brings the calendar up to date with one manifest item.
+    Returns None when the source did not change since the last poll (or can't be read),
+    else a dict of counters: 'regions', 'changed', 'extracted', 'created', 'updated',
+    'unchanged', 'deleted' and 'failed'. When a calendar write failed, the snapshot is
+    not advanced, so the next poll retries the change.
+    """
+    if item.kind == "doc":
+        version = get_google_doc_revision(services["docs"], item.source_id)
+    else:
+        version = get_drive_file_modified_time(services["drive"], item.source_id)
+    old_version, old_regions = state.snapshot(item.key)
+    if version is None or version == old_version:
+        return None
+
+    regions, rows = _read_regions(item, services)
+    if regions is None:
+        return None
+    owned = state.events(item.key)
+
+    changed, removed = _changed_regions(old_regions or [], regions)
+    # Without a snapshot, when a sheet's header changed (it changes how every row reads)
+    # or when most of the source changed, everything is extracted again.
+    full = (old_regions is None or (rows is not None and 0 in changed)
+            or len(changed) > FULL_EXTRACTION_RATIO * len(regions))
+    if full:
+        windows = [(0, len(regions))]
+        candidates = set(owned)
+    elif rows is not None:
+        windows = _windows(changed, len(regions), 0, 0)
+        candidates = {fp for fp, region in owned.items() if region in removed}
+    else:
+        windows = _windows(changed, len(regions), CONTEXT_BEFORE, CONTEXT_AFTER)
+        candidates = {fp for fp, region in owned.items() if region in removed}
+
+    extracted = _extract(item, regions, rows, windows) if changed else []
+    events = [event for event, _ in extracted]
+    new_owned = {event_fingerprint(event.get("summary"), to_utc(event.get("start_datetime"), timezone)): region
+                 for event, region in extracted}
+
+    counts = {"regions": len(regions), "changed": len(changed), "extracted": len(events), "created": 0,
+              "updated": 0, "unchanged": 0, "deleted": 0, "failed": 0}
+    calendar = services["calendar"]
+    index = get_calendar_index()
+    if events:
+        for result in upsert_calendar_events(calendar, item.calendar_id, events, timezone):
+            counts[result["action"] if result["ok"] else "failed"] += 1
+
+    gone = candidates - set(new_owned)
+    if gone:
+        if not events:
+            index.sync(calendar, item.calendar_id)
+        found = {fp: row["event_id"] for fp, row in ((fp, index.find(item.calendar_id, fp)) for fp in gone) if row}
+        results = delete_calendar_events_batch(calendar, item.calendar_id, list(found.values())) if found else []
+        failed = {fp for fp, result in zip(found, results) if not result["ok"]}
+        index.forget(item.calendar_id, [found[fp] for fp in found if fp not in failed])
+        counts["deleted"] = len(found) - len(failed)
+        counts["failed"] += len(failed)
+
+    if counts["failed"]:
+        # Without the new snapshot, the next poll sees the same changes and tries the failed writes again
+        # (the extraction is cached, and the events that were written come out unchanged).
+        return counts
+    state.save(item.key, version, regions, new_owned, sorted(gone))
+    return counts
+
+
+def watch(items: list, services: dict, timezone: str, interval: float = DEFAULT_INTERVAL_SECONDS,
+          once: bool = False, state: WatchState = None):
+    """Polls the items every interval seconds and syncs the ones that changed, until interrupted."""
+    state = state or WatchState()
+    print(f"👀 Watching {len(items)} source(s) every {interval:g}s. Press Ctrl+C to stop.")
+    while True:
+        for item in items:
+            try:
+                counts = sync_source(item, services, timezone, state)
+            except ExtractionError as e:
+                print(f"❌ {item.key}: could not analyze the changes, retrying next poll: {e}")
+                continue
+            except Exception as e:
+                print(f"❌ {item.key}: {e}")
+                continue
+            if counts is not None:
+                print(f"🔄 {item.key}: {counts['changed']}/{counts['regions']} region(s) changed, "
+                      f"{counts['extracted']} event(s) extracted; {counts['created']} created, "
+                      f"{counts['updated']} updated, {counts['unchanged']} unchanged, {counts['deleted']} deleted, "
+                      f"{counts['failed']} failed.")
+                if counts["failed"]:
+                    print(f"🔁 {item.key}: the failed changes are retried on the next poll.")
+        if once:
+            return
+        time.sleep(interval)
+
+
+def run_watcher(manifest_path: str, default_calendar_id: str = "primary",
+                interval: float = DEFAULT_INTERVAL_SECONDS, timezone: str = None, once: bool = False):
+    """Watches every source of the manifest (see batch_import.py for its format) until interrupted."""
+    try:
+        items = load_manifest(manifest_path, default_calendar_id)
+    except (OSError, ValueError) as e:
+        print(f"❌ Could not read the manifest: {e}")
+        return
+
+    services = get_google_services()
+    if not services:
+        return
+    try:
+        watch(items, services, timezone or get_localzone_name(), interval, once)
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching.")